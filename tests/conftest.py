@@ -0,0 +1,17 @@
+import glob
+import importlib.util
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='session')
+def dashboard():
+    """Mòdul del script del dashboard (el nom del fitxer no és un identificador importable)"""
+    path = glob.glob(os.path.join(ROOT, '*_tipus_storytelling.py'))[0]
+    spec = importlib.util.spec_from_file_location('dashboard', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
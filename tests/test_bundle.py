@@ -0,0 +1,38 @@
+"""Paquet estàtic: es conserven els actius de les últimes construccions i la resta s'esborren"""
+import json
+import os
+
+
+def figures(dashboard, version):
+    return [json.dumps({'data': [], 'layout': {'title': {'text': f'{graph_id} v{version}'}}})
+            for graph_id in dashboard.FIGURE_IDS]
+
+
+def graph1_files(manifest):
+    entry = manifest['files']['graph1.json']
+    return [entry['file']] + [f"{entry['file']}.{encoding}" for encoding in entry['encodings']]
+
+
+def test_prune_keeps_last_builds(dashboard, tmp_path):
+    (tmp_path / 'notes.txt').write_text('no és del paquet')
+    manifests = [dashboard.write_bundle(figures(dashboard, version), str(tmp_path), encodings=('gz',),
+                                        keep_builds=2)
+                 for version in range(3)]
+    names = set(os.listdir(tmp_path))
+    assert not set(graph1_files(manifests[0])) & names
+    assert set(graph1_files(manifests[1]) + graph1_files(manifests[2])) <= names
+    assert {'notes.txt', 'index.html', 'manifest.json', 'manifest.history.json'} <= names
+
+
+def test_identical_rebuild_keeps_previous_build(dashboard, tmp_path):
+    first = dashboard.write_bundle(figures(dashboard, 0), str(tmp_path), encodings=('gz',), keep_builds=2)
+    for _ in range(3):
+        dashboard.write_bundle(figures(dashboard, 1), str(tmp_path), encodings=('gz',), keep_builds=2)
+    assert set(graph1_files(first)) <= set(os.listdir(tmp_path))
+
+
+def test_bundle_without_history_keeps_previous_manifest(dashboard, tmp_path):
+    first = dashboard.write_bundle(figures(dashboard, 0), str(tmp_path), encodings=('gz',), keep_builds=2)
+    os.remove(tmp_path / 'manifest.history.json')
+    dashboard.write_bundle(figures(dashboard, 1), str(tmp_path), encodings=('gz',), keep_builds=2)
+    assert set(graph1_files(first)) <= set(os.listdir(tmp_path))
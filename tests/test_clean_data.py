@@ -0,0 +1,72 @@
+"""Paritat de clean_data() amb la neteja del notebook R (hotel_bookings.Rmd)"""
+import numpy as np
+import pandas as pd
+import pytest
+
+# Columnes: booking_id, adults, children, babies, adr, weekend, week, dia (arribada)
+RAW_ROWS = [
+    (0, 2, 0, 0, 100.0, 1, 2, '2016-07-06'),     # vàlida: work+rest
+    (1, 2, np.nan, 0, 80.0, 1, 2, '2016-07-06'),  # children NA: R genera una fila tota NA
+    (2, 2, 0, 0, 0.0, 1, 2, '2016-07-06'),       # adr = 0
+    (3, 2, 0, 0, 1000.0, 1, 2, '2016-07-06'),    # adr = 1000 (fora de [0, 1000))
+    (4, 10, 0, 0, 90.0, 1, 2, '2016-07-06'),     # adults = 10
+    (5, 2, 0, 0, 90.0, 0, 0, '2016-07-06'),      # cap nit
+    (6, 0, 0, 0, 90.0, 1, 2, '2016-07-06'),      # cap hoste
+    (7, 1, 0, 0, 60.0, 2, 1, '2016-07-01'),      # divendres amb week = 1: weekend
+    (8, 9, 4, 4, 999.99, 0, 3, '2016-07-06'),    # límits que es mantenen: work
+    (9, 2, 0, 0, 50.0, 2, 0, '2016-07-06'),      # sense nits entre setmana: weekend
+    (10, 2, 0, 0, 50.0, 3, 5, '2016-07-06'),     # package
+    (11, 2, 0, 0, 50.0, 4, 6, '2016-07-06'),     # rest
+]
+
+# Resultat del notebook R: booking_id → tipo (les files descartades no hi són)
+EXPECTED_TIPO = {0: 'work+rest', 7: 'weekend', 8: 'work', 9: 'weekend', 10: 'package', 11: 'rest'}
+
+
+def raw_frame():
+    rows = pd.DataFrame(RAW_ROWS, columns=['booking_id', 'adults', 'children', 'babies', 'adr',
+                                           'stays_in_weekend_nights', 'stays_in_week_nights', 'dia'])
+    dates = pd.to_datetime(rows.pop('dia'))
+    rows['arrival_date_year'] = dates.dt.year
+    rows['arrival_date_month'] = dates.dt.month_name()
+    rows['arrival_date_day_of_month'] = dates.dt.day
+    rows['hotel'] = 'City Hotel'
+    rows['is_canceled'] = 0
+    return rows
+
+
+def r_output(df_py):
+    """Sortida com la del notebook R: columna dia i una fila tota NA per a children NA"""
+    df_r = df_py.drop(columns=['arrival_date']).assign(dia=df_py['arrival_date'].dt.strftime('%Y-%m-%d'))
+    empty = pd.DataFrame([[np.nan] * len(df_r.columns)], columns=df_r.columns)
+    return pd.concat([df_r.iloc[:1], empty, df_r.iloc[1:]], ignore_index=True)
+
+
+def test_clean_data_matches_r_filters(dashboard):
+    df_py = dashboard.clean_data(raw_frame())
+
+    assert df_py['booking_id'].tolist() == sorted(EXPECTED_TIPO)
+    assert dict(zip(df_py['booking_id'], df_py['tipo'])) == EXPECTED_TIPO
+    assert df_py['children'].notna().all()
+    assert df_py['month_num'].eq(7).all()
+    assert df_py.loc[df_py['booking_id'] == 7, 'arrival_date'].dt.dayofweek.item() == 4
+
+
+def test_clean_parity_accepts_r_output(dashboard):
+    df_py = dashboard.clean_data(raw_frame())
+    assert dashboard.check_clean_parity(df_py, r_output(df_py)) == []
+
+
+@pytest.mark.parametrize('column, value', [('tipo', 'package'), ('adr', 1.0)])
+def test_clean_parity_flags_changed_row(dashboard, column, value):
+    df_py = dashboard.clean_data(raw_frame())
+    df_r = r_output(df_py)
+    df_r.loc[len(df_r) - 1, column] = value
+
+    assert dashboard.check_clean_parity(df_py, df_r) == [f"Columna {column}: 1 valors diferents"]
+
+
+def test_clean_parity_flags_missing_row(dashboard):
+    df_py = dashboard.clean_data(raw_frame())
+    differences = dashboard.check_clean_parity(df_py, r_output(df_py).iloc[:-1])
+    assert differences == [f"Nombre de files: Python {len(df_py)} vs R {len(df_py) - 1}"]
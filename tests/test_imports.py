@@ -0,0 +1,23 @@
+"""Importació mandrosa de les dependències pesades (lazy_import)"""
+import subprocess
+import sys
+
+
+def test_lazy_modules_are_the_real_modules(dashboard):
+    import pandas
+    assert dashboard.pd is sys.modules['pandas'] is pandas
+    assert dashboard.pd.__name__ == 'pandas'
+    assert dashboard.go.__spec__.name == 'plotly.graph_objects'
+    assert isinstance(dashboard.go.Figure(), dashboard.go.Figure)
+
+
+def test_importing_the_script_loads_no_heavy_dependency(dashboard):
+    code = ("import importlib.util, sys\n"
+            f"spec = importlib.util.spec_from_file_location('dashboard', {dashboard.__file__!r})\n"
+            "spec.loader.exec_module(importlib.util.module_from_spec(spec))\n"
+            f"heavy = {dashboard.HEAVY_IMPORTS!r}\n"
+            "loaded = [name for name, module in sys.modules.items() if name.split('.')[0] in heavy\n"
+            "          and type(module).__name__ != '_LazyModule']\n"
+            "print(','.join(loaded))\n")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ''
@@ -0,0 +1,96 @@
+"""Memoització: els arguments no es modifiquen i els encerts no tornen a executar la funció"""
+import os
+import pickle
+import stat
+
+import pandas as pd
+import pytest
+
+
+def bookings():
+    return pd.DataFrame({
+        'hotel': ['City Hotel', 'City Hotel', 'Resort Hotel'],
+        'arrival_date_year': [2016, 2016, 2017],
+        'arrival_date_month': ['July', 'July', 'March'],
+        'arrival_date_day_of_month': [1, 2, 15],
+        'is_canceled': [1, 0, 0],
+    })
+
+
+def test_hotel_day_table_does_not_mutate_input(dashboard):
+    df = bookings()
+    tbl = dashboard.create_tbl_cancel_rate_hotel_day(df)
+    assert 'arrival_date' not in df.columns
+    assert tbl['n_bookings'].tolist() == [1, 1, 1]
+    assert tbl['arrival_date'].dt.strftime('%Y-%m-%d').tolist() == ['2016-07-01', '2016-07-02', '2017-03-15']
+
+
+def test_memo_hit_on_equal_content(dashboard):
+    dashboard.configure_memo()
+    before = dashboard.memo_stats()
+    first = dashboard.create_tbl_cancel_rate_hotel_day(bookings())
+    second = dashboard.create_tbl_cancel_rate_hotel_day(bookings())
+    after = dashboard.memo_stats()
+    assert (after['misses'] - before['misses'], after['hits'] - before['hits']) == (1, 1)
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_memo_miss_on_changed_content(dashboard):
+    dashboard.configure_memo()
+    df = bookings()
+    dashboard.create_tbl_cancel_rate_hotel_day(df)
+    tbl = dashboard.create_tbl_cancel_rate_hotel_day(df.assign(is_canceled=0))
+    assert tbl['n_canceled'].sum() == 0
+
+
+def test_memo_miss_after_adding_a_column(dashboard):
+    dashboard.configure_memo()
+    df = bookings()
+    dashboard.create_tbl_cancel_rate_hotel_day(df)
+    dashboard.add_arrival_date(df)
+    before = dashboard.memo_stats()
+    dashboard.create_tbl_cancel_rate_hotel_day(df)
+    assert dashboard.memo_stats()['misses'] == before['misses'] + 1
+
+
+def test_memo_arguments_become_read_only(dashboard):
+    dashboard.configure_memo()
+    df = bookings()
+    dashboard.create_tbl_cancel_rate_hotel_day(df)
+    with pytest.raises(ValueError):
+        df.loc[0, 'is_canceled'] = 0
+
+
+def test_country_graph_does_not_mutate_tables(dashboard):
+    dashboard.configure_memo(enabled=False)
+    df = dashboard.add_origin_group(bookings().assign(country=['PRT', 'ESP', 'PRT']))
+    tbl_country = dashboard.create_tbl_cancel_rate_country(df, 1)
+    tbl_country_hotel = dashboard.create_tbl_country_hotel_cancel(df, 1)
+    columns = list(tbl_country.columns)
+    dashboard.create_graph3_country_cancel_rate(tbl_country, tbl_country_hotel)
+    assert list(tbl_country.columns) == columns
+    dashboard.configure_memo()
+
+
+def test_disk_cache_is_private_and_signed(dashboard, tmp_path):
+    cache_dir = tmp_path / 'memo'
+    dashboard.configure_memo(cache_dir=str(cache_dir))
+    dashboard.create_tbl_cancel_rate_hotel_day(bookings())
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
+    for path in cache_dir.glob('*.pkl'):
+        path.write_bytes(b'\0' * 32 + pickle.dumps(('object', 'no signat')))
+    dashboard.configure_memo(cache_dir=str(cache_dir))
+    before = dashboard.memo_stats()
+    tbl = dashboard.create_tbl_cancel_rate_hotel_day(bookings())
+    assert dashboard.memo_stats()['misses'] == before['misses'] + 1
+    assert tbl['n_bookings'].tolist() == [1, 1, 1]
+    dashboard.configure_memo()
+
+
+def test_disk_cache_is_bounded(dashboard, tmp_path):
+    cache_dir = tmp_path / 'memo'
+    dashboard.configure_memo(cache_dir=str(cache_dir), disk_max_bytes=4096)
+    for year in range(2000, 2010):
+        dashboard.create_tbl_cancel_rate_hotel_day(bookings().assign(arrival_date_year=year))
+    assert sum(path.stat().st_size for path in cache_dir.glob('*.pkl')) <= 4096
+    dashboard.configure_memo()
@@ -0,0 +1,61 @@
+"""Precisió de l'exportació: _quantize_values no canvia el text que mostren els formats d3"""
+import numpy as np
+import pytest
+
+# Sortida de (x).toFixed(1) a JavaScript: els valors x.x5 no sempre arrodoneixen cap amunt,
+# perquè el valor binari pot quedar per sota de la meitat
+TO_FIXED_1 = {0.15: '0.1', 0.25: '0.3', 0.35: '0.3', 0.45: '0.5', 1.25: '1.3', 2.05: '2.0', 46.15: '46.1',
+              12.45: '12.4'}
+
+
+def test_fixed_boundaries_match_javascript(dashboard):
+    quantized = dashboard._quantize_values(list(TO_FIXED_1), {'.1f'}, False)
+    assert [f'{v:.1f}' for v in quantized] == list(TO_FIXED_1.values())
+    assert [str(dashboard._d3_display(v, '.1f')) for v in TO_FIXED_1] == list(TO_FIXED_1.values())
+
+
+def test_percent_format(dashboard):
+    # (x * 100).toFixed(1): 12.3%, 0.1%, 12.3%
+    assert dashboard._quantize_values([0.12345, 0.0005, 0.1235], {'.1%'}, False) == [0.123, 0.001, 0.123]
+
+
+def test_integral_floats_become_ints(dashboard):
+    quantized = dashboard._quantize_values([1.0, 2.0, None, 3.0], None, False)
+    assert quantized == [1, 2, None, 3]
+    assert all(isinstance(v, int) for v in quantized if v is not None)
+
+
+@pytest.mark.parametrize('formats', [None, {'.1f', None}])
+def test_unformatted_fields_are_left_alone(dashboard, formats):
+    assert dashboard._quantize_values([0.123456, 0.5], formats, False) is None
+
+
+def test_non_numeric_values_are_left_alone(dashboard):
+    assert dashboard._quantize_values(['a', 'b'], {'.1f'}, False) is None
+
+
+def test_visual_fields_keep_resolution(dashboard):
+    values = [1.23456789, 2.5, 100.0]
+    quantized = dashboard._quantize_values(values, None, True)
+    span = max(values) - min(values)
+    assert np.allclose(quantized, values, rtol=0, atol=span * dashboard.QUANTIZE_RESOLUTION)
+
+
+@pytest.mark.parametrize('fmt', ['.1f', '.2f', '.1%', '.2g', '.3s'])
+def test_displayed_text_unchanged(dashboard, fmt):
+    rng = np.random.default_rng(11)
+    values = np.concatenate([rng.uniform(0, 100, 500), rng.uniform(0, 1, 500),
+                             np.round(rng.uniform(0, 100, 500), 2)]).tolist()
+    quantized = dashboard._quantize_values(values, {fmt}, False)
+    assert [dashboard._d3_display(v, fmt) for v in quantized] == [dashboard._d3_display(v, fmt) for v in values]
+
+
+def test_export_returns_stats_without_printing(dashboard, capsys):
+    figures = [dashboard.go.Figure(dashboard.go.Scatter(x=[0.123456, 1.0], y=[2.0, 3.0]),
+                                   layout={'template': 'plotly_white'}) for _ in range(2)]
+    figures_json, template_json, stats = dashboard.export_figures_json(figures)
+    assert capsys.readouterr().out == ''
+    assert len(figures_json) == 2 and template_json is not None
+    assert [graph_id for graph_id, _, _ in stats['quantize']] == dashboard.FIGURE_IDS[:2]
+    assert all(after <= before for _, before, after in stats['quantize'])
+    assert stats['template']['n_shared'] == 2
@@ -0,0 +1,54 @@
+"""Dimoni de renderització: socket privat i reinici sense matar processos aliens"""
+import os
+import stat
+import subprocess
+import sys
+import time
+
+import pytest
+
+
+@pytest.fixture
+def socket_path(dashboard, tmp_path):
+    path = str(tmp_path / 'run' / dashboard.RENDERER_SOCKET_NAME)
+    yield path
+    process = dashboard._RENDERER_PROCESSES.pop(path, None)
+    if process is not None:
+        process.terminate()
+        process.wait()
+
+
+def test_daemon_socket_is_private(dashboard, socket_path):
+    header = dashboard.start_renderer(socket_path)
+    assert header['ok']
+    assert stat.S_IMODE(os.stat(os.path.dirname(socket_path)).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+
+
+def test_restart_terminates_own_process(dashboard, socket_path):
+    dashboard.start_renderer(socket_path)
+    process = dashboard._RENDERER_PROCESSES[socket_path]
+    header = dashboard.restart_renderer(socket_path)
+    assert process.poll() is not None
+    assert dashboard._RENDERER_PROCESSES[socket_path].pid == header['pid']
+
+
+def test_restart_asks_foreign_daemon_to_shut_down(dashboard, socket_path):
+    foreign = subprocess.Popen([sys.executable, dashboard.__file__, '--renderer-daemon',
+                                '--renderer-socket', socket_path], stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                header = dashboard.renderer_status(socket_path)
+                break
+            except OSError:
+                assert time.monotonic() < deadline and foreign.poll() is None
+                time.sleep(0.2)
+        assert header['pid'] == foreign.pid
+        dashboard.restart_renderer(socket_path)
+        assert foreign.wait(timeout=10) == 0
+    finally:
+        if foreign.poll() is None:
+            foreign.terminate()
+            foreign.wait()
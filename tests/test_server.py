@@ -0,0 +1,92 @@
+"""Servidor local: gràfics sota demanda, ETags i peticions simultànies"""
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def bookings(dashboard, n=600, seed=1):
+    rng = np.random.default_rng(seed)
+    return dashboard.add_origin_group(pd.DataFrame({
+        'hotel': rng.choice(['City Hotel', 'Resort Hotel'], n),
+        'arrival_date_year': rng.choice([2015, 2016], n),
+        'arrival_date_month': rng.choice(['July', 'August'], n),
+        'arrival_date_day_of_month': rng.integers(1, 29, n),
+        'country': rng.choice(['PRT', 'ESP', 'FRA'], n),
+        'is_canceled': rng.integers(0, 2, n),
+        'deposit_type': rng.choice(['No Deposit', 'Non Refund'], n),
+        'booking_changes': rng.integers(0, 4, n),
+        'lead_time': rng.integers(0, 300, n),
+    }))
+
+
+@pytest.fixture(scope='module')
+def server(dashboard):
+    df = bookings(dashboard)
+    cube = dashboard.build_booking_cube(df)
+    all_tables = dashboard.create_tables_from_cube(cube, min_bookings=10)
+    handler = dashboard.make_dashboard_handler(df, all_tables[:4], 'year', all_tables[5], cube, min_bookings=10)
+    handler.log_message = lambda *args: None
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+
+
+def get(url, if_none_match=None):
+    request = urllib.request.Request(url, headers={'If-None-Match': if_none_match} if if_none_match else {})
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, response.headers.get('ETag'), response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get('ETag'), b''
+
+
+def test_concurrent_requests_get_consistent_figures(dashboard, server):
+    urls = [f'{server}/api/figures/{graph_id}.json' + query
+            for graph_id in dashboard.FIGURE_IDS for query in ('', '?hotel=City Hotel'.replace(' ', '%20'))] * 3
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(get, urls))
+    assert all(status == 200 for status, _, _ in results)
+    etags = {}
+    for url, (_, etag, _) in zip(urls, results):
+        assert etags.setdefault(url, etag) == etag
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('{etag}', 304),
+    ('W/{etag}', 304),
+    ('"other", {etag}', 304),
+    ('*', 304),
+    ('"other"', 200),
+])
+def test_if_none_match(server, header, expected):
+    url = f'{server}/api/figures/graph1.json'
+    _, etag, _ = get(url)
+    assert get(url, header.format(etag=etag))[0] == expected
+
+
+def test_etag_matches(dashboard):
+    assert dashboard.etag_matches('W/"a", "b"', '"a"')
+    assert not dashboard.etag_matches(None, '"a"')
+    assert not dashboard.etag_matches('"ab"', '"a"')
+
+
+def test_stream_batch_publishes_new_version(dashboard):
+    df = bookings(dashboard)
+    cube = dashboard.build_booking_cube(df)
+    all_tables = dashboard.create_tables_from_cube(cube, min_bookings=10)
+    hub = dashboard.make_stream_hub()
+    handler = dashboard.make_dashboard_handler(None, all_tables[:4], 'year', all_tables[5], cube, min_bookings=10,
+                                               stream=hub)
+    client = dashboard.stream_subscribe(hub)
+    handler.apply_stream_batch(bookings(dashboard, n=50, seed=2))
+    messages = dict(dashboard.stream_next(client, timeout=0))
+    assert 'graph1' in messages
+    assert b'City Hotel' in messages['graph1'][1]
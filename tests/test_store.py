@@ -0,0 +1,38 @@
+"""Magatzem columnar: els kernels de recompte coincideixen amb groupby"""
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture(scope='module')
+def store(dashboard, tmp_path_factory):
+    rng = np.random.default_rng(9)
+    n = 3000
+    df = pd.DataFrame({
+        'hotel': rng.choice(['City Hotel', 'Resort Hotel'], n),
+        'is_canceled': rng.integers(0, 2, n),
+        'lead_time': rng.integers(0, 400, n),
+        'arrival_date_year': rng.choice([2015, 2016, 2017], n),
+        'arrival_date_month': rng.choice(['July', 'August'], n),
+        'arrival_date_day_of_month': rng.integers(1, 29, n),
+        'country': rng.choice(['PRT', 'ESP', 'FRA', None], n),
+        'deposit_type': rng.choice(['No Deposit', 'Non Refund'], n),
+        'booking_changes': rng.integers(0, 6, n),
+    })
+    df = dashboard.add_origin_group(df)
+    store_dir = str(tmp_path_factory.mktemp('store'))
+    dashboard.build_columnar_store(df, store_dir)
+    return df, dashboard.load_columnar_store(store_dir)
+
+
+@pytest.mark.parametrize('by, dropna', [
+    (['hotel', 'arrival_date_year'], True),
+    (['country', 'hotel', 'lead_time', 'arrival_date_day_of_month'], True),
+    (['country', 'origin_group'], False),
+])
+def test_group_counts_match_groupby(dashboard, store, by, dropna):
+    df, columns = store
+    expected = df.groupby(by, dropna=dropna)['is_canceled'].agg(['count', 'sum']).reset_index()
+    expected.columns = by + ['n_bookings', 'n_canceled']
+    actual = dashboard.store_group_counts(columns, by, dropna=dropna)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
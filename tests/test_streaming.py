@@ -0,0 +1,53 @@
+"""Mode streaming: el productor i el seguidor del feed, i la cua de missatges dels clients"""
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def bookings():
+    rng = np.random.default_rng(5)
+    n = 200
+    return pd.DataFrame({
+        'hotel': rng.choice(['City Hotel', 'Resort Hotel'], n),
+        'arrival_date_year': rng.choice([2015, 2016], n),
+        'country': rng.choice(['PRT', 'ESP', 'FRA'], n),
+        'is_canceled': rng.integers(0, 2, n),
+        'lead_time': rng.integers(0, 300, n),
+    })
+
+
+@pytest.mark.parametrize('file_name', ['feed.jsonl', 'feed.csv'])
+def test_follow_feed_receives_every_produced_row(dashboard, tmp_path, file_name):
+    path = str(tmp_path / file_name)
+    batches = []
+    stop_event = threading.Event()
+    follower = threading.Thread(target=dashboard.follow_booking_feed,
+                                args=(path, batches.append, stop_event),
+                                kwargs={'poll_seconds': 0.02, 'max_latency': 0.05, 'batch_rows': 25})
+    follower.start()
+    try:
+        dashboard.run_stream_producer(dashboard.add_origin_group(bookings()), path, rate=500, limit=60)
+        deadline = time.monotonic() + 5
+        while sum(map(len, batches)) < 60 and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        stop_event.set()
+        follower.join()
+
+    received = pd.concat(batches, ignore_index=True)
+    assert len(received) == 60
+    assert set(received['origin_group']) <= {'Local (PRT)', 'International'}
+    assert (received['origin_group'] == 'Local (PRT)').eq(received['country'] == 'PRT').all()
+
+
+def test_publish_counts_replaced_messages(dashboard):
+    hub = dashboard.make_stream_hub()
+    client = dashboard.stream_subscribe(hub)
+    assert dashboard.stream_publish(hub, {'graph1': b'v1', 'graph2': b'v1'}) == 0
+    assert dashboard.stream_publish(hub, {'graph1': b'v2'}) == 1
+    messages = dict(dashboard.stream_next(client, timeout=0))
+    assert messages['graph1'] == (2, b'v2')
+    assert dashboard.stream_publish(hub, {'graph1': b'v3'}) == 0
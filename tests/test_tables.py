@@ -0,0 +1,85 @@
+"""TAULES 1-9: les marginals del cub coincideixen amb l'agregació directa amb pandas"""
+import numpy as np
+import pandas as pd
+import pytest
+
+MIN_BOOKINGS = 40
+
+
+@pytest.fixture(scope='module')
+def bookings(dashboard):
+    rng = np.random.default_rng(7)
+    n = 2000
+    df = pd.DataFrame({
+        'hotel': rng.choice(['City Hotel', 'Resort Hotel'], n),
+        'arrival_date_year': rng.choice([2015, 2016, 2017], n),
+        'country': rng.choice(['PRT', 'ESP', 'FRA', 'DEU', 'GBR', 'AGO', 'CHE'], n,
+                              p=[0.4, 0.2, 0.15, 0.1, 0.1, 0.04, 0.01]),
+        'is_canceled': rng.integers(0, 2, n),
+        'deposit_type': rng.choice(['No Deposit', 'Non Refund'], n),
+        'booking_changes': rng.integers(0, 7, n),
+        'lead_time': rng.integers(0, 400, n),
+    })
+    return dashboard.add_origin_group(df)
+
+
+def counts(df, by):
+    tbl = df.groupby(by)['is_canceled'].agg(['count', 'sum']).reset_index()
+    tbl.columns = by + ['n_bookings', 'n_canceled']
+    tbl['cancel_rate'] = tbl['n_canceled'] / tbl['n_bookings']
+    tbl['cancel_rate_pct'] = tbl['cancel_rate'] * 100
+    return tbl
+
+
+def reference_tables(df):
+    """TAULES 1-6 calculades directament amb groupby"""
+    country_counts = df.groupby('country').size()
+    df_valid = df[df['country'].isin(country_counts[country_counts >= MIN_BOOKINGS].index)]
+    flow = df.groupby(['origin_group', 'hotel', 'is_canceled']).size().reset_index(name='count')
+    flow['status'] = np.where(flow['is_canceled'] == 1, 'Cancel·lada', 'No cancel·lada')
+    return [
+        df.groupby(['hotel', 'arrival_date_year']).size().reset_index(name='n_bookings'),
+        counts(df, ['hotel', 'arrival_date_year']),
+        counts(df_valid, ['country']).sort_values('cancel_rate_pct', ascending=False),
+        counts(df_valid, ['country', 'hotel']),
+        counts(df, ['origin_group', 'hotel']),
+        flow,
+    ]
+
+
+@pytest.fixture(scope='module')
+def cube_tables(dashboard, bookings):
+    return dashboard.create_tables_from_cube(dashboard.build_booking_cube(bookings), MIN_BOOKINGS)
+
+
+@pytest.mark.parametrize('index', range(6))
+def test_cube_tables_match_groupby(bookings, cube_tables, index):
+    expected = reference_tables(bookings)[index].reset_index(drop=True)
+    pd.testing.assert_frame_equal(cube_tables[index].reset_index(drop=True), expected, check_dtype=False)
+
+
+def test_create_tbl_functions_are_cube_marginals(dashboard, bookings, cube_tables):
+    tables = [
+        dashboard.create_tbl_volume_hotel_year(bookings),
+        dashboard.create_tbl_cancel_rate_hotel_year(bookings),
+        dashboard.create_tbl_cancel_rate_country(bookings, MIN_BOOKINGS),
+        dashboard.create_tbl_country_hotel_cancel(bookings, MIN_BOOKINGS),
+        dashboard.create_tbl_origin_hotel_cancel(bookings),
+        dashboard.create_tbl_sankey_flow(bookings),
+    ]
+    for actual, expected in zip(tables, cube_tables):
+        pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+def test_count_tables_match_groupby(dashboard, bookings):
+    changes = bookings.assign(changes_cat=dashboard.bucket_booking_changes(bookings['booking_changes']))
+    expected = changes.groupby(['origin_group', 'changes_cat']).size().reset_index(name='count')
+    pd.testing.assert_frame_equal(dashboard.create_tbl_booking_changes(bookings), expected, check_dtype=False)
+    expected = bookings.groupby(['origin_group', 'deposit_type']).size().reset_index(name='count')
+    pd.testing.assert_frame_equal(dashboard.create_tbl_deposit_type(bookings), expected, check_dtype=False)
+
+
+def test_country_filter_drops_small_countries(cube_tables):
+    tbl_country = cube_tables[2]
+    assert (tbl_country['n_bookings'] >= MIN_BOOKINGS).all()
+    assert 'CHE' not in set(tbl_country['country'])
@@ -0,0 +1,71 @@
+"""Nodes del treemap (TAULA 10): els nodes agregats porten l'interval del mode aproximat"""
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def approx_country_table(dashboard):
+    rng = np.random.default_rng(3)
+    n = 5000
+    df = pd.DataFrame({
+        'hotel': rng.choice(['City Hotel', 'Resort Hotel'], n),
+        'arrival_date_year': 2016,
+        'country': rng.choice(['PRT', 'ESP', 'FRA', 'DEU', 'USA', 'BRA', 'CHN'], n),
+        'is_canceled': rng.integers(0, 2, n),
+        'deposit_type': 'No Deposit',
+        'booking_changes': 0,
+        'lead_time': rng.integers(0, 300, n),
+    })
+    df = dashboard.add_origin_group(df)
+    positions, weights = dashboard.stratified_sample(df, 0.2)
+    all_tables, _ = dashboard.create_tables_approx(df.iloc[positions].reset_index(drop=True), weights,
+                                                   min_bookings=10)
+    return all_tables[2]
+
+
+def test_approx_parent_and_other_nodes_have_interval(dashboard):
+    tbl_nodes = dashboard.create_tbl_treemap_nodes(approx_country_table(dashboard), max_nodes=6, hierarchy=True)
+    aggregated = tbl_nodes[~tbl_nodes['is_leaf'] | (tbl_nodes['label'] == dashboard.TREEMAP_OTHER_LABEL)]
+    assert (~tbl_nodes['is_leaf']).any()
+    assert (tbl_nodes['label'] == dashboard.TREEMAP_OTHER_LABEL).any()
+    assert aggregated[['ci_low_pct', 'ci_high_pct']].notna().all().all()
+    assert ((aggregated['ci_low_pct'] <= aggregated['cancel_rate_pct'])
+            & (aggregated['cancel_rate_pct'] <= aggregated['ci_high_pct'])).all()
+
+
+def test_parent_counts_sum_leaves(dashboard):
+    tbl_nodes = dashboard.create_tbl_treemap_nodes(approx_country_table(dashboard), hierarchy=True)
+    leaves = tbl_nodes[tbl_nodes['is_leaf']].groupby('parent')['n_bookings'].sum()
+    parents = tbl_nodes[~tbl_nodes['is_leaf']].set_index('label')['n_bookings']
+    pd.testing.assert_series_equal(parents.sort_index(), leaves.sort_index(), check_names=False)
+
+
+def many_countries_table(dashboard, n=60):
+    countries = sorted(dashboard.COUNTRY_CONTINENT)[:n]
+    n_bookings = np.arange(len(countries), 0, -1) * 100
+    tbl = pd.DataFrame({'country': countries, 'n_bookings': n_bookings, 'n_canceled': n_bookings // 3})
+    tbl['cancel_rate'] = tbl['n_canceled'] / tbl['n_bookings']
+    tbl['cancel_rate_pct'] = tbl['cancel_rate'] * 100
+    return tbl
+
+
+@pytest.mark.parametrize('hierarchy', [False, True])
+@pytest.mark.parametrize('max_nodes', [15, 20, 40])
+def test_node_budget_counts_every_node(dashboard, hierarchy, max_nodes):
+    tbl_country = many_countries_table(dashboard)
+    tbl_nodes = dashboard.create_tbl_treemap_nodes(tbl_country, max_nodes=max_nodes, hierarchy=hierarchy)
+    assert len(tbl_nodes) <= max_nodes
+    assert tbl_nodes.loc[tbl_nodes['is_leaf'], 'n_bookings'].sum() == tbl_country['n_bookings'].sum()
+    # Un node "Altres" agrupa sempre dues fulles o més
+    other = tbl_nodes[tbl_nodes['label'] == dashboard.TREEMAP_OTHER_LABEL]
+    kept = tbl_nodes[tbl_nodes['is_leaf'] & (tbl_nodes['label'] != dashboard.TREEMAP_OTHER_LABEL)]
+    folded = tbl_country[~tbl_country['country'].isin(kept['label'])]
+    assert len(folded) >= 2 * len(other)
+
+
+def test_no_fold_of_a_single_leaf(dashboard):
+    tbl_country = many_countries_table(dashboard, n=11)
+    tbl_nodes = dashboard.create_tbl_treemap_nodes(tbl_country, max_nodes=10)
+    assert len(tbl_nodes) == 10
+    assert (tbl_nodes['label'] == dashboard.TREEMAP_OTHER_LABEL).sum() == 1
+    assert tbl_nodes['is_leaf'].all()
@@ -15,18 +15,66 @@ VERSIÓ 3: Navegació millorada (generada a partir de V2)
 - Transicions suaus i hover effects
 """
 
-import pandas as pd
-import numpy as np
-import plotly.graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
-from plotly.offline import plot
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
 import os
+import re
+import io
+import json
+import argparse
+import base64
+import asyncio
+import hashlib
+import hmac
+import functools
+import importlib
+import importlib.machinery
+import importlib.util
+import gzip
+import inspect
+import pathlib
+import pickle
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from decimal import Decimal, Context, ROUND_HALF_UP
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from urllib.parse import parse_qs
+
+# Dependències pesades: s'importen el primer cop que se'n fa servir un atribut, de manera que
+# els modes que no les necessiten (dimoni de renderització, --renderer-status,
+# --import-benchmark) no les carreguen. reportlab s'importa a export_to_pdf i http.server
+# al mode servidor.
+def lazy_import(name):
+    """
+    Mòdul registrat a sys.modules amb importlib.util.LazyLoader: el codi del mòdul s'executa
+    quan se'n llegeix el primer atribut (i el del paquet pare, quan ho necessita el submòdul)
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    parent = name.rpartition('.')[0]
+    if parent:
+        # El __spec__ del pare es llegeix sense passar pel mòdul mandrós (que l'executaria)
+        search_path = object.__getattribute__(lazy_import(parent), '__spec__').submodule_search_locations
+        spec = importlib.machinery.PathFinder.find_spec(name, search_path)
+    else:
+        spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+go = lazy_import('plotly.graph_objects')
+pio = lazy_import('plotly.io')
 
 # ============================================================================
 # CONFIGURACIÓ I CONSTANTS
@@ -42,342 +90,1644 @@ COLORS = {
     'not_canceled': '#2980B9'    # Fred
 }
 
+# ============================================================================
+# MEMOITZACIÓ DE TAULES I GRÀFICS
+# ============================================================================
+
+# Les funcions de taules (build_booking_cube, create_tbl_*) i de gràfics (create_graph*)
+# es memoitzen amb una clau que combina el nom de la funció, una empremta del contingut dels arguments (no la identitat dels objectes)
+# i una empremta del propi script, perquè un canvi de codi invalidi la cache de disc.
+# Els resultats es guarden serialitzats: cada encert retorna una còpia nova, de manera que
+# modificar una taula o un gràfic retornat no altera la cache.
+# - Memòria: LRU limitada en bytes (MEMO_MAX_BYTES, --memo-mb)
+# - Disc (opcional, --memo-dir): un fitxer per clau, compartit entre execucions i processos,
+#   LRU limitada en bytes (MEMO_DISK_MAX_BYTES, --memo-disk-mb). Els fitxers es desfan amb
+#   pickle: el directori ha de ser privat (0700) i cada fitxer porta una signatura HMAC amb
+#   una clau aleatòria del directori (0600); un fitxer sense signatura vàlida és un error de cache
+MEMO_MAX_BYTES = 256 * 1024 ** 2
+MEMO_DISK_MAX_BYTES = 1024 ** 3
+MEMO_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+                              'hotel_storytelling', 'memo')
+
+_MEMO = {
+    'enabled': True,
+    'max_bytes': MEMO_MAX_BYTES,
+    'dir': None,
+    'disk_max_bytes': MEMO_DISK_MAX_BYTES,
+    'key': None,
+    'entries': OrderedDict(),  # clau → bytes serialitzats (ordre LRU)
+    'bytes': 0,
+    'hits': 0,
+    'misses': 0
+}
+_MEMO_LOCK = threading.Lock()
+_MEMO_DIGESTS = {}  # id(objecte) → (weakref, capçalera, índex, arrays, empremta del contingut)
+
+with open(__file__, 'rb') as _script:
+    _MEMO_CODE_HASH = hashlib.blake2b(_script.read(), digest_size=16).digest()
+
+def private_dir(path):
+    """
+    Crea path amb permisos 0700 i comprova que és de l'usuari actual
+    Un directori propi amb permisos més oberts es torna a restringir; un d'un altre usuari és un error
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if hasattr(os, 'getuid'):
+        info = os.stat(path)
+        if info.st_uid != os.getuid():
+            raise PermissionError(f"{path} és d'un altre usuari")
+        if info.st_mode & 0o077:
+            os.chmod(path, 0o700)
+    return path
+
+def _memo_dir_key(cache_dir):
+    """Clau HMAC de la cache de disc (es crea el primer cop, atòmicament, amb permisos 0600)"""
+    key_path = os.path.join(private_dir(cache_dir), '.memo-key')
+    if not os.path.exists(key_path):
+        tmp_path = f"{key_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(32))
+        try:
+            os.link(tmp_path, key_path)  # si un altre procés ja l'ha creada, es conserva la seva
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+    with open(key_path, 'rb') as f:
+        return f.read()
+
+def configure_memo(enabled=True, max_bytes=MEMO_MAX_BYTES, cache_dir=None, disk_max_bytes=MEMO_DISK_MAX_BYTES):
+    """Activa/desactiva la memoització i en fixa les mides màximes i el directori de disc"""
+    key = _memo_dir_key(cache_dir) if cache_dir else None
+    with _MEMO_LOCK:
+        _MEMO.update(enabled=enabled, max_bytes=max_bytes, dir=cache_dir, disk_max_bytes=disk_max_bytes, key=key)
+        _MEMO['entries'].clear()
+        _MEMO['bytes'] = 0
+
+def memo_config():
+    """Configuració actual (per passar-la als processos del pool)"""
+    return {'enabled': _MEMO['enabled'], 'max_bytes': _MEMO['max_bytes'], 'cache_dir': _MEMO['dir'],
+            'disk_max_bytes': _MEMO['disk_max_bytes']}
+
+def memo_stats():
+    """Encerts, càlculs i bytes ocupats a memòria"""
+    return {'hits': _MEMO['hits'], 'misses': _MEMO['misses'], 'bytes': _MEMO['bytes']}
+
+def _content_digest(value):
+    """Empremta del contingut d'un DataFrame, Series o array (sense copiar-lo)"""
+    h = hashlib.blake2b(digest_size=20)
+    if isinstance(value, np.ndarray):
+        h.update(np.ascontiguousarray(value).tobytes())
+    else:
+        h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    return h.digest()
+
+def _readonly_buffers(value):
+    """
+    Arrays numpy que guarden les dades de value, marcats de només lectura perquè una escriptura
+    in situ falli en lloc de deixar obsoleta l'empremta recordada
+    None si algun bloc no es pot bloquejar (p. ex. columnes Arrow): aleshores no es recorda
+    """
+    blocks = [value] if isinstance(value, np.ndarray) else [blk.values for blk in value._mgr.blocks]
+    buffers = []
+    for values in blocks:
+        if isinstance(values, np.ndarray):
+            found = [values]
+        else:
+            # Arrays d'extensió amb dades numpy (text, categories, dates, enters amb nuls)
+            found = [getattr(values, attr) for attr in ('_ndarray', '_data', '_mask')
+                     if isinstance(getattr(values, attr, None), np.ndarray)]
+        if not found:
+            return None
+        buffers += found
+    for buffer in buffers:
+        buffer.flags.writeable = False
+    return buffers
+
+def _cached_digest(value, header):
+    """
+    _content_digest recordada per objecte (mentre l'objecte és viu)
+    Les dades de l'objecte es bloquegen (només lectura); el header (columnes, dtypes, forma),
+    l'índex i els arrays que el sostenen invaliden l'entrada si se'n canvien columnes
+    """
+    buffers = _readonly_buffers(value)
+    if buffers is None:
+        return _content_digest(value)
+    index = getattr(value, 'index', None)
+    key = id(value)
+    with _MEMO_LOCK:
+        cached = _MEMO_DIGESTS.get(key)
+    if (cached is not None and cached[0]() is value and cached[1] == header and cached[2] is index
+            and len(cached[3]) == len(buffers) and all(a is b for a, b in zip(cached[3], buffers))):
+        return cached[4]
+    digest = _content_digest(value)
+    ref = weakref.ref(value, lambda _, key=key: _MEMO_DIGESTS.pop(key, None))
+    with _MEMO_LOCK:
+        _MEMO_DIGESTS[key] = (ref, header, index, buffers, digest)
+    return digest
+
+def _update_fingerprint(h, value):
+    """Afegeix a h una empremta del contingut de value (DataFrames i arrays sense copiar-los)"""
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+        if isinstance(value, pd.DataFrame):
+            header = repr((type(value).__name__, value.shape, list(value.columns), [str(t) for t in value.dtypes]))
+        elif isinstance(value, pd.Series):
+            header = repr((type(value).__name__, value.shape, value.name, str(value.dtype)))
+        else:
+            header = repr(('ndarray', value.dtype.str, value.shape))
+        h.update(header.encode())
+        h.update(_cached_digest(value, header))
+    elif isinstance(value, dict):
+        h.update(b'{')
+        for key in sorted(value, key=repr):
+            _update_fingerprint(h, key)
+            _update_fingerprint(h, value[key])
+        h.update(b'}')
+    elif isinstance(value, (list, tuple)):
+        h.update(b'[')
+        for item in value:
+            _update_fingerprint(h, item)
+        h.update(b']')
+    else:
+        h.update(repr(value).encode())
+    h.update(b';')
+
+def _memo_key(func, bound_arguments):
+    h = hashlib.blake2b(_MEMO_CODE_HASH, digest_size=20)
+    h.update(func.__qualname__.encode())
+    _update_fingerprint(h, bound_arguments)
+    return h.hexdigest()
+
+def _memo_get(key):
+    with _MEMO_LOCK:
+        payload = _MEMO['entries'].get(key)
+        if payload is not None:
+            _MEMO['entries'].move_to_end(key)
+            return payload
+    if _MEMO['dir']:
+        path = os.path.join(_MEMO['dir'], key + '.pkl')
+        try:
+            with open(path, 'rb') as f:
+                signature, payload = f.read(32), f.read()
+        except FileNotFoundError:
+            return None
+        if not hmac.compare_digest(signature, _memo_signature(payload)):
+            return None
+        try:
+            os.utime(path)  # ordre LRU de la cache de disc
+        except FileNotFoundError:
+            pass
+        _memo_put(key, payload, write_disk=False)
+    return payload
+
+def _memo_signature(payload):
+    return hmac.new(_MEMO['key'], payload, hashlib.sha256).digest()
+
+def _evict_memo_dir():
+    """Esborra els fitxers menys usats fins que la cache de disc no passa de disk_max_bytes"""
+    files = []
+    with os.scandir(_MEMO['dir']) as entries:
+        for entry in entries:
+            if entry.name.endswith('.pkl'):
+                try:
+                    info = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((info.st_mtime, info.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= _MEMO['disk_max_bytes']:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def _memo_put(key, payload, write_disk=True):
+    with _MEMO_LOCK:
+        if key not in _MEMO['entries'] and len(payload) <= _MEMO['max_bytes']:
+            _MEMO['entries'][key] = payload
+            _MEMO['bytes'] += len(payload)
+            while _MEMO['bytes'] > _MEMO['max_bytes']:
+                _, evicted = _MEMO['entries'].popitem(last=False)
+                _MEMO['bytes'] -= len(evicted)
+    if write_disk and _MEMO['dir']:
+        # Escriptura atòmica: altres processos només veuen fitxers complets
+        path = os.path.join(_MEMO['dir'], key + '.pkl')
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+            f.write(_memo_signature(payload))
+            f.write(payload)
+        os.replace(tmp_path, path)
+        _evict_memo_dir()
+
+def _memo_dumps(result):
+    # Els gràfics es guarden com a dict: reconstruir-los sense validar és molt més ràpid
+    # que desfer el pickle d'una go.Figure (que torna a validar totes les propietats)
+    if isinstance(result, go.Figure):
+        return pickle.dumps(('figure', result.to_plotly_json()), protocol=pickle.HIGHEST_PROTOCOL)
+    return pickle.dumps(('object', result), protocol=pickle.HIGHEST_PROTOCOL)
+
+def _memo_loads(payload):
+    kind, value = pickle.loads(payload)
+    return go.Figure(value, _validate=False) if kind == 'figure' else value
+
+def memoized(func):
+    """
+    Decorador: memoitza func per contingut dels arguments (LRU en memòria + disc opcional)
+    func no ha de modificar els arguments: en un encert no s'executa (les dades dels
+    DataFrames i arrays passats queden de només lectura)
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _MEMO['enabled']:
+            return func(*args, **kwargs)
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = _memo_key(func, bound.arguments)
+        payload = _memo_get(key)
+        with _MEMO_LOCK:
+            _MEMO['hits' if payload is not None else 'misses'] += 1
+        if payload is not None:
+            return _memo_loads(payload)
+        result = func(*args, **kwargs)
+        _memo_put(key, _memo_dumps(result))
+        return result
+    return wrapper
+
 # ============================================================================
 # FASE 1: NETEGA DE DADES
 # ============================================================================
 
-# NOTA: La funció clean_data() s'ha eliminat perquè la neteja de dades
-# es fa al notebook R (hotel_bookings.Rmd) - Component 1 de la PAC.
+# NOTA: La neteja de referència es fa al notebook R (hotel_bookings.Rmd) - Component 1 de la PAC.
 # Les dades netes es generen allà i es guarden a hotel_bookings_clean.csv.
-# Això assegura consistència entre l'EDA i la visualització final.
+# clean_data() reprodueix els mateixos filtres en Python (vectoritzats) perquè el refresc
+# del dashboard es pugui fer en un sol procés i amb una sola lectura del CSV original
+# (opció --raw). check_clean_parity() compara el resultat amb la sortida del notebook.
+
+# Columnes del CSV original que necessiten la neteja i el dashboard
+RAW_COLUMNS = [
+    'hotel', 'is_canceled', 'lead_time', 'arrival_date_year', 'arrival_date_month',
+    'arrival_date_day_of_month', 'stays_in_weekend_nights', 'stays_in_week_nights',
+    'adults', 'children', 'babies', 'country', 'market_segment', 'deposit_type',
+    'booking_changes', 'adr'
+]
+
+# Columnes a nivell de fila que necessiten els gràfics (la resta d'agregacions no les materialitzen)
+ROW_COLUMNS = [
+    'hotel', 'is_canceled', 'lead_time', 'arrival_date_year', 'arrival_date_month',
+    'arrival_date_day_of_month', 'country', 'origin_group', 'deposit_type', 'booking_changes'
+]
+
+def clean_data(df):
+    """
+    Neteja vectoritzada equivalent al notebook R (hotel_bookings.Rmd)
+    - Outliers: adults < 10, children < 5, babies < 5
+    - ADR dins de [0, 1000)
+    - children nuls → 0
+    - Estades vàlides: ADR > 0, com a mínim una nit i un hoste
+    - Variables derivades: month_num, arrival_date (x$dia) i tipo (tipus de viatge)
+    """
+    # A R, x[x$children<5,] amb children = NA genera files buides (totes NA) que cap filtre
+    # posterior recupera; aquí aquestes reserves es descarten directament (NA < 5 és False)
+    children = df['children'].fillna(0)
+
+    mask = (
+        (df['adults'] < 10) &
+        (df['children'] < 5) &
+        (df['babies'] < 5) &
+        (df['adr'] >= 0) & (df['adr'] < 1000) &
+        (df['adr'] > 0) &
+        ((df['stays_in_week_nights'] + df['stays_in_weekend_nights']) > 0) &
+        ((df['adults'] + children + df['babies']) > 0)
+    )
+
+    df_clean = df[mask].copy()
+    df_clean['children'] = children[mask]
+
+    # Construcció de la data (x$month_num, x$dia)
+    df_clean['month_num'] = df_clean['arrival_date_month'].map(MONTH_NUMBERS)
+    add_arrival_date(df_clean)
+
+    # Tipus de viatge (x$tipo); wday() de lubridate: divendres = 6 → dayofweek de pandas = 4
+    weekend = df_clean['stays_in_weekend_nights']
+    week = df_clean['stays_in_week_nights']
+    is_friday = df_clean['arrival_date'].dt.dayofweek == 4
+    df_clean['tipo'] = np.select(
+        [
+            weekend == 0,
+            week == 0,
+            (week == 1) & is_friday,
+            (week == 5) & ((weekend == 3) | (weekend == 4)),
+            (week <= 5) & (weekend < 3)
+        ],
+        ['work', 'weekend', 'weekend', 'package', 'work+rest'],
+        default='rest'
+    )
+
+    return df_clean.reset_index(drop=True)
+
+def add_origin_group(df):
+    """Afegeix la variable origin_group (Local (PRT) / International) de forma vectoritzada"""
+    if 'origin_group' not in df.columns:
+        df['origin_group'] = np.where(df['country'] == 'PRT', 'Local (PRT)', 'International')
+    return df
+
+def load_raw_bookings(path='hotel_bookings.csv', chunksize=None, usecols=RAW_COLUMNS):
+    """
+    Llegeix el CSV original i el neteja en Python (sense passar pel notebook R)
+    Amb chunksize, cada bloc es neteja tan bon punt es llegeix (tots els filtres són per fila),
+    de manera que no cal tenir el CSV brut sencer en memòria
+    """
+    if chunksize:
+        chunks = [clean_data(chunk) for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunksize)]
+        df_clean = pd.concat(chunks, ignore_index=True)
+    else:
+        df_clean = clean_data(pd.read_csv(path, usecols=usecols))
+    return add_origin_group(df_clean)
+
+def check_clean_parity(df_py, df_r):
+    """
+    Compara la neteja en Python amb la sortida del notebook R (hotel_bookings_clean.csv)
+    Retorna una llista de diferències (buida si són equivalents)
+    """
+    differences = []
+
+    # Files completament buides generades per R en indexar amb NA
+    df_r = df_r.dropna(how='all').reset_index(drop=True)
+    if len(df_py) != len(df_r):
+        differences.append(f"Nombre de files: Python {len(df_py)} vs R {len(df_r)}")
+        return differences
+
+    if 'dia' in df_r.columns:
+        df_r = df_r.assign(arrival_date=pd.to_datetime(df_r['dia']))
+
+    for col in df_py.columns:
+        if col not in df_r.columns:
+            continue
+        left = df_py[col].reset_index(drop=True)
+        right = df_r[col].reset_index(drop=True)
+        if pd.api.types.is_numeric_dtype(left) and pd.api.types.is_numeric_dtype(right):
+            equal = np.isclose(left.to_numpy(dtype='float64'), right.to_numpy(dtype='float64'), equal_nan=True)
+        else:
+            equal = ((left.astype(str) == right.astype(str)) | (left.isna() & right.isna())).to_numpy()
+        n_diff = int((~equal).sum())
+        if n_diff > 0:
+            differences.append(f"Columna {col}: {n_diff} valors diferents")
+
+    return differences
 
 # ============================================================================
 # FASE 2: TAULES INTERMÈDIES
 # ============================================================================
 
+# Totes les taules són marginals del cub d'agregació (FASE 2E): les funcions create_tbl_*
+# en construeixen el cub de les dimensions que necessiten (memoitzat) i el sumen; les
+# mateixes taules per a tots els modes surten de create_tables_from_cube.
+
+def _df_tables(df, min_bookings=1000):
+    """TAULES 1-6 del DataFrame com a marginals del cub de PARTIAL_KEYS"""
+    return create_tables_from_cube(build_booking_cube(df, PARTIAL_KEYS, with_lead_time=False), min_bookings)
+
 def create_tbl_volume_hotel_year(df):
     """TAULA 1: Volum de reserves per hotel i any"""
-    tbl = df.groupby(['hotel', 'arrival_date_year']).size().reset_index(name='n_bookings')
-    return tbl
+    return _df_tables(df)[0]
 
 def create_tbl_cancel_rate_hotel_year(df):
     """TAULA 2: Taxa de cancel·lació per hotel i any"""
-    tbl = df.groupby(['hotel', 'arrival_date_year']).agg({
-        'is_canceled': ['count', 'sum']
-    }).reset_index()
-    tbl.columns = ['hotel', 'arrival_date_year', 'n_bookings', 'n_canceled']
-    tbl['cancel_rate'] = tbl['n_canceled'] / tbl['n_bookings']
-    tbl['cancel_rate_pct'] = tbl['cancel_rate'] * 100
-    return tbl
+    return _df_tables(df)[1]
 
 def create_tbl_cancel_rate_country(df, min_bookings=1000):
-    """TAULA 3: Taxa de cancel·lació per país (amb volum)"""
-    # Filtrar països amb mínim de reserves
-    country_counts = df.groupby('country').size()
-    valid_countries = country_counts[country_counts >= min_bookings].index
-    
-    df_filtered = df[df['country'].isin(valid_countries)].copy()
-    
-    tbl = df_filtered.groupby('country').agg({
-        'is_canceled': ['count', 'sum']
-    }).reset_index()
-    tbl.columns = ['country', 'n_bookings', 'n_canceled']
-    tbl['cancel_rate'] = tbl['n_canceled'] / tbl['n_bookings']
-    tbl['cancel_rate_pct'] = tbl['cancel_rate'] * 100
-    tbl = tbl.sort_values('cancel_rate_pct', ascending=False)
-    return tbl
+    """TAULA 3: Taxa de cancel·lació per país (amb volum), països amb min_bookings reserves o més"""
+    return _df_tables(df, min_bookings)[2]
 
 def create_tbl_country_hotel_cancel(df, min_bookings=1000):
     """TAULA 4: País × hotel (estructura bubble/heatmap)"""
-    # Filtrar països amb mínim de reserves
-    country_counts = df.groupby('country').size()
-    valid_countries = country_counts[country_counts >= min_bookings].index
-    
-    df_filtered = df[df['country'].isin(valid_countries)].copy()
-    
-    tbl = df_filtered.groupby(['country', 'hotel']).agg({
-        'is_canceled': ['count', 'sum']
-    }).reset_index()
-    tbl.columns = ['country', 'hotel', 'n_bookings', 'n_canceled']
-    tbl['cancel_rate'] = tbl['n_canceled'] / tbl['n_bookings']
-    tbl['cancel_rate_pct'] = tbl['cancel_rate'] * 100
-    return tbl
+    return _df_tables(df, min_bookings)[3]
 
 def create_tbl_origin_hotel_cancel(df):
     """TAULA 5: Local vs Internacional per hotel"""
-    tbl = df.groupby(['origin_group', 'hotel']).agg({
+    return _df_tables(df)[4]
+
+def create_tbl_sankey_flow(df):
+    """TAULA 6: Dades per Sankey diagram (Origen → Hotel → Cancel·lació)"""
+    return _df_tables(df)[5]
+
+# Categories de canvis a la reserva de l'ACTE 5B
+CHANGES_CATEGORIES = ['0', '1', '2', '3', '4', '5+']
+
+def bucket_booking_changes(values):
+    """Agrupa booking_changes en 0, 1, 2, 3, 4 i 5+ (vectoritzat)"""
+    values = np.asarray(values)
+    labels = np.full(len(values), '5+', dtype=object)
+    for k in range(5):
+        labels[values == k] = str(k)
+    return labels
+
+def create_tbl_booking_changes(df):
+    """TAULA 8: Reserves per origen i categoria de canvis (0-4, 5+)"""
+    dims = ['origin_group', 'changes_cat']
+    return cube_count_table(build_booking_cube(df, dims, with_lead_time=False), dims)
+
+def create_tbl_deposit_type(df):
+    """TAULA 9: Reserves per origen i tipus de dipòsit"""
+    dims = ['origin_group', 'deposit_type']
+    return cube_count_table(build_booking_cube(df, dims, with_lead_time=False), dims)
+
+# ============================================================================
+# FASE 2B: GRANULARITAT TEMPORAL (ANY / MES / SETMANA / DIA)
+# ============================================================================
+
+# Granularitats suportades: nom → freqüència de pandas (None = any natural)
+GRANULARITIES = {
+    'year': None,
+    'month': 'M',
+    'week': 'W-MON',  # Setmanes de dilluns a diumenge
+    'day': 'D'
+}
+
+MONTH_NUMBERS = {
+    'January': 1, 'February': 2, 'March': 3, 'April': 4, 'May': 5, 'June': 6,
+    'July': 7, 'August': 8, 'September': 9, 'October': 10, 'November': 11, 'December': 12
+}
+
+def arrival_dates(df):
+    """
+    Data d'arribada (datetime64) de cada reserva, sense modificar el DataFrame
+    Equivalent a x$dia = ymd(...) del notebook R, però vectoritzat:
+    es construeix amb aritmètica de datetime64 en lloc de parsejar cadenes fila a fila
+    """
+    if 'arrival_date' in df.columns and pd.api.types.is_datetime64_any_dtype(df['arrival_date']):
+        return df['arrival_date']
+
+    years = df['arrival_date_year'].to_numpy(dtype='int64')
+    months = df['arrival_date_month'].astype(str).map(MONTH_NUMBERS).to_numpy(dtype='int64')
+    days = df['arrival_date_day_of_month'].to_numpy(dtype='int64')
+
+    # Mesos des de 1970 → primer dia del mes → + (dia - 1)
+    month_start = ((years - 1970) * 12 + (months - 1)).astype('datetime64[M]')
+    dates = (month_start.astype('datetime64[D]') + (days - 1)).astype('datetime64[ns]')
+    return pd.Series(dates, index=df.index, name='arrival_date')
+
+def add_arrival_date(df):
+    """Afegeix la columna 'arrival_date' (datetime64) al DataFrame"""
+    df['arrival_date'] = arrival_dates(df)
+    return df
+
+@memoized
+def create_tbl_cancel_rate_hotel_day(df):
+    """TAULA 7: Reserves i cancel·lacions per hotel i dia d'arribada (base per reagregar)"""
+    tbl = df.groupby(['hotel', arrival_dates(df)]).agg({
         'is_canceled': ['count', 'sum']
     }).reset_index()
-    tbl.columns = ['origin_group', 'hotel', 'n_bookings', 'n_canceled']
+    tbl.columns = ['hotel', 'arrival_date', 'n_bookings', 'n_canceled']
+    return tbl
+
+def resample_tbl_hotel_period(tbl_day, granularity='year'):
+    """
+    Reagrega la taula diària (TAULA 7) a la granularitat indicada
+    Per 'year' la columna temporal és 'arrival_date_year' (compatible amb les TAULES 1 i 2);
+    per la resta és 'period' (datetime64 amb l'inici de cada període)
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Granularitat desconeguda: {granularity} (opcions: {', '.join(GRANULARITIES)})")
+
+    freq = GRANULARITIES[granularity]
+    if freq is None:
+        period = tbl_day['arrival_date'].dt.year.rename('arrival_date_year')
+    else:
+        period = tbl_day['arrival_date'].dt.to_period(freq).dt.start_time.rename('period')
+
+    tbl = tbl_day.groupby(['hotel', period])[['n_bookings', 'n_canceled']].sum().reset_index()
     tbl['cancel_rate'] = tbl['n_canceled'] / tbl['n_bookings']
     tbl['cancel_rate_pct'] = tbl['cancel_rate'] * 100
     return tbl
 
-def create_tbl_sankey_flow(df):
-    """TAULA 6: Dades per Sankey diagram (Origen → Hotel → Cancel·lació)"""
-    # Agrupar per origen, hotel i estat de cancel·lació
-    flow_data = df.groupby(['origin_group', 'hotel', 'is_canceled']).size().reset_index(name='count')
-    
-    # Crear etiquetes per estat
-    flow_data['status'] = flow_data['is_canceled'].apply(lambda x: 'Cancel·lada' if x == 1 else 'No cancel·lada')
-    
-    return flow_data
+@memoized
+def create_tbl_time_granularities(df, granularities=tuple(GRANULARITIES)):
+    """
+    Precalcula les taules hotel × període per a cada granularitat
+    Només es recorren les reserves una vegada (agregació diària); la resta de
+    granularitats són reagregacions d'aquesta taula petita
+    """
+    tbl_day = create_tbl_cancel_rate_hotel_day(df)
+    return {granularity: resample_tbl_hotel_period(tbl_day, granularity) for granularity in granularities}
+
+def _time_column(tbl):
+    """Nom de la columna temporal d'una taula hotel × període"""
+    return 'arrival_date_year' if 'arrival_date_year' in tbl.columns else 'period'
+
+def _period_labels(periods):
+    """Etiquetes per als períodes: anys tal qual, dates en format ISO"""
+    if pd.api.types.is_datetime64_any_dtype(periods):
+        return pd.DatetimeIndex(periods).strftime('%Y-%m-%d').tolist()
+    return [str(p) for p in periods]
 
 # ============================================================================
-# FASE 3: GRÀFICS PLOTLY (VERSIÓ AVANÇADA)
+# FASE 2C: MAGATZEM COLUMNAR (NUMPY MEMMAP)
 # ============================================================================
 
-def create_graph1_volume_hotel_year(tbl):
+# Estructura del magatzem (un directori):
+#   meta.json      → nombre de files i descripció de cada columna
+#   <columna>.npy  → array NumPy d'amplada fixa (numèriques reduïdes al tipus enter més petit,
+#                    categòriques codificades amb diccionari: codis enters, -1 = nul)
+# np.load(..., mmap_mode='r') projecta cada fitxer en memòria sense copiar-lo, de manera que
+# l'arrencada és gairebé immediata i diverses execucions comparteixen la cache de pàgines del SO.
+
+STORE_META_FILE = 'meta.json'
+
+def _smallest_int_dtype(min_value, max_value):
+    """Tipus enter més petit que pot representar el rang [min_value, max_value]"""
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        info = np.iinfo(dtype)
+        if info.min <= min_value and max_value <= info.max:
+            return dtype
+    return np.int64
+
+def build_columnar_store(df, store_dir):
     """
-    ACTE 1: Distribució del volum de reserves per tipus d'hotel (2015–2017)
-    Stacked Area Chart: mostra evolució temporal i pes relatiu
+    Escriu el DataFrame com a magatzem columnar (un .npy per columna)
+    Les columnes de text es codifiquen amb diccionari (categories ordenades)
     """
-    # Preparar dades per Stacked Area Chart
-    hotels = sorted(tbl['hotel'].unique())
-    years = sorted(tbl['arrival_date_year'].unique())
-    
-    # Colors coherents amb la resta del dashboard
-    hotel_colors = {
-        'City Hotel': COLORS['city_hotel'],   # Porpra
-        'Resort Hotel': COLORS['resort_hotel']  # Verd
+    os.makedirs(store_dir, exist_ok=True)
+    meta = {'n_rows': len(df), 'columns': {}}
+
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            values = series.to_numpy(dtype='datetime64[ns]')
+            meta['columns'][col] = {'kind': 'datetime'}
+        elif pd.api.types.is_bool_dtype(series):
+            values = series.to_numpy(dtype=np.int8)
+            meta['columns'][col] = {'kind': 'numeric', 'dtype': 'bool'}
+        elif pd.api.types.is_integer_dtype(series):
+            values = series.to_numpy()
+            small = _smallest_int_dtype(values.min(), values.max()) if len(values) else np.int8
+            values = values.astype(small)
+            meta['columns'][col] = {'kind': 'numeric', 'dtype': str(series.dtype)}
+        elif pd.api.types.is_numeric_dtype(series):
+            values = series.to_numpy(dtype=np.float64)
+            meta['columns'][col] = {'kind': 'numeric', 'dtype': 'float64'}
+        else:
+            codes, categories = pd.factorize(series, sort=True)
+            values = codes.astype(_smallest_int_dtype(-1, max(len(categories) - 1, 0)))
+            meta['columns'][col] = {'kind': 'category', 'categories': [str(c) for c in categories]}
+        np.save(os.path.join(store_dir, f'{col}.npy'), values)
+
+    with open(os.path.join(store_dir, STORE_META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    return store_dir
+
+def load_columnar_store(store_dir):
+    """
+    Obre el magatzem columnar amb np.memmap (via np.load mmap_mode='r'), sense copiar dades
+    Retorna un dict amb 'n_rows', 'meta' i 'columns' (nom → array projectat)
+    """
+    with open(os.path.join(store_dir, STORE_META_FILE), encoding='utf-8') as f:
+        meta = json.load(f)
+    columns = {
+        col: np.load(os.path.join(store_dir, f'{col}.npy'), mmap_mode='r')
+        for col in meta['columns']
     }
-    
-    # Preparar dades per cada hotel i any
-    fig = go.Figure()
-    
-    # Calcular totals per any per percentatges
-    year_totals = {}
-    for year in years:
-        year_totals[year] = tbl[tbl['arrival_date_year'] == year]['n_bookings'].sum()
-    
-    # Preparar dades per a cada hotel
-    hotel_data_dict = {}
-    hover_texts_dict = {}
-    pct_dict = {}
-    
-    for hotel in hotels:
-        hotel_data = []
-        hover_texts = []
-        pct_year_list = []
-        
-        for year in years:
-            data = tbl[(tbl['hotel'] == hotel) & (tbl['arrival_date_year'] == year)]
-            if len(data) > 0:
-                n_bookings = data['n_bookings'].values[0]
-                hotel_data.append(n_bookings)
-                year_total = year_totals[year]
-                pct_year = (n_bookings / year_total * 100) if year_total > 0 else 0
-                
-                hover_texts.append(
-                    f'<b>{hotel} - {year}</b><br>' +
-                    f'Reserves: {n_bookings:,}<br>' +
-                    f'% dins de {year}: {pct_year:.1f}%<br>' +
-                    f'Total {year}: {year_total:,} reserves'
-                )
-                pct_year_list.append(pct_year)
-            else:
-                hotel_data.append(0)
-                hover_texts.append('')
-                pct_year_list.append(0)
-        
-        hotel_data_dict[hotel] = hotel_data
-        hover_texts_dict[hotel] = hover_texts
-        pct_dict[hotel] = pct_year_list
-    
-    # Crear traces per cada hotel (apilades)
-    for hotel in hotels:
-        fig.add_trace(go.Scatter(
-            x=years,
-            y=hotel_data_dict[hotel],
-            mode='lines',
-            name=hotel,
-            stackgroup='one',  # Apilar les àrees
-            fill='tonexty' if hotel != hotels[0] else 'tozeroy',
-            line=dict(width=2, color=hotel_colors[hotel]),
-            fillcolor=hotel_colors[hotel],
-            hovertemplate='%{hovertext}<extra></extra>',
-            hovertext=hover_texts_dict[hotel]
-        ))
-    
-    # Afegir percentatges com a anotacions dins de cada any (després de crear totes les traces)
-    for i, year in enumerate(years):
-        for hotel in hotels:
-            if hotel_data_dict[hotel][i] > 0 and pct_dict[hotel][i] > 0:
-                # Calcular la base acumulada per a aquest any
-                base_y = 0
-                for prev_hotel in hotels:
-                    if prev_hotel == hotel:
-                        break
-                    base_y += hotel_data_dict[prev_hotel][i]
-                
-                # Posició Y: base + percentatge de l'alçada de l'àrea
-                # Per City Hotel (primer): 75% de l'alçada
-                # Per Resort Hotel (segon): 25% de l'alçada
-                if hotel == hotels[0]:  # City Hotel (a dalt)
-                    y_pos = base_y + hotel_data_dict[hotel][i] * 0.75
-                else:  # Resort Hotel (a baix)
-                    y_pos = base_y + hotel_data_dict[hotel][i] * 0.25
-                
-                fig.add_annotation(
-                    text=f'{pct_dict[hotel][i]:.0f}%',
-                    x=year,
-                    y=y_pos,
-                    xref='x',
-                    yref='y',
-                    showarrow=False,
-                    font=dict(size=11, color='white'),
-                    bgcolor='rgba(0, 0, 0, 0.6)',
-                    bordercolor='white',
-                    borderwidth=1,
-                    borderpad=4
-                )
-    
-    fig.update_layout(
-        title={
-            'text': 'Distribució del volum de reserves per tipus d\'hotel (2015–2017)<br><sub>El City Hotel concentra de manera consistent la major part del volum</sub>',
-            'x': 0.5,
-            'xanchor': 'center',
-            'font': {'size': 20}
-        },
-        xaxis=dict(
-            title='Any',
-            tickmode='linear',
-            tick0=2015,
-            dtick=1,
-            tickfont=dict(size=12)
-        ),
-        yaxis=dict(
-            title='Nombre de reserves',
-            tickfont=dict(size=12),
-            gridcolor='rgba(0, 0, 0, 0.1)',
-            gridwidth=1
-        ),
-        template='plotly_white',
-        height=600,
-        margin=dict(l=60, r=20, t=120, b=60),
-        legend=dict(
-            orientation='h',
-            yanchor='bottom',
-            y=1.02,
-            xanchor='right',
-            x=1,
-            font=dict(size=12)
-        ),
-        hovermode='x unified'
-    )
-    
-    return fig
+    return {'n_rows': meta['n_rows'], 'meta': meta['columns'], 'columns': columns}
+
+def store_column(store, col, rows=slice(None)):
+    """Valors descodificats d'una columna del magatzem (les categòriques tornen a text)"""
+    info = store['meta'][col]
+    values = store['columns'][col][rows]
+    if info['kind'] == 'category':
+        categories = np.asarray(info['categories'] + [np.nan], dtype=object)
+        return categories[values]  # codi -1 → últim element (nul)
+    if info.get('dtype') == 'bool':
+        return values.astype(bool)
+    if info['kind'] == 'numeric':
+        return values.astype(info['dtype'])
+    return np.asarray(values)
+
+def store_to_frame(store, columns=None, rows=slice(None)):
+    """Materialitza (algunes) columnes del magatzem com a DataFrame; rows limita les files"""
+    columns = columns or list(store['meta'])
+    return pd.DataFrame({col: store_column(store, col, rows) for col in columns})
+
+def _store_codes(store, col, rows=slice(None)):
+    """Codis enters (0..k-1, -1 = nul) i valors únics d'una columna, per a agregacions"""
+    info = store['meta'][col]
+    values = store['columns'][col][rows]
+    if info['kind'] == 'category':
+        return np.asarray(values), info['categories']
+    uniques, codes = np.unique(values, return_inverse=True)
+    if info['kind'] == 'numeric':
+        uniques = uniques.astype(info['dtype'])
+    return codes, uniques.tolist()
 
-def create_graph2_cancel_rate_hotel_year(tbl):
+def store_group_counts(store, by, rows=slice(None), dropna=True):
     """
-    ACTE 2: La bretxa de risc entre hotels
-    Dumbbell Plot: mostra la diferència de taxa de cancel·lació entre City i Resort
-    NOVA VISUALITZACIÓ AVANÇADA
+    Recompte de reserves i cancel·lacions per combinació de columnes, directament sobre
+    les pàgines projectades: np.unique + np.bincount sobre l'índex pla dels codis (sense
+    DataFrame); com al cub, només s'assignen les cel·les observades, no el producte dens
+    Equivalent a df.groupby(by, dropna=dropna)['is_canceled'].agg(['count', 'sum']);
+    rows permet limitar-ho a un rang de files (fragment)
     """
-    fig = go.Figure()
-    
-    years = sorted(tbl['arrival_date_year'].unique())
-    
-    # Preparar dades per Dumbbell Plot
-    resort_rates = []
-    city_rates = []
-    resort_bookings = []
-    city_bookings = []
-    resort_canceled = []
-    city_canceled = []
-    differences = []
-    
-    for year in years:
-        data_year = tbl[tbl['arrival_date_year'] == year]
-        
-        # Resort Hotel (punt esquerre)
-        resort_data = data_year[data_year['hotel'] == 'Resort Hotel']
-        if len(resort_data) > 0:
-            resort_rates.append(resort_data['cancel_rate_pct'].values[0])
-            resort_bookings.append(int(resort_data['n_bookings'].values[0]))
-            resort_canceled.append(int(resort_data['n_canceled'].values[0]))
-        else:
-            resort_rates.append(0)
-            resort_bookings.append(0)
-            resort_canceled.append(0)
-        
-        # City Hotel (punt dret)
-        city_data = data_year[data_year['hotel'] == 'City Hotel']
-        if len(city_data) > 0:
-            city_rates.append(city_data['cancel_rate_pct'].values[0])
-            city_bookings.append(int(city_data['n_bookings'].values[0]))
-            city_canceled.append(int(city_data['n_canceled'].values[0]))
-        else:
-            city_rates.append(0)
-            city_bookings.append(0)
-            city_canceled.append(0)
-        
-        # Calcular diferència
-        diff = city_rates[-1] - resort_rates[-1]
-        differences.append(diff)
-    
-    # Crear traces per al Dumbbell Plot
-    # 1. Línies que uneixen els punts (dumbbell)
-    for i, year in enumerate(years):
-        fig.add_trace(go.Scatter(
-            x=[resort_rates[i], city_rates[i]],
-            y=[year, year],
-            mode='lines',
-            line=dict(color='#95A5A6', width=3, dash='solid'),
-            showlegend=False,
-            hoverinfo='skip'
-        ))
-    
-    # 2. Punts per Resort Hotel (esquerra, verd)
-    fig.add_trace(go.Scatter(
-        x=resort_rates,
-        y=years,
-        mode='markers+text',
-        name='Resort Hotel',  # Nom sense cap font personalitzada
-        legendgroup='hotels',
-        marker=dict(
-            size=12,
-            color=COLORS['resort_hotel'],  # Verd (coherent amb dashboard)
-            line=dict(width=2, color='white')
-        ),
-        text=[f'{r:.1f}%' for r in resort_rates],
-        textposition='middle left',
-        textfont=dict(size=10, color=COLORS['resort_hotel']),
-        hovertemplate='<b>Resort Hotel - %{y}</b><br>' +
-                      'Taxa: %{x:.1f}%<br>' +
-                      'Reserves: %{customdata[0]:,}<br>' +
-                      'Cancel·lades: %{customdata[1]:,}<br>' +
-                      '<extra></extra>',
-        customdata=list(zip(resort_bookings, resort_canceled))
-    ))
-    
-    # 3. Punts per City Hotel (dreta, porpra) - més visible
-    fig.add_trace(go.Scatter(
-        x=city_rates,
-        y=years,
-        mode='markers+text',
-        name='City Hotel',  # Nom sense cap font personalitzada
-        legendgroup='hotels',
-        marker=dict(
+    codes_list = []
+    uniques_list = []
+    valid = None
+    for col in by:
+        codes, uniques = _store_codes(store, col, rows)
+        if dropna:
+            valid = codes >= 0 if valid is None else valid & (codes >= 0)
+        elif (codes < 0).any():
+            # Els nuls com a última categoria (mateix ordre que groupby(dropna=False))
+            codes = np.where(codes < 0, len(uniques), codes)
+            uniques = list(uniques) + [np.nan]
+        codes_list.append(codes)
+        uniques_list.append(uniques)
+
+    canceled = np.asarray(store['columns']['is_canceled'][rows]) == 1
+    if valid is not None:
+        codes_list = [c[valid] for c in codes_list]
+        canceled = canceled[valid]
+
+    shape = tuple(len(u) for u in uniques_list)
+    flat = np.ravel_multi_index(codes_list, shape) if len(canceled) else np.array([], dtype=np.int64)
+
+    # Cel·les observades, en el mateix ordre que un groupby (claus ordenades)
+    cells, inverse = np.unique(flat, return_inverse=True)
+    n_bookings = np.bincount(inverse, minlength=len(cells))
+    n_canceled = np.bincount(inverse[canceled], minlength=len(cells))
+    cell_codes = np.unravel_index(cells, shape)
+    tbl = pd.DataFrame({
+        col: np.asarray(uniques, dtype=object)[cell_codes[i]] if store['meta'][col]['kind'] == 'category'
+        else np.asarray(uniques)[cell_codes[i]]
+        for i, (col, uniques) in enumerate(zip(by, uniques_list))
+    })
+    tbl['n_bookings'] = n_bookings.astype(np.int64)
+    tbl['n_canceled'] = n_canceled.astype(np.int64)
+    return tbl
+
+def _add_cancel_rate(tbl):
+    """Afegeix cancel_rate i cancel_rate_pct a una taula de recomptes"""
+    tbl['cancel_rate'] = tbl['n_canceled'] / tbl['n_bookings']
+    tbl['cancel_rate_pct'] = tbl['cancel_rate'] * 100
+    return tbl
+
+def create_tables_from_store(store, min_bookings=1000):
+    """
+    TAULES 1-4 calculades amb els kernels del magatzem columnar
+    Mateix contingut que create_tables_from_cube sobre el cub de les mateixes reserves
+    """
+    tbl_hotel_year = store_group_counts(store, ['hotel', 'arrival_date_year'])
+    tbl_volume = tbl_hotel_year[['hotel', 'arrival_date_year', 'n_bookings']].copy()
+    tbl_cancel_hotel = _add_cancel_rate(tbl_hotel_year)
+
+    tbl_country = store_group_counts(store, ['country'])
+    valid_countries = tbl_country.loc[tbl_country['n_bookings'] >= min_bookings, 'country']
+    tbl_cancel_country = _add_cancel_rate(tbl_country[tbl_country['country'].isin(valid_countries)].reset_index(drop=True))
+    tbl_cancel_country = tbl_cancel_country.sort_values('cancel_rate_pct', ascending=False)
+
+    tbl_country_hotel = store_group_counts(store, ['country', 'hotel'])
+    tbl_country_hotel = _add_cancel_rate(tbl_country_hotel[tbl_country_hotel['country'].isin(valid_countries)].reset_index(drop=True))
+
+    return tbl_volume, tbl_cancel_hotel, tbl_cancel_country, tbl_country_hotel
+
+# ============================================================================
+# FASE 2D: AGREGACIÓ PER FRAGMENTS (MULTIPROCÉS)
+# ============================================================================
+
+# Totes les TAULES 1-6 són marginals d'un mateix recompte parcial per
+# hotel × any × país × origen (reserves i cancel·lacions). Cada procés calcula aquest
+# parcial sobre el seu fragment; la fusió és una suma, de manera que el resultat és
+# idèntic (mateixos enters, mateix ordre) al del cub de tot el DataFrame.
+PARTIAL_KEYS = ['hotel', 'arrival_date_year', 'country', 'origin_group']
+
+@memoized
+def create_tbl_partial_counts(df):
+    """Recompte parcial (fragment) per PARTIAL_KEYS; els països nuls es mantenen per a l'origen"""
+    tbl = df.groupby(PARTIAL_KEYS, dropna=False).agg({
+        'is_canceled': ['count', 'sum']
+    }).reset_index()
+    tbl.columns = PARTIAL_KEYS + ['n_bookings', 'n_canceled']
+    return tbl
+
+def merge_partial_counts(partials):
+    """Fusiona els recomptes parcials de tots els fragments"""
+    merged = pd.concat(partials, ignore_index=True)
+    return merged.groupby(PARTIAL_KEYS, dropna=False)[['n_bookings', 'n_canceled']].sum().reset_index()
+
+def create_tables_from_partial(partial, min_bookings=1000):
+    """
+    TAULES 1-6 a partir del recompte parcial fusionat
+    Retorna (volum, cancel·lació hotel/any, país, país×hotel, origen×hotel, flux Sankey)
+    Se sumen totes les mesures del recompte (també les APPROX_MEASURES d'una mostra ponderada)
+    """
+    measures = [col for col in partial.columns if col not in PARTIAL_KEYS]
+    tbl_hotel_year = partial.groupby(['hotel', 'arrival_date_year'])[measures].sum().reset_index()
+    tbl_volume = tbl_hotel_year[['hotel', 'arrival_date_year', 'n_bookings']].copy()
+    tbl_cancel_hotel = _add_cancel_rate(tbl_hotel_year)
+
+    tbl_country = partial.groupby('country')[measures].sum().reset_index()
+    valid_countries = tbl_country.loc[tbl_country['n_bookings'] >= min_bookings, 'country']
+    tbl_cancel_country = _add_cancel_rate(tbl_country[tbl_country['country'].isin(valid_countries)].reset_index(drop=True))
+    tbl_cancel_country = tbl_cancel_country.sort_values('cancel_rate_pct', ascending=False)
+
+    partial_valid = partial[partial['country'].isin(valid_countries)]
+    tbl_country_hotel = partial_valid.groupby(['country', 'hotel'])[measures].sum().reset_index()
+    tbl_country_hotel = _add_cancel_rate(tbl_country_hotel)
+
+    tbl_origin_hotel = partial.groupby(['origin_group', 'hotel'])[measures].sum().reset_index()
+    tbl_origin_hotel = _add_cancel_rate(tbl_origin_hotel)
+
+    # Flux Sankey: una fila per (origen, hotel, is_canceled) amb recompte > 0
+    flow_data = pd.concat([
+        tbl_origin_hotel[['origin_group', 'hotel']].assign(is_canceled=0, count=tbl_origin_hotel['n_bookings'] - tbl_origin_hotel['n_canceled']),
+        tbl_origin_hotel[['origin_group', 'hotel']].assign(is_canceled=1, count=tbl_origin_hotel['n_canceled'])
+    ])
+    flow_data = flow_data[flow_data['count'] > 0].sort_values(['origin_group', 'hotel', 'is_canceled'], kind='stable')
+    flow_data = flow_data.reset_index(drop=True)
+    flow_data['status'] = flow_data['is_canceled'].apply(lambda x: 'Cancel·lada' if x == 1 else 'No cancel·lada')
+
+    return tbl_volume, tbl_cancel_hotel, tbl_cancel_country, tbl_country_hotel, tbl_origin_hotel, flow_data
+
+def _csv_byte_ranges(path, n_shards):
+    """
+    Divideix el CSV en n_shards rangs de bytes alineats a salts de línia
+    (el dataset no té camps amb salts de línia dins de cometes)
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        f.readline()  # Capçalera
+        data_start = f.tell()
+        bounds = [data_start]
+        for i in range(1, n_shards):
+            f.seek(max(data_start + (size - data_start) * i // n_shards, bounds[-1]))
+            f.readline()  # Avançar fins al final de la línia en curs
+            bounds.append(min(f.tell(), size))
+        bounds.append(size)
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+def _aggregate_csv_shard(path, start, end, raw, shard_dir):
+    """
+    Treball d'un procés: llegeix el seu rang de bytes, el neteja si cal i en calcula el parcial
+    Les files (ROW_COLUMNS) s'escriuen com a magatzem columnar a shard_dir en lloc de tornar
+    al procés principal: només el parcial travessa el pool
+    """
+    header = pd.read_csv(path, nrows=0).columns.tolist()
+    with open(path, 'rb') as f:
+        f.seek(start)
+        chunk = f.read(end - start)
+
+    usecols = [c for c in RAW_COLUMNS if c in header] if raw else None
+    df = pd.read_csv(io.BytesIO(chunk), header=None, names=header, usecols=usecols)
+    df = clean_data(df) if raw else df
+    add_origin_group(df)
+    build_columnar_store(df[[col for col in ROW_COLUMNS if col in df.columns]], shard_dir)
+    return create_tbl_partial_counts(df)
+
+def _aggregate_store_shard(store_dir, start, end):
+    """Treball d'un procés: parcial sobre un rang de files del magatzem columnar (memmap compartit)"""
+    store = load_columnar_store(store_dir)
+    return store_group_counts(store, PARTIAL_KEYS, rows=slice(start, end), dropna=False)
+
+def create_tables_sharded(source, n_workers, raw=False, store_dir=None, min_bookings=1000):
+    """
+    Mode fragmentat: reparteix l'entrada entre un pool de processos
+    - CSV (net o original amb raw=True): rangs de bytes; cada procés parseja i neteja el seu tros
+      i en desa les files en un magatzem columnar temporal
+    - Magatzem columnar: rangs de files sobre els mateixos fitxers projectats
+    Els processos només retornen recomptes parcials; les files es llegeixen dels magatzems
+    Retorna (taules 1-6, DataFrame amb les columnes a nivell de fila que necessiten els gràfics)
+    """
+    with ProcessPoolExecutor(max_workers=n_workers) as pool, tempfile.TemporaryDirectory() as shards_dir:
+        if store_dir:
+            store = load_columnar_store(store_dir)
+            n_rows = store['n_rows']
+            bounds = np.linspace(0, n_rows, n_workers + 1).astype(int)
+            futures = [pool.submit(_aggregate_store_shard, store_dir, int(a), int(b))
+                       for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+            partials = [f.result() for f in futures]
+            df_rows = store_to_frame(store, [col for col in ROW_COLUMNS if col in store['meta']])
+        else:
+            shard_dirs = []
+            futures = []
+            for i, (start, end) in enumerate(_csv_byte_ranges(source, n_workers)):
+                shard_dirs.append(os.path.join(shards_dir, f'shard{i}'))
+                futures.append(pool.submit(_aggregate_csv_shard, source, start, end, raw, shard_dirs[-1]))
+            partials = [f.result() for f in futures]  # En ordre de fragment
+            df_rows = pd.concat([store_to_frame(load_columnar_store(shard_dir)) for shard_dir in shard_dirs],
+                                ignore_index=True)
+
+    partial = merge_partial_counts(partials)
+    return create_tables_from_partial(partial, min_bookings), df_rows
+
+# ============================================================================
+# FASE 2E: CUB D'AGREGACIÓ (TAULES I FILTRES INTERACTIUS)
+# ============================================================================
+
+# Cub de recomptes (reserves i cancel·lacions) per hotel × any × país × origen × dipòsit ×
+# categoria de canvis. Es calcula una vegada; totes les taules dels gràfics són marginals
+# del cub, i qualsevol filtre sobre aquestes dimensions es resol seleccionant cel·les i
+# sumant, sense tornar a recórrer les reserves.
+# Representació dispersa: només les cel·les no buides (coordenades + mesures).
+# El cub es pot desar (.npz) perquè execucions posteriors no hagin de llegir les reserves;
+# per al violin (5A) s'hi afegeix un subcub amb lead_time com a dimensió addicional.
+CUBE_DIMENSIONS = ['hotel', 'arrival_date_year', 'country', 'origin_group', 'deposit_type', 'changes_cat']
+
+# Noms dels paràmetres de filtre (API del servidor) → dimensió del cub
+CUBE_FILTERS = {
+    'hotel': 'hotel',
+    'year': 'arrival_date_year',
+    'country': 'country',
+    'origin': 'origin_group',
+    'deposit': 'deposit_type',
+    'changes': 'changes_cat'
+}
+
+CUBE_MEASURES = ['n_bookings', 'n_canceled']
+
+# Mesures addicionals d'un cub ponderat (mostra del mode aproximat): sumes de w·(w-1) i
+# w·(w-1)·is_canceled, necessàries per a la variància de les taxes estimades
+APPROX_MEASURES = ['w_var', 'w_var_canceled']
+
+def _cube_measures(cube):
+    return [m for m in CUBE_MEASURES + APPROX_MEASURES if m in cube]
+
+@memoized
+def build_booking_cube(df, dims=CUBE_DIMENSIONS, with_lead_time=True, weights=None):
+    """
+    Construeix el cub dispers a partir del DataFrame net
+    Retorna un dict amb 'dims', 'labels' (valors de cada dimensió, ordenats; el nul al final),
+    'coords' (cel·la × dimensió, codis enters) i les mesures 'n_bookings' i 'n_canceled'
+    Amb with_lead_time, 'lead_time' conté el subcub dims + lead_time (per al violin)
+    Amb weights (pes de cada fila d'una mostra), les mesures són estimacions (float) i
+    s'afegeixen les APPROX_MEASURES
+    """
+    codes_list = []
+    labels = {}
+    for dim in dims:
+        column = bucket_booking_changes(df['booking_changes']) if dim == 'changes_cat' else df[dim]
+        codes, uniques = pd.factorize(column, sort=True, use_na_sentinel=False)
+        codes_list.append(codes)
+        labels[dim] = uniques.tolist()
+
+    shape = tuple(len(labels[dim]) for dim in dims)
+    flat = np.ravel_multi_index(codes_list, shape)
+    canceled = df['is_canceled'].to_numpy() == 1
+
+    # Cel·les no buides: np.unique sobre l'índex pla + bincount de les mesures
+    cells, inverse = np.unique(flat, return_inverse=True)
+    cube = {
+        'dims': list(dims),
+        'labels': labels,
+        'coords': np.stack(np.unravel_index(cells, shape), axis=1).astype(np.int32)
+    }
+    if weights is None:
+        cube['n_bookings'] = np.bincount(inverse, minlength=len(cells)).astype(np.int64)
+        cube['n_canceled'] = np.bincount(inverse[canceled], minlength=len(cells)).astype(np.int64)
+    else:
+        weights = np.asarray(weights, dtype=np.float64)
+        w_var = weights * (weights - 1)
+        cube['n_bookings'] = np.bincount(inverse, weights=weights, minlength=len(cells))
+        cube['n_canceled'] = np.bincount(inverse[canceled], weights=weights[canceled], minlength=len(cells))
+        cube['w_var'] = np.bincount(inverse, weights=w_var, minlength=len(cells))
+        cube['w_var_canceled'] = np.bincount(inverse[canceled], weights=w_var[canceled], minlength=len(cells))
+    if with_lead_time and 'lead_time' in df:
+        cube['lead_time'] = build_booking_cube(df, list(dims) + ['lead_time'], with_lead_time=False, weights=weights)
+    return cube
+
+def save_booking_cube(cube, path):
+    """Desa el cub (i el subcub de lead_time, si n'hi ha) en un fitxer .npz"""
+    meta = {}
+    arrays = {}
+    for prefix, part in (('', cube), ('lead_time_', cube.get('lead_time'))):
+        if part is None:
+            continue
+        meta[prefix + 'dims'] = part['dims']
+        meta[prefix + 'labels'] = part['labels']
+        for key in ['coords'] + _cube_measures(part):
+            arrays[prefix + key] = part[key]
+    np.savez_compressed(path, meta=np.array(json.dumps(meta)), **arrays)
+
+def load_booking_cube(path):
+    """Llegeix un cub desat amb save_booking_cube"""
+    with np.load(path) as data:
+        meta = json.loads(str(data['meta']))
+        cube = None
+        for prefix in ('lead_time_', ''):
+            if prefix + 'dims' not in meta:
+                continue
+            part = {'dims': meta[prefix + 'dims'], 'labels': meta[prefix + 'labels']}
+            for key in ['coords'] + CUBE_MEASURES + APPROX_MEASURES:
+                if prefix + key in data:
+                    part[key] = data[prefix + key]
+            if cube is not None:
+                part['lead_time'] = cube
+            cube = part
+    return cube
+
+def merge_booking_cubes(cube, delta):
+    """
+    Suma dos cubs amb les mateixes dimensions (p. ex. el cub actual i el de reserves noves)
+    Les etiquetes s'unifiquen amb el mateix ordre que build_booking_cube (ordenades, el nul
+    al final) i les cel·les comunes sumen les mesures; també el subcub de lead_time
+    """
+    dims = cube['dims']
+    labels = {}
+    parts_codes = ([], [])
+    for dim in dims:
+        _, uniques = pd.factorize(pd.Series(cube['labels'][dim] + delta['labels'][dim], dtype=object),
+                                  sort=True, use_na_sentinel=False)
+        merged_labels = pd.Index(uniques)
+        labels[dim] = merged_labels.tolist()
+        i = dims.index(dim)
+        for part, codes in zip((cube, delta), parts_codes):
+            mapping = merged_labels.get_indexer(pd.Index(part['labels'][dim], dtype=object))
+            codes.append(mapping[part['coords'][:, i]] if len(part['coords']) else np.array([], dtype=np.int64))
+
+    shape = tuple(len(labels[dim]) for dim in dims)
+    flat = np.concatenate([np.ravel_multi_index(codes, shape) for codes in parts_codes])
+    cells, inverse = np.unique(flat, return_inverse=True)
+    merged = {
+        'dims': list(dims),
+        'labels': labels,
+        'coords': np.stack(np.unravel_index(cells, shape), axis=1).astype(np.int32)
+    }
+    for measure in _cube_measures(cube):
+        values = np.concatenate([cube[measure], delta[measure]])
+        merged[measure] = np.bincount(inverse, weights=values, minlength=len(cells)).astype(values.dtype)
+    if 'lead_time' in cube and 'lead_time' in delta:
+        merged['lead_time'] = merge_booking_cubes(cube['lead_time'], delta['lead_time'])
+    return merged
+
+def slice_cube(cube, filters):
+    """
+    Filtra el cub: filters = {dimensió: llista de valors}
+    Retorna un cub amb només les cel·les que compleixen tots els filtres
+    """
+    mask = np.ones(len(cube['n_bookings']), dtype=bool)
+    for dim, values in filters.items():
+        labels = cube['labels'][dim]
+        wanted = [i for i, label in enumerate(labels) if label in values or str(label) in map(str, values)]
+        mask &= np.isin(cube['coords'][:, cube['dims'].index(dim)], wanted)
+    sliced = {'dims': cube['dims'], 'labels': cube['labels'], 'coords': cube['coords'][mask]}
+    for measure in _cube_measures(cube):
+        sliced[measure] = cube[measure][mask]
+    if 'lead_time' in cube:
+        sliced['lead_time'] = slice_cube(cube['lead_time'], filters)
+    return sliced
+
+def cube_marginal(cube, dims, dropna=True):
+    """
+    Suma el cub sobre totes les dimensions excepte dims
+    Equivalent a df.groupby(dims, dropna=dropna)['is_canceled'].agg(['count', 'sum'])
+    """
+    axes = [cube['dims'].index(dim) for dim in dims]
+    shape = tuple(len(cube['labels'][dim]) for dim in dims)
+    coords = cube['coords'][:, axes]
+
+    n_cells = int(np.prod(shape))
+    flat = np.ravel_multi_index(coords.T, shape) if len(coords) else np.array([], dtype=np.int64)
+    sums = {
+        measure: np.bincount(flat, weights=cube[measure], minlength=n_cells).astype(cube[measure].dtype)
+        for measure in _cube_measures(cube)
+    }
+
+    cells = np.flatnonzero(sums['n_bookings'])
+    cell_codes = np.unravel_index(cells, shape)
+    tbl = pd.DataFrame({
+        dim: pd.Series(cube['labels'][dim]).to_numpy()[cell_codes[i]]
+        for i, dim in enumerate(dims)
+    })
+    for measure, values in sums.items():
+        tbl[measure] = values[cells]
+    if dropna:
+        tbl = tbl.dropna(subset=dims).reset_index(drop=True)
+    return tbl
+
+def cube_partial_counts(cube):
+    """Recompte parcial per PARTIAL_KEYS (base de les TAULES 1-6) a partir del cub"""
+    return cube_marginal(cube, PARTIAL_KEYS, dropna=False)
+
+def cube_count_table(cube, dims):
+    """Recompte de reserves per dims amb columna 'count' (format de les TAULES 8 i 9)"""
+    tbl = cube_marginal(cube, dims)
+    counts = tbl['n_bookings'].round().astype('int64')  # Estimacions (float) en un cub ponderat
+    return tbl[list(dims)].assign(count=counts)
+
+def cube_lead_time_frame(cube):
+    """
+    Files (origin_group, lead_time) reconstruïdes del subcub de lead_time
+    Els lead_time són enters, així que la distribució (quantils, mitjana) és exacta
+    """
+    tbl = cube_marginal(cube['lead_time'], ['origin_group', 'lead_time'])
+    counts = tbl['n_bookings'].round().astype('int64')  # Estimacions (float) en un cub ponderat
+    return pd.DataFrame({
+        'origin_group': np.repeat(tbl['origin_group'].to_numpy(), counts),
+        'lead_time': np.repeat(tbl['lead_time'].to_numpy(), counts)
+    })
+
+def create_tables_from_cube(cube, min_bookings=1000):
+    """
+    TAULES 1-6 com a marginals del cub
+    Retorna (volum, cancel·lació hotel/any, país, país×hotel, origen×hotel, flux Sankey)
+    """
+    return create_tables_from_partial(cube_partial_counts(cube), min_bookings)
+
+def parse_cube_filters(query):
+    """Paràmetres de consulta (dict de llistes, com parse_qs) → filtres per dimensió del cub"""
+    filters = {}
+    for name, dim in CUBE_FILTERS.items():
+        values = [v for value in query.get(name, []) for v in value.split(',') if v]
+        if values:
+            filters[dim] = [int(v) if dim == 'arrival_date_year' else v for v in values]
+    return filters
+
+def build_filtered_figure(graph_id, cube, filters, min_bookings=1000):
+    """
+    Genera un gràfic per al subconjunt definit pels filtres, només a partir del cub
+    (el violin 5A surt del subcub de lead_time)
+    """
+    cube = slice_cube(cube, filters)
+    all_tables = create_tables_from_cube(cube, min_bookings)
+    if 'w_var' in cube:  # Cub ponderat del mode aproximat
+        all_tables = tuple(_add_confidence_interval(tbl) for tbl in all_tables)
+    return build_dashboard_figure(graph_id, None, all_tables[:4], flow_data=all_tables[5], cube=cube)
+
+# ============================================================================
+# FASE 2F: ÍNDEX DE FILES PER GRUP
+# ============================================================================
+
+# Els gràfics que necessiten files (i no recomptes), com el violin de lead_time, abans
+# seleccionaven cada grup amb una màscara (df[df['origin_group'] == origin]): un recorregut
+# O(N) i un DataFrame nou per grup i per gràfic.
+# L'índex es construeix una vegada a la càrrega: per a cada clau, les posicions de les files
+# ordenades per grup (argsort estable, per tant en l'ordre original dins de cada grup) i el
+# desplaçament on comença cada grup. Un grup és un slice de les posicions (vista, sense
+# còpia) i els gràfics només indexen les columnes que necessiten.
+INDEX_KEYS = ['origin_group', 'hotel', 'country']
+
+def group_offsets(codes, n_groups):
+    """Posicions de les files ordenades per codi de grup i desplaçament de cada grup"""
+    order = np.argsort(codes, kind='stable')
+    offsets = np.zeros(n_groups + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes, minlength=n_groups), out=offsets[1:])
+    return order, offsets
+
+def group_rows(order, offsets, groups):
+    """Posicions (ordenades) de les files dels grups indicats; un sol grup és una vista"""
+    if len(groups) == 1:
+        return order[offsets[groups[0]]:offsets[groups[0] + 1]]
+    rows = [order[offsets[g]:offsets[g + 1]] for g in groups]
+    return np.sort(np.concatenate(rows)) if rows else order[:0]
+
+def build_row_index(df, keys=INDEX_KEYS):
+    """Índex {clau: {'groups': {valor: codi}, 'order', 'offsets'}} de les claus presents a df"""
+    row_index = {}
+    for key in keys:
+        if key not in df:
+            continue
+        codes, uniques = pd.factorize(df[key], sort=True, use_na_sentinel=False)
+        order, offsets = group_offsets(codes, len(uniques))
+        row_index[key] = {
+            'groups': {value: i for i, value in enumerate(uniques.tolist())},
+            'order': order,
+            'offsets': offsets
+        }
+    return row_index
+
+def index_rows(row_index, key, value):
+    """Posicions de les files amb key == value (buit si el valor no hi és)"""
+    entry = row_index[key]
+    group = entry['groups'].get(value)
+    if group is None:
+        return entry['order'][:0]
+    return group_rows(entry['order'], entry['offsets'], [group])
+
+# ============================================================================
+# FASE 2G: MODE APROXIMAT (MOSTRA ESTRATIFICADA AMB INTERVALS DE CONFIANÇA)
+# ============================================================================
+
+# Previsualitzacions ràpides sobre extraccions grans: les taules es calculen sobre una
+# mostra estratificada per país × hotel en lloc de totes les reserves.
+# - Mostreig de Poisson dins de cada estrat: cada fila entra amb probabilitat π de l'estrat
+#   (la fracció demanada, però mai menys de APPROX_MIN_PER_STRATUM files esperades, perquè
+#   els mercats petits no desapareguin) i pesa w = 1/π
+# - Els recomptes i les taxes són estimadors ponderats (Horvitz-Thompson) i cada taxa porta
+#   un interval de confiança del 95% (ci_low_pct / ci_high_pct), que surt als tooltips
+# - Els estrats amb π = 1 entren sencers i no aporten variància
+# El mode exacte (per defecte) continua sent el de la versió publicada.
+APPROX_STRATA = ['country', 'hotel']
+APPROX_MIN_PER_STRATUM = 30
+APPROX_Z = 1.96  # Interval del 95%
+
+def stratified_sample(df, fraction, strata=APPROX_STRATA, min_per_stratum=APPROX_MIN_PER_STRATUM, seed=0):
+    """
+    Mostra estratificada de df
+    Retorna (posicions de les files seleccionades, pes de cada fila seleccionada)
+    """
+    stratum = df.groupby(strata, dropna=False, sort=False).ngroup().to_numpy()
+    sizes = np.bincount(stratum)
+    probs = np.clip(np.maximum(fraction, min_per_stratum / sizes), 0, 1)
+
+    rng = np.random.default_rng(seed)
+    positions = np.flatnonzero(rng.random(len(df)) < probs[stratum])
+    return positions, 1 / probs[stratum[positions]]
+
+def _add_confidence_interval(tbl):
+    """
+    Interval de confiança de cancel_rate_pct a partir de les APPROX_MEASURES
+    Var(p) ≈ Σ w(w-1)·(y - p)² / N² (y binària), i els recomptes s'arrodoneixen per mostrar-los
+    Les APPROX_MEASURES es mantenen perquè les taules derivades (p. ex. els nodes del treemap)
+    puguin sumar-les i recalcular l'interval
+    """
+    if 'w_var' in tbl:
+        p = tbl['cancel_rate']
+        variance = (tbl['w_var_canceled'] * (1 - 2 * p) + p ** 2 * tbl['w_var']) / tbl['n_bookings'] ** 2
+        margin = APPROX_Z * np.sqrt(variance.clip(lower=0)) * 100
+        tbl['ci_low_pct'] = (tbl['cancel_rate_pct'] - margin).clip(lower=0)
+        tbl['ci_high_pct'] = (tbl['cancel_rate_pct'] + margin).clip(upper=100)
+    for col in ('n_bookings', 'n_canceled', 'count'):
+        if col in tbl:
+            tbl[col] = tbl[col].round().astype('int64')
+    return tbl
+
+def create_tables_approx(df_sample, weights, min_bookings=1000):
+    """
+    TAULES 1-6 estimades a partir d'una mostra ponderada (stratified_sample)
+    Retorna (taules, cub ponderat); el cub dona també les TAULES 8 i 9 estimades
+    """
+    cube = build_booking_cube(df_sample, weights=weights)
+    all_tables = create_tables_from_cube(cube, min_bookings)
+    return tuple(_add_confidence_interval(tbl) for tbl in all_tables), cube
+
+# ============================================================================
+# FASE 2H: INFERÈNCIA ESTADÍSTICA PER PAÍS I PAÍS × HOTEL
+# ============================================================================
+
+# La història afirma que PRT cancel·la més que la resta de mercats: per a cada cel·la
+# (país o país × hotel) es calcula, en una sola operació vectoritzada sobre tota la taula,
+# - l'interval de Wilson del 95% de la taxa de cancel·lació (correcte també amb pocs casos)
+# - un test z de dues proporcions de la cel·la contra la resta de reserves (mitjana global
+#   sense la cel·la), amb p-valor bilateral
+# No cal scipy: la cua normal es calcula amb l'aproximació d'erfc d'Abramowitz-Stegun
+# (7.1.26, error < 1.5e-7), també vectoritzada.
+INFERENCE_Z = 1.96  # 95%
+SIGNIFICANCE_LEVEL = 0.05
+
+def _erfc(x):
+    """erfc(x) per a x >= 0 (vectoritzat)"""
+    t = 1 / (1 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return poly * np.exp(-x ** 2)
+
+def wilson_interval(n_canceled, n_bookings, z=INFERENCE_Z):
+    """Interval de Wilson (en proporció) per a cada parella de recomptes"""
+    k = np.asarray(n_canceled, dtype=np.float64)
+    n = np.asarray(n_bookings, dtype=np.float64)
+    p = k / n
+    denom = 1 + z ** 2 / n
+    center = (p + z ** 2 / (2 * n)) / denom
+    half = z * np.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / denom
+    return center - half, center + half
+
+def two_proportion_ztest(n_canceled, n_bookings, total_canceled, total_bookings):
+    """
+    Test z de cada cel·la contra la resta de reserves (proporció combinada)
+    Retorna (z, p-valor bilateral); z > 0 vol dir que la cel·la cancel·la més que la resta
+    """
+    k = np.asarray(n_canceled, dtype=np.float64)
+    n = np.asarray(n_bookings, dtype=np.float64)
+    rest_n = total_bookings - n
+    pooled = total_canceled / total_bookings
+    with np.errstate(divide='ignore', invalid='ignore'):
+        se = np.sqrt(pooled * (1 - pooled) * (1 / n + 1 / rest_n))
+        z = (k / n - (total_canceled - k) / rest_n) / se
+    return z, _erfc(np.abs(z) / np.sqrt(2))
+
+def add_significance(tbl, total_canceled, total_bookings):
+    """
+    Afegeix a una taula amb n_bookings / n_canceled l'interval de Wilson (wilson_low_pct,
+    wilson_high_pct), el test contra la resta (z_vs_global, p_vs_global) i el veredicte
+    (significance: 'higher' / 'lower' / '' si no és significatiu)
+    """
+    tbl = tbl.copy()
+    low, high = wilson_interval(tbl['n_canceled'], tbl['n_bookings'])
+    z, p_value = two_proportion_ztest(tbl['n_canceled'], tbl['n_bookings'], total_canceled, total_bookings)
+    tbl['wilson_low_pct'] = low * 100
+    tbl['wilson_high_pct'] = high * 100
+    tbl['z_vs_global'] = z
+    tbl['p_vs_global'] = p_value
+    tbl['significance'] = np.select(
+        [(p_value < SIGNIFICANCE_LEVEL) & (z > 0), (p_value < SIGNIFICANCE_LEVEL) & (z < 0)],
+        ['higher', 'lower'], default=''
+    )
+    return tbl
+
+# Text del tooltip per a cada veredicte de add_significance
+SIGNIFICANCE_TEXT = {
+    'higher': '<b>Cancel·la significativament més que la resta</b><br>',
+    'lower': '<b>Cancel·la significativament menys que la resta</b><br>',
+    '': 'Diferència no significativa<br>'
+}
+
+def _significance_text(significance):
+    return significance.map(SIGNIFICANCE_TEXT).to_numpy()
+
+def global_counts(tbl_cancel_hotel):
+    """(cancel·lacions, reserves) totals a partir de la TAULA 2"""
+    return tbl_cancel_hotel['n_canceled'].sum(), tbl_cancel_hotel['n_bookings'].sum()
+
+# ============================================================================
+# FASE 2I: NODES DEL TREEMAP (CONTINENT → PAÍS, AMB PRESSUPOST DE NODES)
+# ============================================================================
+
+# Amb min_bookings baix hi pot haver més de 150 mercats, i el cost del treemap al navegador
+# creix amb el nombre de rectangles. La taula de nodes limita les fulles a max_nodes: els
+# països més petits s'agrupen en un node "Altres" (un per continent en mode jeràrquic).
+# En mode jeràrquic els continents són nodes pare amb la suma dels seus països.
+TREEMAP_MAX_NODES = 40
+TREEMAP_OTHER_LABEL = 'Altres'
+
+# Codis ISO 3166-1 alfa-3 per continent (més els codis antics del conjunt de dades: CN, TMP)
+CONTINENT_COUNTRIES = {
+    'Europa': 'ALA ALB AND AUT BEL BGR BIH BLR CHE CYP CZE DEU DNK ESP EST FIN FRA FRO GBR GGY GIB GRC '
+              'HRV HUN IMN IRL ISL ITA JEY LIE LTU LUX LVA MCO MDA MKD MLT MNE NLD NOR POL PRT ROU RUS '
+              'SJM SMR SRB SVK SVN SWE UKR VAT XKX',
+    'Àsia': 'AFG ARE ARM AZE BGD BHR BRN BTN CHN CN GEO HKG IDN IND IOT IRN IRQ ISR JOR JPN KAZ KGZ KHM '
+            'KOR KWT LAO LBN LKA MAC MDV MMR MNG MYS NPL OMN PAK PHL PRK PSE QAT SAU SGP SYR THA TJK TKM '
+            'TLS TMP TUR TWN UZB VNM YEM',
+    'Àfrica': 'AGO BDI BEN BFA BWA CAF CIV CMR COD COG COM CPV DJI DZA EGY ERI ESH ETH GAB GHA GIN GMB '
+              'GNB GNQ KEN LBR LBY LSO MAR MDG MLI MOZ MRT MUS MWI MYT NAM NER NGA REU RWA SDN SEN SHN '
+              'SLE SOM SSD STP SWZ SYC TCD TGO TUN TZA UGA ZAF ZMB ZWE',
+    'Amèrica del Nord': 'ABW AIA ATG BES BHS BLM BLZ BMU BRB CAN CRI CUB CUW CYM DMA DOM GLP GRD GTM HND '
+                        'HTI JAM KNA LCA MAF MEX MSR MTQ NIC PAN PRI SLV SPM SXM TCA TTO UMI USA VCT VGB VIR',
+    'Amèrica del Sud': 'ARG BOL BRA CHL COL ECU FLK GUF GUY PER PRY SUR URY VEN',
+    'Oceania': 'ASM AUS CCK COK CXR FJI FSM GUM KIR MHL MNP NCL NFK NIU NRU NZL PCN PLW PNG PYF SLB TKL '
+               'TON TUV VUT WLF WSM',
+    'Antàrtida': 'ATA ATF BVT HMD SGS'
+}
+COUNTRY_CONTINENT = {
+    country: continent
+    for continent, countries in CONTINENT_COUNTRIES.items()
+    for country in countries.split()
+}
+UNKNOWN_CONTINENT = 'Desconegut'
+
+@memoized
+def create_tbl_treemap_nodes(tbl_country, max_nodes=TREEMAP_MAX_NODES, hierarchy=False):
+    """
+    TAULA 10: nodes del treemap a partir de la TAULA 3 (país)
+    Columnes id, label, parent, is_leaf + recomptes i taxa; es conserva l'ordre de la TAULA 3
+    i les columnes addicionals de les fulles (p. ex. l'interval del mode aproximat)
+    """
+    leaves = tbl_country.rename(columns={'country': 'label'}).reset_index(drop=True)
+    leaves['parent'] = leaves['label'].map(COUNTRY_CONTINENT).fillna(UNKNOWN_CONTINENT) if hierarchy else ''
+    n_parents = leaves['parent'].nunique() if hierarchy else 0
+    # Nodes agregats: suma de recomptes (i de les APPROX_MEASURES, per recalcular-ne l'interval)
+    measures = ['n_bookings', 'n_canceled'] + [m for m in APPROX_MEASURES if m in leaves]
+
+    # Pressupost: max_nodes compta tots els nodes emesos (fulles, "Altres" i pares). Les fulles
+    # més grans es mantenen; la resta s'agrupa per pare a "Altres", excepte si d'un pare només
+    # en queda una, que es manté com a fulla. Amb jerarquia el mínim és de dos nodes per pare
+    budget = max_nodes - n_parents if max_nodes else None
+    nodes = [leaves]
+    if budget is not None and len(leaves) > budget:
+        rank = leaves['n_bookings'].rank(method='first', ascending=False)
+        last_rank = rank.groupby(leaves['parent']).max()
+        # Mantenint les k fulles més grans s'emeten k nodes + un per pare amb fulles petites
+        keep = next((k for k in range(len(leaves), 0, -1) if k + (last_rank > k).sum() <= budget), 0)
+        small = rank > keep
+        folded = small & (small.groupby(leaves['parent']).transform('sum') >= 2)
+        other = leaves[folded].groupby('parent', sort=False)[measures].sum().reset_index()
+        other['label'] = TREEMAP_OTHER_LABEL
+        nodes = [leaves[~folded], _add_confidence_interval(_add_cancel_rate(other))]
+
+    tbl = pd.concat(nodes, ignore_index=True).assign(is_leaf=True)
+    if hierarchy:
+        parents = tbl.groupby('parent', sort=False)[measures].sum().reset_index()
+        parents = _add_confidence_interval(_add_cancel_rate(parents.rename(columns={'parent': 'label'})))
+        parents = parents.assign(parent='', is_leaf=False)
+        tbl = pd.concat([tbl, parents], ignore_index=True)
+    tbl['id'] = np.where(tbl['parent'] == '', tbl['label'], tbl['parent'] + '/' + tbl['label'])
+    return tbl
+
+# ============================================================================
+# FASE 3: GRÀFICS PLOTLY (VERSIÓ AVANÇADA)
+# ============================================================================
+
+# Traces amb molts punts: per sobre de WEBGL_POINT_THRESHOLD punts les traces de dispersió
+# es dibuixen amb WebGL (go.Scattergl) en lloc de SVG, que es torna lent a partir de ~50k
+# punts. El violin no té versió WebGL: amb --violin-max-points, la mostra que s'envia al
+# navegador es limita a aquest nombre d'estadístics d'ordre equiespaiats (conserva els
+# quantils; les estadístiques del tooltip es calculen amb totes les dades). Per defecte
+# (0) el violin envia totes les dades, com la versió publicada. La decisió queda a
+# layout.meta['render'] de cada figura.
+WEBGL_POINT_THRESHOLD = 50000
+VIOLIN_MAX_POINTS = 0  # 0 = sense límit
+
+# Opcions dels gràfics del dashboard (línia de comandes); els builders les reben com a
+# arguments, de manera que formen part de la clau de memoització
+FIGURE_OPTIONS = {
+    'treemap_hierarchy': False,
+    'treemap_max_nodes': TREEMAP_MAX_NODES,
+    'webgl_threshold': WEBGL_POINT_THRESHOLD,
+    'violin_max_points': VIOLIN_MAX_POINTS
+}
+
+def configure_figures(**options):
+    """Actualitza FIGURE_OPTIONS (p. ex. als processos del mode batch)"""
+    unknown = set(options) - set(FIGURE_OPTIONS)
+    if unknown:
+        raise KeyError(f"Opcions de gràfic desconegudes: {', '.join(sorted(unknown))}")
+    FIGURE_OPTIONS.update(options)
+
+def scatter_trace(n_points, webgl_threshold=WEBGL_POINT_THRESHOLD, **kwargs):
+    """go.Scatter (SVG) o go.Scattergl (WebGL) segons el nombre de punts"""
+    if n_points >= webgl_threshold:
+        return go.Scattergl(**kwargs)
+    return go.Scatter(**kwargs)
+
+def record_render_mode(fig, **info):
+    """Desa a layout.meta['render'] com s'ha dibuixat la figura"""
+    meta = dict(fig.layout.meta or {})
+    meta['render'] = {**meta.get('render', {}), **info}
+    fig.update_layout(meta=meta)
+
+def downsample_quantiles(values, max_points):
+    """max_points estadístics d'ordre equiespaiats (ordenats) de values, si en té més (0 = tots)"""
+    values = np.asarray(values)
+    if not max_points or len(values) <= max_points:
+        return values
+    positions = np.linspace(0, len(values) - 1, max_points).round().astype(np.int64)
+    return np.sort(values)[positions]
+
+# Tooltips: cada trace porta un sol hovertemplate compartit i les dades de cada punt com a
+# customdata numèric; el format (separador de milers, decimals) el fa Plotly al navegador
+# amb especificadors d3 (p. ex. '%{customdata[0]:,}', '%{x:.1f}%'), en lloc d'enviar un
+# text preformatat per punt.
+def tooltip_template(title, lines):
+    """
+    hovertemplate compartit: títol (p. ex. '<b>%{y}</b>') i línies (etiqueta, camp), on el camp
+    és una referència de Plotly amb format d3
+    """
+    return title + '<br>' + ''.join(f'{label}: {field}<br>' for label, field in lines) + '<extra></extra>'
+
+def tooltip_customdata(*columns):
+    """customdata (una fila per punt) a partir de columnes; cada valor conserva el seu tipus (enter/real)"""
+    return [list(row) for row in zip(*(pd.Series(column).tolist() for column in columns))]
+
+@memoized
+def create_graph1_volume_hotel_year(tbl):
+    """
+    ACTE 1: Distribució del volum de reserves per tipus d'hotel (2015–2017)
+    Stacked Area Chart: mostra evolució temporal i pes relatiu
+    La granularitat (any/mes/setmana/dia) ve donada per la taula d'entrada
+    """
+    time_col = _time_column(tbl)
+
+    # Colors coherents amb la resta del dashboard
+    hotel_colors = {
+        'City Hotel': COLORS['city_hotel'],   # Porpra
+        'Resort Hotel': COLORS['resort_hotel']  # Verd
+    }
+
+    # Matriu període × hotel (una sola passada, sense filtres per cel·la)
+    volume = tbl.pivot_table(index=time_col, columns='hotel', values='n_bookings', aggfunc='sum').sort_index()
+    hotels = sorted(volume.columns)
+    periods = volume.index
+    period_labels = _period_labels(periods)
+    present = volume.notna()
+    volume = volume.fillna(0).astype('int64')
+
+    # Totals per període i percentatge de cada hotel dins del període
+    period_totals = volume.sum(axis=1)
+    pct = volume.div(period_totals.where(period_totals > 0), axis=0).fillna(0) * 100
+
+    fig = go.Figure()
+
+    # Període al tooltip tal com l'etiqueta _period_labels (any o data ISO)
+    period = '%{x}' if time_col == 'arrival_date_year' else '%{x|%Y-%m-%d}'
+
+    # Crear traces per cada hotel (apilades)
+    for hotel in hotels:
+        hover_template = tooltip_template(f'<b>{hotel} - {period}</b>', [
+            ('Reserves', '%{y:,}'),
+            (f'% dins de {period}', '%{customdata[0]:.1f}%'),
+            (f'Total {period}', '%{customdata[1]:,} reserves')
+        ])
+        # Períodes sense reserves d'aquest hotel: y nul (l'apilament hi posa 0 i no tenen tooltip),
+        # de manera que la trace porta una sola plantilla
+        y_values = volume[hotel].astype(object).where(present[hotel], None).tolist()
+        fig.add_trace(go.Scatter(
+            x=periods.tolist(),
+            y=y_values,
+            mode='lines',
+            name=hotel,
+            stackgroup='one',  # Apilar les àrees
+            fill='tonexty' if hotel != hotels[0] else 'tozeroy',
+            line=dict(width=2, color=hotel_colors[hotel]),
+            fillcolor=hotel_colors[hotel],
+            hovertemplate=hover_template,
+            customdata=tooltip_customdata(pct[hotel], period_totals)
+        ))
+
+    # Afegir percentatges com a anotacions dins de cada any (només a granularitat anual,
+    # a granularitats fines hi hauria una anotació per punt)
+    if time_col == 'arrival_date_year':
+        for i, year in enumerate(periods):
+            base_y = 0
+            for hotel in hotels:
+                n_bookings = volume[hotel].iloc[i]
+                pct_year = pct[hotel].iloc[i]
+                if n_bookings > 0 and pct_year > 0:
+                    # Posició Y: base + percentatge de l'alçada de l'àrea
+                    # Per City Hotel (primer): 75% de l'alçada
+                    # Per Resort Hotel (segon): 25% de l'alçada
+                    if hotel == hotels[0]:  # City Hotel (a dalt)
+                        y_pos = base_y + n_bookings * 0.75
+                    else:  # Resort Hotel (a baix)
+                        y_pos = base_y + n_bookings * 0.25
+
+                    fig.add_annotation(
+                        text=f'{pct_year:.0f}%',
+                        x=year,
+                        y=y_pos,
+                        xref='x',
+                        yref='y',
+                        showarrow=False,
+                        font=dict(size=11, color='white'),
+                        bgcolor='rgba(0, 0, 0, 0.6)',
+                        bordercolor='white',
+                        borderwidth=1,
+                        borderpad=4
+                    )
+                base_y += n_bookings
+
+        xaxis = dict(
+            title='Any',
+            tickmode='linear',
+            tick0=2015,
+            dtick=1,
+            tickfont=dict(size=12)
+        )
+    else:
+        xaxis = dict(
+            title='Data d\'arribada',
+            type='date',
+            tickfont=dict(size=12)
+        )
+
+    fig.update_layout(
+        title={
+            'text': 'Distribució del volum de reserves per tipus d\'hotel (2015–2017)<br><sub>El City Hotel concentra de manera consistent la major part del volum</sub>',
+            'x': 0.5,
+            'xanchor': 'center',
+            'font': {'size': 20}
+        },
+        xaxis=xaxis,
+        yaxis=dict(
+            title='Nombre de reserves',
+            tickfont=dict(size=12),
+            gridcolor='rgba(0, 0, 0, 0.1)',
+            gridwidth=1
+        ),
+        template='plotly_white',
+        height=600,
+        margin=dict(l=60, r=20, t=120, b=60),
+        legend=dict(
+            orientation='h',
+            yanchor='bottom',
+            y=1.02,
+            xanchor='right',
+            x=1,
+            font=dict(size=12)
+        ),
+        hovermode='x unified'
+    )
+
+    return fig
+
+@memoized
+def create_graph2_cancel_rate_hotel_year(tbl, webgl_threshold=WEBGL_POINT_THRESHOLD):
+    """
+    ACTE 2: La bretxa de risc entre hotels
+    Dumbbell Plot: mostra la diferència de taxa de cancel·lació entre City i Resort
+    NOVA VISUALITZACIÓ AVANÇADA
+    La granularitat (any/mes/setmana/dia) ve donada per la taula d'entrada
+    Amb webgl_threshold punts o més, les traces es dibuixen amb WebGL
+    """
+    fig = go.Figure()
+
+    time_col = _time_column(tbl)
+    is_yearly = time_col == 'arrival_date_year'
+
+    # Preparar dades per Dumbbell Plot: matrius període × hotel (0 si no hi ha dades)
+    # En mode aproximat la taula porta l'interval de confiança de cada taxa
+    hotel_order = ['Resort Hotel', 'City Hotel']
+    ci_columns = ['ci_low_pct', 'ci_high_pct'] if 'ci_low_pct' in tbl else []
+    pivot = tbl.pivot_table(
+        index=time_col, columns='hotel',
+        values=['cancel_rate_pct', 'n_bookings', 'n_canceled'] + ci_columns, aggfunc='sum'
+    ).sort_index()
+    years = pivot.index.tolist()
+    rates = pivot['cancel_rate_pct'].reindex(columns=hotel_order).fillna(0)
+    bookings = pivot['n_bookings'].reindex(columns=hotel_order).fillna(0).astype('int64')
+    canceled = pivot['n_canceled'].reindex(columns=hotel_order).fillna(0).astype('int64')
+
+    resort_rates = rates['Resort Hotel'].tolist()
+    city_rates = rates['City Hotel'].tolist()
+    resort_bookings = bookings['Resort Hotel'].tolist()
+    city_bookings = bookings['City Hotel'].tolist()
+    resort_canceled = canceled['Resort Hotel'].tolist()
+    city_canceled = canceled['City Hotel'].tolist()
+    differences = (rates['City Hotel'] - rates['Resort Hotel']).tolist()
+    ci = {col: pivot[col].reindex(columns=hotel_order).fillna(0) for col in ci_columns}
+    ci_bounds = {
+        hotel: list(zip(*(ci[col][hotel].tolist() for col in ci_columns))) if ci_columns else [()] * len(years)
+        for hotel in hotel_order
+    }
+    ci_line = 'IC 95%: %{customdata[2]:.1f}–%{customdata[3]:.1f}%<br>' if ci_columns else ''
+
+    # Etiquetes i anotacions només quan hi ha pocs períodes (a granularitat diària saturarien)
+    show_labels = len(years) <= 12
+
+    # Punts de la figura: 3 per segment (amb el separador) + 1 per hotel i període
+    n_points = 5 * len(years)
+    use_webgl = n_points >= webgl_threshold
+
+    # Crear traces per al Dumbbell Plot
+    # 1. Línies que uneixen els punts (dumbbell): una sola trace amb segments separats per None
+    line_x = []
+    line_y = []
+    for i, year in enumerate(years):
+        line_x += [resort_rates[i], city_rates[i], None]
+        line_y += [year, year, None]
+    fig.add_trace(scatter_trace(
+        n_points, webgl_threshold,
+        x=line_x,
+        y=line_y,
+        mode='lines',
+        line=dict(color='#95A5A6', width=3, dash='solid'),
+        showlegend=False,
+        hoverinfo='skip'
+    ))
+
+    # 2. Punts per Resort Hotel (esquerra, verd)
+    fig.add_trace(scatter_trace(
+        n_points, webgl_threshold,
+        x=resort_rates,
+        y=years,
+        mode='markers+text' if show_labels else 'markers',
+        name='Resort Hotel',  # Nom sense cap font personalitzada
+        legendgroup='hotels',
+        marker=dict(
+            size=12,
+            color=COLORS['resort_hotel'],  # Verd (coherent amb dashboard)
+            line=dict(width=2, color='white')
+        ),
+        texttemplate='%{x:.1f}%' if show_labels else None,
+        textposition='middle left',
+        textfont=dict(size=10, color=COLORS['resort_hotel']),
+        hovertemplate='<b>Resort Hotel - %{y}</b><br>' +
+                      'Taxa: %{x:.1f}%<br>' +
+                      ci_line +
+                      'Reserves: %{customdata[0]:,}<br>' +
+                      'Cancel·lades: %{customdata[1]:,}<br>' +
+                      '<extra></extra>',
+        customdata=[(n, k) + ci for n, k, ci in zip(resort_bookings, resort_canceled, ci_bounds['Resort Hotel'])]
+    ))
+
+    # 3. Punts per City Hotel (dreta, porpra) - més visible
+    fig.add_trace(scatter_trace(
+        n_points, webgl_threshold,
+        x=city_rates,
+        y=years,
+        mode='markers+text' if show_labels else 'markers',
+        name='City Hotel',  # Nom sense cap font personalitzada
+        legendgroup='hotels',
+        marker=dict(
             size=15,  # Punt més gran (era 12)
             color=COLORS['city_hotel'],  # Porpra (coherent amb dashboard)
             line=dict(width=3, color='white')  # Contorn més marcat (era 2)
         ),
-        text=[f'{c:.1f}%' for c in city_rates],
+        texttemplate='%{x:.1f}%' if show_labels else None,
         textposition='middle right',
         textfont=dict(size=10, color=COLORS['city_hotel']),
         hovertemplate='<b>City Hotel - %{y}</b><br>' +
                       'Taxa: %{x:.1f}%<br>' +
+                      ci_line +
                       'Reserves: %{customdata[0]:,}<br>' +
                       'Cancel·lades: %{customdata[1]:,}<br>' +
                       '<extra></extra>',
-        customdata=list(zip(city_bookings, city_canceled))
+        customdata=[(n, k) + ci for n, k, ci in zip(city_bookings, city_canceled, ci_bounds['City Hotel'])]
     ))
-    
+
     # 4. Anotacions amb diferències (només per anys amb diferència significativa)
     annotations = []
     for i, year in enumerate(years):
-        if abs(differences[i]) > 5:  # Només si la diferència és >5 punts
+        if show_labels and abs(differences[i]) > 5:  # Només si la diferència és >5 punts
             # Posició al mig de la línia
             mid_x = (resort_rates[i] + city_rates[i]) / 2
             diff_text = f"+{differences[i]:.1f} pp" if differences[i] > 0 else f"{differences[i]:.1f} pp"
@@ -402,9 +1752,9 @@ def create_graph2_cancel_rate_hotel_year(tbl):
             'font': {'size': 20}
         },
         xaxis_title='Taxa de cancel·lació (%)',
-        yaxis_title='Any',
+        yaxis_title='Any' if is_yearly else 'Període',
         xaxis=dict(
-            range=[25, 50],  # Escala fins a 50% (suficient per les dades)
+            range=[25, 50] if is_yearly else None,  # Escala fins a 50% (suficient per les dades anuals)
             title_standoff=5,
             showgrid=True,
             gridcolor='#ecf0f1',
@@ -419,9 +1769,9 @@ def create_graph2_cancel_rate_hotel_year(tbl):
             tickvals=years,
             ticktext=[str(y) for y in years],
             showgrid=False  # Sense grid vertical per no competir amb les línies
-        ),
+        ) if is_yearly else dict(type='date', showgrid=False),
         template='plotly_white',
-        height=400,
+        height=400 if show_labels else 700,
         hovermode='closest',
         showlegend=True,
         legend=dict(
@@ -440,9 +1790,12 @@ def create_graph2_cancel_rate_hotel_year(tbl):
         ),
         annotations=annotations
     )
+    record_render_mode(fig, trace_type='scattergl' if use_webgl else 'scatter', points=n_points,
+                       webgl_threshold=webgl_threshold)
     
     return fig
 
+@memoized
 def create_graph3_country_cancel_rate(tbl_country, tbl_country_hotel):
     """
     ACTE 3: Vista analítica secundària - Comparació entre mercats
@@ -454,8 +1807,8 @@ def create_graph3_country_cancel_rate(tbl_country, tbl_country_hotel):
         hotel_dominant[country] = group.loc[group['n_bookings'].idxmax(), 'hotel']
     
     # Afegir hotel dominant a la taula principal
-    tbl_country['hotel_dominant'] = tbl_country['country'].map(hotel_dominant)
-    tbl_country['is_prt'] = tbl_country['country'] == 'PRT'
+    tbl_country = tbl_country.assign(hotel_dominant=tbl_country['country'].map(hotel_dominant),
+                                     is_prt=tbl_country['country'] == 'PRT')
     
     # Ordenar per taxa de cancel·lació (descendent) - PRT a dalt
     tbl_country = tbl_country.sort_values('cancel_rate_pct', ascending=False)
@@ -485,37 +1838,39 @@ def create_graph3_country_cancel_rate(tbl_country, tbl_country_hotel):
     max_diameter = 50  # Reduït per evitar mides extremes
     sizes_list = (min_diameter + (np.sqrt(tbl_country['n_bookings'] / max_size) * (max_diameter - min_diameter))).tolist()
     
-    # Formatar dades per al tooltip
-    cancel_rates_formatted = [f"{rate:.1f}%" for rate in tbl_country['cancel_rate_pct']]
-    bookings_formatted = [f"{n:,}" for n in tbl_country['n_bookings']]
-    canceled_formatted = [f"{n:,}" for n in tbl_country['n_canceled']]
-    
     # Calcular impacte (cancel·lacions absolutes) per destacar PRT
     prt_row = tbl_country[tbl_country['country'] == 'PRT']
     prt_canceled = prt_row['n_canceled'].values[0] if len(prt_row) > 0 else 0
     prt_rate = prt_row['cancel_rate_pct'].values[0] if len(prt_row) > 0 else 0
     prt_bookings = prt_row['n_bookings'].values[0] if len(prt_row) > 0 else 0
     
-    # Preparar text per als bubbles: només PRT i països grans
-    bubble_texts = []
-    bubble_text_sizes = []
-    for idx, row in tbl_country.iterrows():
-        country = row['country']
-        bookings = row['n_bookings']
-        # Mostrar text només per PRT i països amb >10k reserves
-        if row['is_prt']:
-            bubble_texts.append(f"{bookings:,}")
-            bubble_text_sizes.append(11)
-        elif bookings > 10000:  # GBR, FRA, etc.
-            bubble_texts.append(f"{bookings:,}")
-            bubble_text_sizes.append(9)
-        else:
-            bubble_texts.append('')  # Sense text per la resta
-            bubble_text_sizes.append(9)
+    # Text dels bubbles (volum, format al navegador): només PRT i països amb >10k reserves
+    show_text = tbl_country['is_prt'] | (tbl_country['n_bookings'] > 10000)
+    bubble_texts = np.where(show_text, '%{customdata[0]:,}', '').tolist()
+    bubble_text_sizes = np.where(tbl_country['is_prt'], 11, 9).tolist()
     
     # Line widths: més gruixut per PRT
     line_widths = [3 if row['is_prt'] else 1 for _, row in tbl_country.iterrows()]
     
+    # Inferència (add_significance): Wilson i test contra la resta per país i per país × hotel
+    significance_columns = []
+    significance_lines = ''
+    if 'wilson_low_pct' in tbl_country:
+        significance_lines += ('IC 95% (Wilson): %{customdata[2]:.1f}–%{customdata[3]:.1f}%<br>'
+                               'vs. resta: z = %{customdata[4]:.2f}, p = %{customdata[5]:.2g}<br>'
+                               '%{customdata[6]}')
+        significance_columns += [tbl_country[col] for col in
+                                 ('wilson_low_pct', 'wilson_high_pct', 'z_vs_global', 'p_vs_global')]
+        significance_columns.append(_significance_text(tbl_country['significance']))
+        if 'significance' in tbl_country_hotel:
+            # Taxa de cada hotel del país amb ▲/▼ si difereix significativament de la resta
+            marks = tbl_country_hotel['significance'].map({'higher': ' ▲', 'lower': ' ▼', '': ''})
+            hotel_text = (tbl_country_hotel['hotel'] + ': ' + tbl_country_hotel['cancel_rate_pct'].round(1).astype(str)
+                          + '%' + marks)
+            by_country = hotel_text.groupby(tbl_country_hotel['country']).agg(' | '.join)
+            significance_lines += '%{customdata[7]}<br>'
+            significance_columns.append(tbl_country['country'].map(by_country).fillna(''))
+    
     # Convertir Series a llistes per evitar problemes de serialització
     x_values = tbl_country['cancel_rate_pct'].tolist()
     y_values = tbl_country['country'].tolist()
@@ -533,19 +1888,16 @@ def create_graph3_country_cancel_rate(tbl_country, tbl_country_hotel):
             line=dict(width=line_widths, color=line_colors),
             opacity=opacities
         ),
-        text=bubble_texts,
+        texttemplate=bubble_texts,
         textposition='middle center',
         textfont=dict(size=bubble_text_sizes, color='white'),
         hovertemplate='<b>%{y}</b><br>' +
-                      'Taxa cancel·lació: %{customdata[0]}<br>' +
-                      'Reserves: %{customdata[1]}<br>' +
-                      'Cancel·lades: %{customdata[2]}<br>' +
+                      'Taxa cancel·lació: %{x:.1f}%<br>' +
+                      'Reserves: %{customdata[0]:,}<br>' +
+                      'Cancel·lades: %{customdata[1]:,}<br>' +
+                      significance_lines +
                       '<extra></extra>',
-        customdata=list(zip(
-            cancel_rates_formatted,
-            bookings_formatted,
-            canceled_formatted
-        )),
+        customdata=tooltip_customdata(tbl_country['n_bookings'], tbl_country['n_canceled'], *significance_columns),
         showlegend=False
     ))
     
@@ -594,32 +1946,47 @@ def create_graph3_country_cancel_rate(tbl_country, tbl_country_hotel):
     
     return fig
 
+@memoized
 def create_graph3b_treemap_country(tbl_country):
     """
     ACTE 3B: Treemap jeràrquic per país
     Vista alternativa d'impacte de risc per mercat
     Àrea = volum de reserves, Color = taxa de cancel·lació
+    tbl_country pot ser la TAULA 3 (treemap pla) o la taula de nodes (TAULA 10), que afegeix
+    el nivell continent i els nodes "Altres" del pressupost de nodes
     """
     # Preparar dades per al treemap
-    # Crear jerarquia: País → volum i color per taxa
-    # Passar taxa com a customdata per poder-la mostrar al texttemplate
+    if 'parent' not in tbl_country:
+        tbl_country = create_tbl_treemap_nodes(tbl_country, max_nodes=None)
+    hierarchical = bool((tbl_country['parent'] != '').any())
     cancel_rates = tbl_country['cancel_rate_pct'].tolist()
-    countries = tbl_country['country'].tolist()
+    labels = tbl_country['label'].tolist()
     bookings = tbl_country['n_bookings'].tolist()
     
-    # Calcular total per determinar quins rectangles són petits
-    total_bookings = sum(bookings)
+    # Línies addicionals del tooltip segons les columnes de la taula:
+    # interval del mode aproximat i/o inferència contra la mitjana global (add_significance)
+    hover_columns = []
+    hover_lines = ''
+    if 'ci_low_pct' in tbl_country:
+        hover_lines += 'IC 95%: %{customdata[0]:.1f}–%{customdata[1]:.1f}%<br>'
+        hover_columns += ['ci_low_pct', 'ci_high_pct']
+    if 'wilson_low_pct' in tbl_country:
+        i = len(hover_columns)
+        hover_lines += (f'IC 95% (Wilson): %{{customdata[{i}]:.1f}}–%{{customdata[{i + 1}]:.1f}}%<br>'
+                        f'vs. resta: z = %{{customdata[{i + 2}]:.2f}}, p = %{{customdata[{i + 3}]:.2g}}<br>'
+                        f'%{{customdata[{i + 4}]}}')
+        hover_columns += ['wilson_low_pct', 'wilson_high_pct', 'z_vs_global', 'p_vs_global', 'significance_text']
+        tbl_country = tbl_country.assign(significance_text=_significance_text(tbl_country['significance']))
     
-    # Preparar text template: només país per rectangles grans, només codi per petits
-    text_templates = []
-    for i, country in enumerate(countries):
-        pct_total = (bookings[i] / total_bookings * 100) if total_bookings > 0 else 0
-        # Si representa >3% del total, mostrar nom complet, sinó només codi
-        if pct_total > 3:
-            text_templates.append(f'<b>{country}</b><br>{bookings[i]:,}<br>Taxa: {cancel_rates[i]:.1f}%')
-        else:
-            # Només mostrar codi del país
-            text_templates.append(f'<b>{country}</b>')
+    # Calcular total (de les fulles) per determinar quins rectangles són petits
+    total_bookings = tbl_country.loc[tbl_country['is_leaf'], 'n_bookings'].sum()
+    
+    # Text de cada rectangle com a plantilla que Plotly omple al navegador (sense formatar
+    # cada node en Python): nom, volum i taxa si representa >3% del total, si no només el codi
+    pct_total = tbl_country['n_bookings'].to_numpy() / total_bookings * 100 if total_bookings > 0 else 0
+    text_templates = np.where(
+        pct_total > 3, '<b>%{label}</b><br>%{value:,}<br>Taxa: %{color:.1f}%', '<b>%{label}</b>'
+    ).tolist()
     
     # Escala de color més perceptual i progressiva (verd → groc → vermell)
     # Més punts intermedis per transició més suau
@@ -633,8 +2000,9 @@ def create_graph3b_treemap_country(tbl_country):
     ]
     
     fig = go.Figure(go.Treemap(
-        labels=countries,
-        parents=[''] * len(tbl_country),  # Tots són fills del root
+        ids=tbl_country['id'].tolist() if hierarchical else None,
+        labels=labels,
+        parents=tbl_country['parent'].tolist(),  # '' = fill del root (o continent en mode jeràrquic)
         values=bookings,  # Àrea proporcional al volum
         marker=dict(
             colors=cancel_rates,  # Color per taxa
@@ -646,12 +2014,13 @@ def create_graph3b_treemap_country(tbl_country):
             ),
             line=dict(width=2, color='white')
         ),
-        text=text_templates,
-        textinfo='text',
+        texttemplate=text_templates,
         hovertemplate='<b>%{label}</b><br>' +
                       'Reserves: %{value:,}<br>' +
                       'Taxa cancel·lació: %{color:.1f}%<br>' +
+                      hover_lines +
                       '<extra></extra>',
+        customdata=tbl_country[hover_columns].to_numpy(dtype=object) if hover_columns else None,
         branchvalues='total'
     ))
     
@@ -669,14 +2038,17 @@ def create_graph3b_treemap_country(tbl_country):
     
     return fig
 
-def create_graph4_sankey_flow(df):
+@memoized
+def create_graph4_sankey_flow(df, flow_data=None):
     """
     ACTE 4: Sankey diagram - Flux de reserves
     Origen → Tipus d'hotel → Estat final (cancel·lada / no)
     NOVA VISUALITZACIÓ AVANÇADA
+    flow_data (TAULA 6) es pot passar ja calculada (p. ex. pel mode fragmentat)
     """
     # Preparar dades per Sankey
-    flow_data = create_tbl_sankey_flow(df)
+    if flow_data is None:
+        flow_data = create_tbl_sankey_flow(df)
     
     # Crear nodes únics amb índexs
     # Nivell 1: Origen
@@ -816,6 +2188,7 @@ def create_graph4_sankey_flow(df):
     
     return fig
 
+@memoized
 def create_graph4_fallback(flow_data):
     """
     Fallback si el Sankey no funciona: barres apilades per mostrar el flux
@@ -844,16 +2217,24 @@ def create_graph4_fallback(flow_data):
     
     return fig
 
-def create_graph5a_lead_time(df):
+@memoized
+def create_graph5a_lead_time(df, row_index=None, max_points=VIOLIN_MAX_POINTS):
     """
     ACTE 5A: Lead time (violin plot)
     Limitant outliers per millor visualització
+    row_index (build_row_index) es pot passar ja construït per no recalcular els grups
+    Amb max_points, cada violin envia com a màxim max_points punts (downsample_quantiles)
     """
     fig = go.Figure()
+    violin_points = {}
+    
+    if row_index is None or 'origin_group' not in row_index:
+        row_index = build_row_index(df, ['origin_group'])
+    lead_time = df['lead_time'].to_numpy()
     
     origins = ['Local (PRT)', 'International']
     for origin in origins:
-        data = df[df['origin_group'] == origin]['lead_time'].dropna()
+        data = pd.Series(lead_time[index_rows(row_index, 'origin_group', origin)]).dropna()
         if len(data) > 0:
             # Limitar a percentil 95 per evitar cues extremes
             p95 = data.quantile(0.95)
@@ -866,12 +2247,15 @@ def create_graph5a_lead_time(df):
             mean_val = data.mean()
             max_val = data.max()
             
-            # Per violin plots, cal passar x repetit per cada punt
-            x_values = [origin] * len(data_filtered)
+            # Mostra enviada al navegador (les estadístiques del tooltip usen totes les dades)
+            y_values = downsample_quantiles(data_filtered.to_numpy(), max_points)
+            violin_points[origin] = [len(y_values), len(data_filtered)]
+            
+            # Posició de la categoria amb x0 (un sol valor, no repetit per cada punt)
             fig.add_trace(
                 go.Violin(
-                    y=data_filtered.tolist(),
-                    x=x_values,
+                    y=y_values.tolist(),
+                    x0=origin,
                     name=origin,
                     box_visible=True,
                     box_fillcolor='white',  # Box blanc per destacar mediana
@@ -913,51 +2297,34 @@ def create_graph5a_lead_time(df):
         height=400,
         showlegend=True
     )
+    record_render_mode(fig, trace_type='violin', points=violin_points, max_points=max_points)
     
     return fig
 
-def create_graph5b_booking_changes(df):
+@memoized
+def create_graph5b_booking_changes(df, changes_counts=None):
     """
     ACTE 5B: Booking changes (histograma agrupat)
     Mostra la distribució de freqüències de canvis per origen
+    changes_counts (TAULA 8) es pot passar ja calculada (p. ex. des del cub de filtres)
     """
-    fig = go.Figure()
-    
-    origins = ['Local (PRT)', 'International']
-    
-    # Agrupar canvis: 0, 1, 2, 3, 4, 5+
-    def categorize_changes(x):
-        if x == 0:
-            return '0'
-        elif x == 1:
-            return '1'
-        elif x == 2:
-            return '2'
-        elif x == 3:
-            return '3'
-        elif x == 4:
-            return '4'
-        else:
-            return '5+'
+    fig = go.Figure()
     
-    # Preparar dades
-    changes_data = df.copy()
-    changes_data['changes_cat'] = changes_data['booking_changes'].apply(categorize_changes)
+    origins = ['Local (PRT)', 'International']
+    categories = CHANGES_CATEGORIES
     
-    categories = ['0', '1', '2', '3', '4', '5+']
+    # Recomptes origen × categoria de canvis (0, 1, 2, 3, 4, 5+)
+    if changes_counts is None:
+        changes_counts = create_tbl_booking_changes(df)
+    counts_matrix = changes_counts.pivot_table(
+        index='origin_group', columns='changes_cat', values='count', aggfunc='sum'
+    ).reindex(index=origins, columns=categories).fillna(0).astype('int64')
     
     for origin in origins:
-        data_origin = changes_data[changes_data['origin_group'] == origin]
-        total = len(data_origin)
-        
         # Calcular percentatges per categoria
-        pct_values = []
-        counts = []
-        for cat in categories:
-            count = len(data_origin[data_origin['changes_cat'] == cat])
-            counts.append(count)
-            pct = (count / total * 100) if total > 0 else 0
-            pct_values.append(pct)
+        counts = counts_matrix.loc[origin].tolist()
+        total = sum(counts)
+        pct_values = [(count / total * 100) if total > 0 else 0 for count in counts]
         
         fig.add_trace(go.Bar(
             name=origin,
@@ -989,13 +2356,16 @@ def create_graph5b_booking_changes(df):
     
     return fig
 
-def create_graph5c_deposit_type(df):
+@memoized
+def create_graph5c_deposit_type(df, deposit_counts=None):
     """
     ACTE 5C: Deposit type (barres apilades al 100%)
+    deposit_counts (TAULA 9) es pot passar ja calculada (p. ex. des del cub de filtres)
     """
     fig = go.Figure()
     
-    deposit_counts = df.groupby(['origin_group', 'deposit_type']).size().reset_index(name='count')
+    if deposit_counts is None:
+        deposit_counts = create_tbl_deposit_type(df)
     
     # Calcular percentatges per grup
     deposit_pct_list = []
@@ -1089,24 +2459,278 @@ def create_graph5c_deposit_type(df):
 # FASE 4: GENERACIÓ HTML
 # ============================================================================
 
-def generate_html_v3(figures, output_file='index.html'):
+# Identificadors dels contenidors dels gràfics, en l'ordre de la llista de figures
+FIGURE_IDS = ['graph1', 'graph2', 'graph3', 'graph4', 'graph5a', 'graph5b', 'graph5c']
+
+# Configuració de Plotly.newPlot: sense 'responsive' (cada gràfic escoltaria el resize de la
+# finestra i es tornaria a dibuixar encara que fos fora de pantalla). El gestor de resize de
+# build_script_v3 redimensiona, amb debounce, només els gràfics visibles; la resta, quan
+# tornen a entrar a la pantalla.
+PLOT_CONFIG = '{responsive: false}'
+RESIZE_DEBOUNCE_MS = 150
+
+def quantize_figures(figure_dicts):
+    """
+    Arrodoneix les traces de cada figura (quantize_trace)
+    Retorna els bytes de les traces per figura: [(graph_id, abans, després)]
+    """
+    sizes = []
+    for graph_id, figure in zip(FIGURE_IDS, figure_dicts):
+        before = len(pio.json.to_json_plotly(figure['data']))
+        for trace in figure['data']:
+            quantize_trace(trace)
+        sizes.append((graph_id, before, len(pio.json.to_json_plotly(figure['data']))))
+    return sizes
+
+# Plantilla comuna: tots els gràfics usen template='plotly_white', i to_json() l'expandeix
+# sencera (~6,5 KB: colorways, eixos, valors per defecte de cada tipus de trace) a cada figura.
+# En exportar, la plantilla es treu de les figures que la comparteixen i s'emet una sola
+# vegada com a constant JS (dashboardTemplate); withTemplate() la torna a posar al layout
+# al navegador abans de Plotly.newPlot.
+def export_figures_json(figures):
+    """
+    JSON de cada figura sense la plantilla comuna (la de la primera figura)
+    Retorna (llista de JSON, JSON de la plantilla o None, estadístiques); les figures amb una
+    plantilla diferent la conserven. Les estadístiques (report_export) són els bytes de les
+    traces abans i després d'arrodonir-les i els de la plantilla compartida
+    """
+    figure_dicts = [fig.to_plotly_json() for fig in figures]
+    stats = {'quantize': quantize_figures(figure_dicts), 'template': None}
+    template = figure_dicts[0]['layout'].get('template') if figure_dicts else None
+    if template is None:
+        return [pio.json.to_json_plotly(figure) for figure in figure_dicts], None, stats
+
+    n_shared = 0
+    for figure in figure_dicts:
+        if figure['layout'].get('template') == template:
+            del figure['layout']['template']
+            n_shared += 1
+    figures_json = [pio.json.to_json_plotly(figure) for figure in figure_dicts]
+    template_json = pio.json.to_json_plotly(template)
+
+    # Bytes: plantilla repetida a cada figura vs. emesa una vegada
+    stats['template'] = {'bytes': len(template_json.encode('utf-8')), 'n_shared': n_shared,
+                         'figures_bytes': sum(len(figure.encode('utf-8')) for figure in figures_json)}
+    return figures_json, template_json, stats
+
+def report_export(stats):
+    """Informe de bytes de export_figures_json: precisió de les traces i plantilla comuna"""
+    sizes = stats['quantize']
+    total_before = sum(before for _, before, _ in sizes)
+    total_after = sum(after for _, _, after in sizes)
+    print("   Precisió de l'exportació: "
+          + ', '.join(f"{graph_id} −{(before - after) / 1024:.1f} KB" for graph_id, before, after in sizes)
+          + f" (traces {total_before / 1024:.0f} KB → {total_after / 1024:.0f} KB)")
+    template = stats['template']
+    if template:
+        before = template['figures_bytes'] + template['n_shared'] * template['bytes']
+        after = template['figures_bytes'] + template['bytes']
+        print(f"   Plantilla comuna: {template['bytes'] / 1024:.1f} KB × {template['n_shared']} gràfics → "
+              f"emesa una vegada; JSON dels gràfics {before / 1024:.0f} KB → {after / 1024:.0f} KB "
+              f"(−{1 - after / before:.0%})")
+
+# Precisió de l'exportació: to_json() escriu els float64 amb fins a 17 xifres, però els
+# tooltips en mostren un o dos decimals. Abans de serialitzar, cada array numèric de les
+# traces s'arrodoneix a la precisió amb què es mostra i es dibuixa:
+# - valors enters → int (sense pèrdua)
+# - camps referenciats als hovertemplate/texttemplate amb format d3 ('.1f', '.2g', '.1%')
+#   → la precisió del format (el text mostrat no canvia)
+# - coordenades i mides (x, y, values, marker.size...) → com a mínim QUANTIZE_RESOLUTION
+#   del rang de l'array (molt per sota d'un píxel)
+# Els camps que es mostren sense format explícit (p. ex. al tooltip per defecte) no es toquen.
+# Els arrays continuen sent llistes JSON (el plotly.js del CDN no llegeix arrays binaris).
+QUANTIZE_RESOLUTION = 1e-4
+QUANTIZE_VISUAL_FIELDS = {'x', 'y', 'z', 'value', 'color', 'size', 'width', 'opacity', 'base'}
+QUANTIZE_FIELD_ALIASES = {'values': 'value', 'colors': 'color'}
+
+# Referències dels templates de Plotly: %{camp} o %{camp:format d3}
+_TEMPLATE_FIELD = re.compile(r'%\{([^}:|]+)(?::([^}]*))?')
+_D3_PRECISION = re.compile(r'\.(\d+)([a-z%]?)$')
+
+def _template_formats(templates):
+    """Camp → conjunt de formats d3 amb què apareix als templates (None = sense format)"""
+    formats = {}
+    for template in templates:
+        for text in ([template] if isinstance(template, str) else template):
+            for field, fmt in _TEMPLATE_FIELD.findall(str(text)):
+                formats.setdefault(field.strip(), set()).add(fmt or None)
+    return formats
+
+def _numeric_values(values):
+    """Array float (NaN per als nuls) si values és una llista numèrica; si no, None"""
+    if isinstance(values, np.ndarray):
+        values = values.tolist()
+    if not isinstance(values, (list, tuple)) or not values:
+        return None
+    if not all(v is None or (isinstance(v, (int, float, np.number)) and not isinstance(v, bool)) for v in values):
+        return None
+    if all(v is None for v in values):
+        return None
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+def _d3_display(value, fmt):
+    """Valor que mostra el format d3 fmt ('.1f', '.1%', '.2g'...): arrodoniment half-up del valor binari exacte (com JS)"""
+    precision, kind = _D3_PRECISION.search(fmt).groups()
+    precision = int(precision)
+    if kind == 'f':
+        return Decimal(value).quantize(Decimal(1).scaleb(-precision), rounding=ROUND_HALF_UP)
+    if kind == '%':
+        return Decimal(value * 100).quantize(Decimal(1).scaleb(-precision), rounding=ROUND_HALF_UP)
+    return Context(prec=max(precision, 1), rounding=ROUND_HALF_UP).plus(Decimal(value))
+
+def _quantize_values(values, formats, visual):
+    """
+    Llista arrodonida a la precisió necessària (vegeu QUANTIZE_RESOLUTION), o None si no
+    es pot arrodonir (camp no numèric o mostrat sense format)
+    """
+    array = _numeric_values(values)
+    if array is None:
+        return None
+    finite = np.isfinite(array)
+    if np.all(array[finite] == np.round(array[finite])) and np.all(np.abs(array[finite]) < 2 ** 53):
+        decimals = np.zeros(len(array))
+    elif formats is None and not visual or formats is not None and None in formats:
+        return None
+    else:
+        decimals = np.full(len(array), -15.0)
+        magnitude = np.floor(np.log10(np.where(finite & (array != 0), np.abs(array), 1)))
+        for fmt in formats or ():
+            match = _D3_PRECISION.search(fmt)
+            if match is None:
+                return None
+            precision, kind = int(match.group(1)), match.group(2)
+            if kind == 'f':
+                decimals = np.maximum(decimals, precision)
+            elif kind == '%':
+                decimals = np.maximum(decimals, precision + 2)
+            elif kind in ('', 'g', 'e', 's', 'p', 'r'):
+                decimals = np.maximum(decimals, precision - 1 - magnitude)
+            else:
+                return None
+        if visual:
+            span = np.ptp(array[finite]) if finite.any() else 0
+            span = span or np.abs(array[finite]).max(initial=0) or 1
+            decimals = np.maximum(decimals, np.ceil(-np.log10(span * QUANTIZE_RESOLUTION)))
+        decimals = np.clip(decimals, -15, 15)
+
+    # Arrodoniment half-up (com toFixed/toPrecision de JS, que fan servir els formats d3)
+    quantized = array.copy()
+    for d in np.unique(decimals[finite]):
+        mask = finite & (decimals == d)
+        scaled = np.floor(np.abs(array[mask]) * 10.0 ** d + 0.5) if d >= 0 else \
+            np.floor(np.abs(array[mask]) / 10.0 ** -d + 0.5)
+        quantized[mask] = np.sign(array[mask]) * (scaled / 10.0 ** d if d >= 0 else scaled * 10.0 ** -d)
+
+    # Doble arrodoniment (p. ex. 46.1538 → 46.15 es mostra '46.1' i no '46.2'): s'acosta el valor
+    # un pas de la graella cap a l'original i, si encara no coincideix, es manté l'original
+    for fmt in formats or ():
+        for i in np.flatnonzero(finite & (quantized != array)):
+            x = array[i]
+            if _d3_display(quantized[i], fmt) == _d3_display(x, fmt):
+                continue
+            step = 10.0 ** -decimals[i] * np.sign(x - quantized[i])
+            nudged = float(np.round(quantized[i] + step, int(max(decimals[i], 0))))
+            quantized[i] = nudged if _d3_display(nudged, fmt) == _d3_display(x, fmt) else x
+            decimals[i] = decimals[i] if quantized[i] != x else 15
+
+    return [None if not ok else (int(v) if d <= 0 else float(v))
+            for v, d, ok in zip(quantized.tolist(), decimals.tolist(), finite.tolist())]
+
+def _quantize_customdata(customdata, formats):
+    """customdata 1D (camp 'customdata') o 2D (camps 'customdata[j]', per columna)"""
+    rows = customdata.tolist() if isinstance(customdata, np.ndarray) else customdata
+    if not isinstance(rows, (list, tuple)) or not rows:
+        return customdata
+    if not all(isinstance(row, (list, tuple)) for row in rows):
+        quantized = _quantize_values(rows, formats.get('customdata'), False)
+        return customdata if quantized is None else quantized
+    columns = [list(column) for column in zip(*rows)]
+    for j, column in enumerate(columns):
+        quantized = _quantize_values(column, formats.get(f'customdata[{j}]'), False)
+        if quantized is not None:
+            columns[j] = quantized
+    return [list(row) for row in zip(*columns)]
+
+def quantize_trace(trace, templates=()):
+    """
+    Arrodoneix in situ els arrays numèrics d'una trace (dict de to_plotly_json) a la precisió
+    amb què es mostren; els templates s'hereten dels nivells superiors (trace → marker...)
+    """
+    templates = list(templates) + [trace[key] for key in ('hovertemplate', 'texttemplate') if key in trace]
+    formats = _template_formats(templates)
+    # Sense hovertemplate, el tooltip per defecte mostra els valors amb tota la precisió
+    default_hover = 'hovertemplate' not in trace and not templates and trace.get('hoverinfo') not in ('skip', 'none')
+    for key, value in trace.items():
+        if isinstance(value, dict):
+            quantize_trace(value, templates)
+        elif key == 'customdata':
+            trace[key] = _quantize_customdata(value, formats)
+        elif key not in ('hovertemplate', 'texttemplate', 'text', 'hovertext', 'ids', 'labels', 'parents'):
+            field = QUANTIZE_FIELD_ALIASES.get(key, key)
+            field_formats = {None} if default_hover and field in QUANTIZE_VISUAL_FIELDS else formats.get(field)
+            quantized = _quantize_values(value, field_formats, field in QUANTIZE_VISUAL_FIELDS)
+            if quantized is not None:
+                trace[key] = quantized
+    return trace
+
+def _template_script(template_json):
+    """JS amb la plantilla comuna (una vegada) i withTemplate() per aplicar-la als layouts sense plantilla"""
+    return f"""        // Plantilla comuna dels gràfics (emesa una vegada; els JSON dels gràfics no la porten)
+        var dashboardTemplate = {template_json};
+        function withTemplate(layout) {{
+            if (layout.template === undefined) {{
+                layout.template = dashboardTemplate;
+            }}
+            return layout;
+        }}
+"""
+
+def _inline_plot_script(figures, template_json=None):
+    """
+    JS que crea els gràfics amb les figures incrustades a l'HTML
+    template_json: plantilla comuna treta de les figures (export_figures_json)
+    """
+    if template_json is None:
+        return '\n'.join(
+            f"        var {graph_id} = {figure};\n"
+            f"        Plotly.newPlot('{graph_id}', {graph_id}.data, {graph_id}.layout, {PLOT_CONFIG});\n"
+            for graph_id, figure in zip(FIGURE_IDS, figures)
+        )
+    return _template_script(template_json) + '\n'.join(
+        f"        var {graph_id} = {figure};\n"
+        f"        Plotly.newPlot('{graph_id}', {graph_id}.data, withTemplate({graph_id}.layout), {PLOT_CONFIG});\n"
+        for graph_id, figure in zip(FIGURE_IDS, figures)
+    )
+
+def _fetch_plot_script(url_template):
+    """JS que demana cada gràfic al servidor (url_template amb {id}) i el crea quan arriba"""
+    return f"""        // Gràfics Plotly (carregats sota demanda des del servidor)
+        {json.dumps(FIGURE_IDS)}.forEach(function(graphId) {{
+            // Els filtres de la pàgina (?hotel=...&year=...) es passen a cada gràfic
+            fetch('{url_template}'.replace('{{id}}', graphId) + window.location.search)
+                .then(function(response) {{ return response.json(); }})
+                .then(function(figure) {{
+                    figure.layout.uirevision = graphId;  // Conserva el zoom si el gràfic s'actualitza
+                    Plotly.newPlot(graphId, figure.data, figure.layout, {PLOT_CONFIG});
+                }});
+        }});
+"""
+
+def generate_html_v3(figures, output_file='index.html', template_json=None):
     """
     Genera l'HTML final amb narrativa i gràfics (VERSIÓ 3)
     Millores: Menú de navegació fixe, indicador de progrés, botó "Tornar a dalt"
+    template_json: plantilla comuna treta de les figures (export_figures_json)
     """
-    html_content = f"""
-<!DOCTYPE html>
-<html lang="ca">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <meta name="description" content="Anàlisi del risc de cancel·lació en reserves hoteleres a Portugal (2015-2017). Visualització narrativa que explora com el volum, el tipus d'hotel i el comportament del client influeixen en el risc de cancel·lació.">
-    <meta name="keywords" content="visualització de dades, hotel bookings, cancel·lació, Portugal, storytelling, dashboard narratiu">
-    <meta name="author" content="PAC 3 - Visualització de Dades">
-    <title>Per què les reserves locals cancel·len més?</title>
-    <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>
-    <style>
-        body {{
+    html_content = build_html_v3("        // Gràfics Plotly\n" + _inline_plot_script(figures, template_json))
+    
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write(html_content)
+    
+    print(f"Dashboard V3 generat: {output_file}")
+
+# Estils de la VERSIÓ 3 (incrustats a l'HTML o escrits com a fitxer CSS del paquet)
+DASHBOARD_CSS_V3 = """        body {
             font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
             line-height: 1.6;
             color: #333;
@@ -1115,22 +2739,25 @@ def generate_html_v3(figures, output_file='index.html'):
             padding: 20px;
             background-color: #f5f5f5;
             scroll-behavior: smooth;
-        }}
+        }
         
-        /* Indicador de progrés de scroll */
-        .scroll-progress {{
+        /* Indicador de progrés de scroll (escalat amb transform: no provoca relayout) */
+        .scroll-progress {
             position: fixed;
             top: 0;
             left: 0;
-            width: 0%;
+            width: 100%;
             height: 4px;
             background: linear-gradient(90deg, #3498DB, #2980B9);
             z-index: 1000;
-            transition: width 0.1s ease;
-        }}
+            transform: scaleX(0);
+            transform-origin: 0 50%;
+            transition: transform 0.1s ease;
+            will-change: transform;
+        }
         
         /* Menú de navegació fixe */
-        .nav-menu {{
+        .nav-menu {
             position: fixed;
             top: 4px;
             left: 50%;
@@ -1147,9 +2774,9 @@ def generate_html_v3(figures, output_file='index.html'):
             justify-content: center;
             max-width: 1400px;
             width: calc(100% - 40px);
-        }}
+        }
         
-        .nav-menu a {{
+        .nav-menu a {
             color: #34495e;
             text-decoration: none;
             padding: 8px 15px;
@@ -1158,46 +2785,46 @@ def generate_html_v3(figures, output_file='index.html'):
             font-weight: 500;
             transition: all 0.3s ease;
             white-space: nowrap;
-        }}
+        }
         
-        .nav-menu a:hover {{
+        .nav-menu a:hover {
             background-color: #3498DB;
             color: white;
             transform: translateY(-2px);
-        }}
+        }
         
-        .nav-menu a.active {{
+        .nav-menu a.active {
             background-color: #2980B9;
             color: white;
-        }}
+        }
         
         /* Espai per al menú fixe */
-        .content-wrapper {{
+        .content-wrapper {
             padding-top: 60px;
-        }}
+        }
         
-        .header {{
+        .header {
             text-align: center;
             margin-bottom: 40px;
             padding: 30px;
             background: white;
             border-radius: 10px;
             box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-        }}
+        }
         
-        h1 {{
+        h1 {
             color: #2c3e50;
             font-size: 2.5em;
             margin-bottom: 10px;
-        }}
+        }
         
-        .subtitle {{
+        .subtitle {
             color: #7f8c8d;
             font-size: 1.2em;
             font-style: italic;
-        }}
+        }
         
-        .version-badge {{
+        .version-badge {
             display: inline-block;
             background: #27AE60;
             color: white;
@@ -1205,9 +2832,9 @@ def generate_html_v3(figures, output_file='index.html'):
             border-radius: 20px;
             font-size: 0.9em;
             margin-top: 10px;
-        }}
+        }
         
-        .acte {{
+        .acte {
             background: white;
             margin: 30px 0;
             padding: 30px;
@@ -1215,62 +2842,62 @@ def generate_html_v3(figures, output_file='index.html'):
             box-shadow: 0 2px 4px rgba(0,0,0,0.1);
             scroll-margin-top: 80px;
             transition: transform 0.3s ease, box-shadow 0.3s ease;
-        }}
+        }
         
-        .acte:hover {{
+        .acte:hover {
             transform: translateY(-2px);
             box-shadow: 0 4px 8px rgba(0,0,0,0.15);
-        }}
+        }
         
-        .acte h2 {{
+        .acte h2 {
             color: #34495e;
             border-bottom: 3px solid #3498DB;
             padding-bottom: 10px;
             margin-bottom: 20px;
-        }}
+        }
         
-        .acte-text {{
+        .acte-text {
             margin-bottom: 30px;
             font-size: 1.1em;
             color: #555;
-        }}
+        }
         
-        .graph-container {{
+        .graph-container {
             margin: 20px 0;
-        }}
+        }
         
-        .takeaway {{
+        .takeaway {
             margin-top: 20px;
             padding: 15px;
             background-color: #f8f9fa;
             border-left: 4px solid #3498DB;
             color: #2c3e50;
             font-size: 1.05em;
-        }}
+        }
         
-        .takeaway strong {{
+        .takeaway strong {
             color: #2980B9;
             font-weight: 600;
-        }}
+        }
         
-        .takeaway .key-message {{
+        .takeaway .key-message {
             font-style: italic;
             color: #34495e;
             margin-top: 8px;
             display: block;
-        }}
+        }
         
-        .viz-note {{
+        .viz-note {
             background-color: #fff3cd;
             border-left: 4px solid #ffc107;
             padding: 10px;
             margin: 10px 0;
             font-size: 0.95em;
             color: #856404;
-        }}
+        }
         
         /* Botó "Tornar a dalt" */
-        .back-to-top {{
+        .back-to-top {
             position: fixed;
             bottom: 30px;
             right: 30px;
@@ -1287,34 +2914,103 @@ def generate_html_v3(figures, output_file='index.html'):
             transition: all 0.3s ease;
             z-index: 998;
             font-size: 24px;
-        }}
+        }
         
-        .back-to-top:hover {{
+        .back-to-top:hover {
             background: #2980B9;
             transform: translateY(-3px);
             box-shadow: 0 6px 15px rgba(0,0,0,0.3);
-        }}
+        }
         
-        .back-to-top.show {{
+        .back-to-top.show {
             display: flex;
-        }}
+        }
         
-        @media (max-width: 768px) {{
-            .nav-menu {{
+        @media (max-width: 768px) {
+            .nav-menu {
                 padding: 8px 10px;
                 gap: 8px;
-            }}
+            }
             
-            .nav-menu a {{
+            .nav-menu a {
                 font-size: 0.8em;
                 padding: 6px 10px;
-            }}
+            }
             
-            .content-wrapper {{
+            .content-wrapper {
                 padding-top: 80px;
-            }}
-        }}
-    </style>
+            }
+        }
+        
+        /* Impressió (PDF amb --pdf-backend chromium): sense navegació, un acte per pàgina */
+        @page {
+            size: A4;
+            margin: 12mm;
+        }
+        
+        @media print {
+            body {
+                max-width: none;
+                padding: 0;
+                background: white;
+            }
+            
+            .scroll-progress, .nav-menu, .back-to-top {
+                display: none !important;
+            }
+            
+            .content-wrapper {
+                padding-top: 0;
+            }
+            
+            .header, .acte {
+                margin: 0;
+                padding: 0;
+                box-shadow: none;
+                border-radius: 0;
+                transition: none;
+            }
+            
+            .acte {
+                break-before: page;
+            }
+            
+            .graph-container, .takeaway, .viz-note {
+                break-inside: avoid;
+            }
+        }
+"""
+
+# plotly.js de la pàgina (el PDF amb Chromium usa el del paquet plotly instal·lat)
+PLOTLY_JS_URL = 'https://cdn.plot.ly/plotly-latest.min.js'
+
+def build_html_v3(plot_script, assets=None, plotly_src=PLOTLY_JS_URL):
+    """
+    HTML complet de la VERSIÓ 3 (narrativa, navegació i estils)
+    plot_script: JS que crea els gràfics (incrustats o carregats des del servidor)
+    assets: URLs {'css', 'js', 'figures'} per enllaçar estils, JS i gràfics com a fitxers
+    externs (mode paquet, write_bundle; plot_script no s'usa). Per defecte tot va incrustat
+    plotly_src: URL de plotly.js
+    """
+    if assets is None:
+        styles = f"    <style>\n{DASHBOARD_CSS_V3}    </style>"
+        scripts = f"    <script>\n{build_script_v3(plot_script)}    </script>"
+    else:
+        styles = f'    <link rel="stylesheet" href="{assets["css"]}">'
+        scripts = (f'    <script id="dashboard-figures" type="application/json">{json.dumps(assets["figures"])}</script>\n'
+                   f'    <script src="{assets["js"]}"></script>')
+    return f"""
+<!DOCTYPE html>
+<html lang="ca">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <meta name="description" content="Anàlisi del risc de cancel·lació en reserves hoteleres a Portugal (2015-2017). Visualització narrativa que explora com el volum, el tipus d'hotel i el comportament del client influeixen en el risc de cancel·lació.">
+    <meta name="keywords" content="visualització de dades, hotel bookings, cancel·lació, Portugal, storytelling, dashboard narratiu">
+    <meta name="author" content="PAC 3 - Visualització de Dades">
+    <title>Per què les reserves locals cancel·len més?</title>
+    <script src="{plotly_src}"></script>
+{styles}
 </head>
 <body>
     <!-- Indicador de progrés de scroll -->
@@ -1480,75 +3176,135 @@ def generate_html_v3(figures, output_file='index.html'):
     <!-- Botó "Tornar a dalt" -->
     <div class="back-to-top" id="backToTop" onclick="window.scrollTo({{top: 0, behavior: 'smooth'}})" aria-label="Tornar a dalt">↑</div>
 
-    <script>
-        // Gràfics Plotly
-        var graph1 = {figures[0]};
-        Plotly.newPlot('graph1', graph1.data, graph1.layout, {{responsive: true}});
-
-        var graph2 = {figures[1]};
-        Plotly.newPlot('graph2', graph2.data, graph2.layout, {{responsive: true}});
+{scripts}
+</body>
+</html>
+"""
 
-        var graph3 = {figures[2]};
-        Plotly.newPlot('graph3', graph3.data, graph3.layout, {{responsive: true}});
-        
-        var graph4 = {figures[3]};
-        Plotly.newPlot('graph4', graph4.data, graph4.layout, {{responsive: true}});
-        
-        var graph5a = {figures[4]};
-        Plotly.newPlot('graph5a', graph5a.data, graph5a.layout, {{responsive: true}});
+def build_script_v3(plot_script):
+    """
+    JS de la pàgina VERSIÓ 3: creació dels gràfics, progrés de scroll, menú actiu, botó de tornar
+    a dalt (scroll passiu, un cop per frame) i redimensionat dels gràfics visibles
+    """
+    return f"""{plot_script}
+        // Elements de la pàgina (una sola consulta) i límits de les seccions; els límits es
+        // tornen a mesurar només quan canvia l'alçada de la pàgina, no a cada scroll
+        var scrollProgress = document.getElementById('scrollProgress');
+        var backToTop = document.getElementById('backToTop');
+        var navLinks = document.querySelectorAll('.nav-menu a');
+        var sectionIds = ['header', 'acte1', 'acte2', 'acte3', 'acte4', 'acte5', 'metodologia'];
+        var sectionBounds = [];
+        var sectionsDirty = true;
+        var activeIndex = -1;
         
-        var graph5b = {figures[5]};
-        Plotly.newPlot('graph5b', graph5b.data, graph5b.layout, {{responsive: true}});
+        function measureSections() {{
+            sectionBounds = sectionIds.map(function(sectionId) {{
+                var section = document.getElementById(sectionId);
+                return section ? [section.offsetTop, section.offsetTop + section.offsetHeight] : null;
+            }});
+            sectionsDirty = false;
+        }}
         
-        var graph5c = {figures[6]};
-        Plotly.newPlot('graph5c', graph5c.data, graph5c.layout, {{responsive: true}});
+        // Scroll: un sol listener passiu que programa l'actualització com a molt un cop per
+        // frame (requestAnimationFrame); primer es llegeix la posició i després s'escriu
+        var scrollScheduled = false;
         
-        // Indicador de progrés de scroll
-        window.addEventListener('scroll', function() {{
-            var scrollProgress = document.getElementById('scrollProgress');
+        function updateOnScroll() {{
+            scrollScheduled = false;
+            if (sectionsDirty) {{
+                measureSections();
+            }}
             var scrollTop = window.pageYOffset || document.documentElement.scrollTop;
             var scrollHeight = document.documentElement.scrollHeight - window.innerHeight;
-            var progress = (scrollTop / scrollHeight) * 100;
-            scrollProgress.style.width = progress + '%';
-        }});
-        
-        // Actualitzar menú actiu segons scroll
-        window.addEventListener('scroll', function() {{
-            var sections = ['header', 'acte1', 'acte2', 'acte3', 'acte4', 'acte5', 'metodologia'];
-            var scrollPos = window.pageYOffset + 100;
             
-            sections.forEach(function(sectionId, index) {{
-                var section = document.getElementById(sectionId);
-                if (section) {{
-                    var sectionTop = section.offsetTop;
-                    var sectionBottom = sectionTop + section.offsetHeight;
-                    
-                    if (scrollPos >= sectionTop && scrollPos < sectionBottom) {{
-                        // Eliminar classe active de tots els enllaços
-                        document.querySelectorAll('.nav-menu a').forEach(function(link) {{
-                            link.classList.remove('active');
-                        }});
-                        
-                        // Afegir classe active a l'enllaç corresponent
-                        var navLinks = document.querySelectorAll('.nav-menu a');
-                        if (navLinks[index + 1]) {{
-                            navLinks[index + 1].classList.add('active');
-                        }}
+            // Indicador de progrés de scroll
+            var progress = scrollHeight > 0 ? scrollTop / scrollHeight : 0;
+            scrollProgress.style.transform = 'scaleX(' + progress + ')';
+            
+            // Menú actiu segons la secció visible
+            var scrollPos = scrollTop + 100;
+            sectionBounds.forEach(function(bounds, index) {{
+                if (bounds && scrollPos >= bounds[0] && scrollPos < bounds[1] && index !== activeIndex) {{
+                    if (navLinks[activeIndex + 1]) {{
+                        navLinks[activeIndex + 1].classList.remove('active');
                     }}
+                    if (navLinks[index + 1]) {{
+                        navLinks[index + 1].classList.add('active');
+                    }}
+                    activeIndex = index;
                 }}
             }});
-        }});
+            
+            // Mostrar/ocultar botó "Tornar a dalt"
+            backToTop.classList.toggle('show', scrollTop > 300);
+        }}
+        
+        function requestScrollUpdate() {{
+            if (!scrollScheduled) {{
+                scrollScheduled = true;
+                window.requestAnimationFrame(updateOnScroll);
+            }}
+        }}
+        
+        window.addEventListener('scroll', requestScrollUpdate, {{ passive: true }});
+        
+        // L'alçada de la pàgina canvia quan es dibuixen els gràfics: tornar a mesurar les seccions
+        if ('ResizeObserver' in window) {{
+            new ResizeObserver(function() {{
+                sectionsDirty = true;
+                requestScrollUpdate();
+            }}).observe(document.body);
+        }}
+        
+        // Redimensionat de la finestra: debounce i només els gràfics visibles; els de fora de
+        // pantalla queden pendents i es redimensionen quan hi tornen a entrar
+        var graphIds = {json.dumps(FIGURE_IDS)};
+        var visiblePlots = {{}};
+        var stalePlots = {{}};
+        var resizeTimer = null;
+        
+        function resizePlot(graphId) {{
+            var graphDiv = document.getElementById(graphId);
+            delete stalePlots[graphId];
+            if (graphDiv && graphDiv.data) {{
+                Plotly.Plots.resize(graphDiv);
+            }}
+        }}
         
-        // Mostrar/ocultar botó "Tornar a dalt"
-        window.addEventListener('scroll', function() {{
-            var backToTop = document.getElementById('backToTop');
-            if (window.pageYOffset > 300) {{
-                backToTop.classList.add('show');
-            }} else {{
-                backToTop.classList.remove('show');
+        var plotObserver = 'IntersectionObserver' in window ? new IntersectionObserver(function(entries) {{
+            entries.forEach(function(entry) {{
+                var graphId = entry.target.id;
+                visiblePlots[graphId] = entry.isIntersecting;
+                if (entry.isIntersecting && stalePlots[graphId]) {{
+                    resizePlot(graphId);
+                }}
+            }});
+        }}, {{ rootMargin: '200px 0px' }}) : null;
+        
+        graphIds.forEach(function(graphId) {{
+            var graphDiv = document.getElementById(graphId);
+            if (graphDiv && plotObserver) {{
+                plotObserver.observe(graphDiv);
             }}
         }});
         
+        window.addEventListener('resize', function() {{
+            sectionsDirty = true;
+            clearTimeout(resizeTimer);
+            resizeTimer = setTimeout(function() {{
+                graphIds.forEach(function(graphId) {{
+                    if (!plotObserver || visiblePlots[graphId]) {{
+                        resizePlot(graphId);
+                    }} else {{
+                        stalePlots[graphId] = true;
+                    }}
+                }});
+                requestScrollUpdate();
+            }}, {RESIZE_DEBOUNCE_MS});
+        }}, {{ passive: true }});
+        
+        requestScrollUpdate();
+        
         // Scroll suau per als enllaços del menú
         document.querySelectorAll('.nav-menu a').forEach(function(link) {{
             link.addEventListener('click', function(e) {{
@@ -1560,15 +3316,7 @@ def generate_html_v3(figures, output_file='index.html'):
                 }}
             }});
         }});
-    </script>
-</body>
-</html>
 """
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(html_content)
-    
-    print(f"Dashboard V3 generat: {output_file}")
 
 def generate_html(figures, output_file='dashboard_v2.html'):
     """
@@ -1806,24 +3554,50 @@ def generate_html(figures, output_file='dashboard_v2.html'):
     
     print(f"Dashboard generat: {output_file}")
 
-def export_to_pdf(figures_list, output_file='pac3.pdf'):
+def rasterize_figure(fig, img_path):
+    """
+    Exporta un gràfic a PNG (kaleido) amb la mida de les imatges del PDF
+    Amb --renderer daemon (RENDERER_OPTIONS), la imatge la genera el Chromium ja obert del
+    dimoni; si el dimoni falla per qualsevol motiu (no respon, no arrenca o retorna un error),
+    s'exporta en aquest procés i la resta de l'execució ja no el fa servir
+    """
+    if RENDERER_OPTIONS['mode'] == 'daemon':
+        try:
+            data = render_image(fig, width=1200, height=600, scale=2)
+        except Exception as e:
+            print(f"   ⚠️  Renderitzador persistent no disponible ({e}); s'exporta en aquest procés")
+            RENDERER_OPTIONS['mode'] = 'inprocess'
+        else:
+            with open(img_path, 'wb') as f:
+                f.write(data)
+            return img_path
+    fig.write_image(img_path, width=1200, height=600, scale=2)
+    return img_path
+
+def export_to_pdf(figures_list, output_file='pac3.pdf', img_dir='temp_images', img_paths=None):
     """
     Exporta el dashboard versió 3 a PDF
+    img_dir: directori temporal per a les imatges (un per variant en el mode batch)
+    img_paths: imatges ja exportades (pipeline asíncron); si no n'hi ha, s'exporten aquí
     """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, PageBreak
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.enums import TA_CENTER, TA_LEFT
+
     print(f"\nExportant a PDF: {output_file}...")
     
     # Crear directori temporal per a les imatges
-    img_dir = 'temp_images'
     os.makedirs(img_dir, exist_ok=True)
     
     try:
         # Exportar cada gràfic a imatge
-        img_paths = []
-        for i, fig in enumerate(figures_list, 1):
-            img_path = os.path.join(img_dir, f'graph_{i}.png')
-            fig.write_image(img_path, width=1200, height=600, scale=2)
-            img_paths.append(img_path)
-            print(f"   Gràfic {i} exportat")
+        if img_paths is None:
+            img_paths = []
+            for i, fig in enumerate(figures_list, 1):
+                img_paths.append(rasterize_figure(fig, os.path.join(img_dir, f'graph_{i}.png')))
+                print(f"   Gràfic {i} exportat")
         
         # Crear PDF
         doc = SimpleDocTemplate(output_file, pagesize=A4)
@@ -1960,124 +3734,1768 @@ def export_to_pdf(figures_list, output_file='pac3.pdf'):
         story.append(Paragraph("• <b>Navegació interactiva:</b> Menú fixe i indicador de progrés per facilitar la navegació", text_style))
         story.append(Spacer(1, 0.2*inch))
         
-        # Decisions de Disseny
-        story.append(Paragraph("<b>Decisions de Disseny</b>", section_title_style))
-        story.append(Paragraph("Cada tècnica de visualització s'ha escollit en funció de la pregunta analítica que es vol respondre:", text_style))
-        story.append(Paragraph("• <b>Stacked Area Chart:</b> Permet visualitzar simultàniament el pes relatiu i l'evolució temporal", text_style))
-        story.append(Paragraph("• <b>Dumbbell Plot:</b> Visualitza directament la diferència de risc entre grups", text_style))
-        story.append(Paragraph("• <b>Treemap:</b> Mostra simultàniament volum (àrea) i taxa de cancel·lació (color)", text_style))
-        story.append(Paragraph("• <b>Sankey Diagram:</b> Visualitza fluxos i trajectòries completes", text_style))
-        story.append(Paragraph("• <b>Violin Plot, Histograma i Barres apilades:</b> Permeten comparar distribucions, freqüències i composicions", text_style))
-        story.append(Paragraph("La paleta de colors és consistent al llarg del dashboard per diferenciar hotels i origen del client, utilitzant una tipografia clara (Segoe UI) i s'han eliminat elements visuals que no aporten informació rellevant.", text_style))
-        story.append(Spacer(1, 0.2*inch))
+        # Decisions de Disseny
+        story.append(Paragraph("<b>Decisions de Disseny</b>", section_title_style))
+        story.append(Paragraph("Cada tècnica de visualització s'ha escollit en funció de la pregunta analítica que es vol respondre:", text_style))
+        story.append(Paragraph("• <b>Stacked Area Chart:</b> Permet visualitzar simultàniament el pes relatiu i l'evolució temporal", text_style))
+        story.append(Paragraph("• <b>Dumbbell Plot:</b> Visualitza directament la diferència de risc entre grups", text_style))
+        story.append(Paragraph("• <b>Treemap:</b> Mostra simultàniament volum (àrea) i taxa de cancel·lació (color)", text_style))
+        story.append(Paragraph("• <b>Sankey Diagram:</b> Visualitza fluxos i trajectòries completes", text_style))
+        story.append(Paragraph("• <b>Violin Plot, Histograma i Barres apilades:</b> Permeten comparar distribucions, freqüències i composicions", text_style))
+        story.append(Paragraph("La paleta de colors és consistent al llarg del dashboard per diferenciar hotels i origen del client, utilitzant una tipografia clara (Segoe UI) i s'han eliminat elements visuals que no aporten informació rellevant.", text_style))
+        story.append(Spacer(1, 0.2*inch))
+        
+        # Objectiu i Usuari
+        story.append(Paragraph("<b>Objectiu i Usuari</b>", section_title_style))
+        story.append(Paragraph("L'objectiu de la visualització és explicar el risc de cancel·lació des d'un punt de vista operatiu, pensada per a perfils de gestió hotelera o anàlisi de negoci.", text_style))
+        story.append(Paragraph("La història s'ha estructurat com una narrativa en cinc actes, seguint una progressió de context, tensió, clímax i possible explicació, facilitant una comprensió progressiva d'un fenomen complex.", text_style))
+        
+        # Generar PDF
+        doc.build(story)
+        print(f"PDF generat: {output_file}")
+        
+    except Exception as e:
+        print(f"   ⚠️  Error exportant a PDF: {e}")
+        import traceback
+        traceback.print_exc()
+        
+    finally:
+        # Netejar imatges temporals
+        import shutil
+        if os.path.exists(img_dir):
+            shutil.rmtree(img_dir)
+            print("   Imatges temporals eliminades")
+
+# ============================================================================
+# PDF AMB CHROMIUM: IMPRESSIÓ DIRECTA DE L'HTML
+# ============================================================================
+
+# --pdf-backend chromium: en lloc de rasteritzar set PNG i refer la narrativa amb reportlab,
+# s'imprimeix la mateixa pàgina V3 amb el Chromium que fa servir kaleido (choreographer,
+# protocol DevTools): una sola passada, gràfics vectorials (SVG) i el text de l'HTML, amb el
+# full d'estils d'impressió (@media print). La pàgina d'impressió carrega el plotly.js del
+# paquet plotly instal·lat, de manera que no depèn de la xarxa.
+# Amplada de la finestra = àrea útil d'A4 amb marges de 12 mm (186 mm a 96 ppp)
+PRINT_WIDTH_PX = 703
+PRINT_TIMEOUT = 60
+PDF_BACKENDS = ('reportlab', 'chromium')
+
+# Gràfics dibuixats: cada contenidor té el layout de Plotly
+_PRINT_READY_JS = """(document.readyState === 'complete' && !!window.Plotly &&
+    Array.prototype.every.call(document.querySelectorAll('.graph-container'),
+                               function(el) { return !!el._fullLayout; }))"""
+# Redimensiona els gràfics a l'amplada d'impressió (la pàgina els crea amb responsive: false)
+_PRINT_RESIZE_JS = """Promise.all(Array.prototype.map.call(document.querySelectorAll('.graph-container'),
+                                  function(el) { return Plotly.Plots.resize(el); }))"""
+
+def write_print_html(figures_json, html_file, template_json=None):
+    """HTML V3 per imprimir (gràfics incrustats i plotly.js local)"""
+    plotly_js = os.path.join(os.path.dirname(importlib.import_module('plotly').__file__),
+                             'package_data', 'plotly.min.js')
+    html_content = build_html_v3("        // Gràfics Plotly\n" + _inline_plot_script(figures_json, template_json),
+                                 plotly_src=pathlib.Path(plotly_js).as_uri())
+    with open(html_file, 'w', encoding='utf-8') as f:
+        f.write(html_content)
+    return html_file
+
+async def _devtools(tab, command, params=None):
+    response = await tab.send_command(command, params=params)
+    if 'error' in response:
+        raise RuntimeError(f"{command}: {response['error'].get('message', response['error'])}")
+    result = response['result']
+    if 'exceptionDetails' in result:
+        raise RuntimeError(f"{command}: {result['exceptionDetails'].get('text')}")
+    return result
+
+async def print_html_to_pdf(html_file, output_file, timeout=PRINT_TIMEOUT):
+    """Imprimeix html_file a PDF amb Chromium headless (espera que tots els gràfics estiguin dibuixats)"""
+    import choreographer
+
+    url = pathlib.Path(os.path.abspath(html_file)).as_uri()
+    async with choreographer.Browser(headless=True) as browser:
+        tab = await browser.create_tab(url, width=PRINT_WIDTH_PX, height=1123)
+        await _devtools(tab, 'Emulation.setEmulatedMedia', {'media': 'print'})
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                ready = await _devtools(tab, 'Runtime.evaluate', {'expression': _PRINT_READY_JS,
+                                                                 'returnByValue': True})
+                if ready['result'].get('value'):
+                    break
+            except RuntimeError:
+                pass  # Context de la pàgina encara no disponible (navegació en curs)
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"els gràfics no s'han dibuixat en {timeout} s")
+            await asyncio.sleep(0.1)
+        await _devtools(tab, 'Runtime.evaluate', {'expression': _PRINT_RESIZE_JS, 'awaitPromise': True})
+        pdf = await _devtools(tab, 'Page.printToPDF', {'printBackground': True, 'preferCSSPageSize': True})
+    with open(output_file, 'wb') as f:
+        f.write(base64.b64decode(pdf['data']))
+    return output_file
+
+def export_to_pdf_chromium(figures_json, output_file='pac3.pdf', template_json=None):
+    """Exporta el dashboard versió 3 a PDF imprimint l'HTML amb Chromium (vegeu print_html_to_pdf)"""
+    print(f"\nExportant a PDF amb Chromium: {output_file}...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        html_file = write_print_html(figures_json, os.path.join(tmp_dir, 'print.html'), template_json)
+        asyncio.run(print_html_to_pdf(html_file, output_file))
+    print(f"PDF generat: {output_file} ({os.path.getsize(output_file) / 1024:.0f} KB)")
+
+def benchmark_pdf_backends(figures, figures_json, template_json=None, output_dir='.'):
+    """Genera el PDF amb cada backend (pac3.<backend>.pdf) i en compara el temps i la mida"""
+    results = {}
+    for backend in PDF_BACKENDS:
+        output_file = os.path.join(output_dir, f'pac3.{backend}.pdf')
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        start = time.perf_counter()
+        try:
+            if backend == 'chromium':
+                export_to_pdf_chromium(figures_json, output_file, template_json)
+            else:
+                export_to_pdf(figures, output_file, img_dir=f'temp_images_{backend}')
+        except Exception as e:
+            print(f"   ⚠️  {backend}: {e}")
+        elapsed = time.perf_counter() - start
+        results[backend] = (elapsed, os.path.getsize(output_file) if os.path.exists(output_file) else None)
+
+    print("\nComparativa de backends de PDF:")
+    for backend, (elapsed, size) in results.items():
+        print(f"   {backend:<10} {elapsed:6.2f} s   " + (f"{size / 1024:8.0f} KB" if size else "   (error)"))
+    return results
+
+# ============================================================================
+# RENDERITZADOR PERSISTENT: KALEIDO EN UN PROCÉS DIMONI
+# ============================================================================
+
+# Cada fig.write_image arrenca el Chromium de kaleido, i l'arrencada del navegador pesa més
+# que el gràfic. El dimoni (--renderer-daemon) manté un Chromium obert i escalfat i atén
+# peticions per un socket Unix (--renderer-socket) dins d'un directori privat (0700, el
+# runtime dir de l'usuari): només l'usuari que l'ha arrencat s'hi pot connectar. Una línia
+# JSON per petició i, com a resposta, una línia JSON de capçalera seguida dels bytes de la imatge. Les peticions es
+# processen en ordre (cua), i el comparteixen les variants del mode batch (que s'hi
+# serialitzen) i les execucions successives del script. Cal activar-lo (--renderer daemon):
+# per defecte les imatges s'exporten en el mateix procés.
+# - El client l'arrenca en segon pla la primera vegada; queda en execució entre execucions
+#   i es tanca sol després de RENDERER_IDLE_SECONDS sense peticions (o amb --renderer-stop)
+# - Comprovació de salut: 'ping' (pid, imatges, reinicis); si el dimoni no respon, el client
+#   n'arrenca un de nou. Només atura (SIGTERM) el procés que ell mateix ha arrencat; a un dimoni
+#   d'una altra execució només li demana 'shutdown'. Si falla el navegador, el dimoni el reobre
+#   i ho torna a provar
+RENDERER_SOCKET_NAME = 'renderer.sock'
+RENDERER_IDLE_SECONDS = 900
+RENDERER_TIMEOUT = 120
+RENDERER_START_TIMEOUT = 30
+RENDERER_MAX_REQUEST = 256 * 1024 ** 2  # Una petició porta el JSON sencer del gràfic
+
+RENDERER_OPTIONS = {
+    'mode': 'inprocess',  # 'inprocess' (fig.write_image en aquest procés) o 'daemon' (renderitzador persistent)
+    'socket': None,  # camí del socket del dimoni (None: default_renderer_socket())
+    'pdf_backend': 'reportlab'  # PDF_BACKENDS: imatges + reportlab o impressió de l'HTML amb Chromium
+}
+
+# Dimonis que han respost a un ping i processos (Popen) dels que ha arrencat aquest procés
+_RENDERER_SEEN = set()
+_RENDERER_PROCESSES = {}
+
+def default_renderer_socket():
+    """Socket del dimoni dins d'un directori de l'usuari ($XDG_RUNTIME_DIR o el temporal)"""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    user = f'-{os.getuid()}' if hasattr(os, 'getuid') else ''
+    return os.path.join(runtime_dir, f'hotel_storytelling{user}', RENDERER_SOCKET_NAME)
+
+def configure_renderer(**options):
+    """Actualitza RENDERER_OPTIONS (p. ex. als processos del mode batch)"""
+    unknown = set(options) - set(RENDERER_OPTIONS)
+    if unknown:
+        raise KeyError(f"Opcions del renderitzador desconegudes: {', '.join(sorted(unknown))}")
+    RENDERER_OPTIONS.update(options)
+
+def _renderer_request(request, path, timeout):
+    """
+    Envia una petició al dimoni; retorna (capçalera, bytes). OSError si no respon
+    PermissionError si el directori del socket no és privat de l'usuari actual
+    """
+    private_dir(os.path.dirname(path))
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(request if isinstance(request, bytes) else json.dumps(request).encode('utf-8') + b'\n')
+        stream = sock.makefile('rb')
+        line = stream.readline()
+        if not line:
+            raise ConnectionError("el renderitzador ha tancat la connexió")
+        header = json.loads(line)
+        body = stream.read(header.get('bytes', 0))
+    return header, body
+
+def renderer_status(path):
+    """Ping al dimoni: dict amb pid, imatges generades, reinicis del navegador... (OSError si no respon)"""
+    header, _ = _renderer_request({'op': 'ping'}, path, timeout=5)
+    _RENDERER_SEEN.add(path)
+    return header
+
+def start_renderer(path):
+    """Arrenca el dimoni en segon pla (registre al directori del socket) i espera que respongui"""
+    log_path = os.path.join(private_dir(os.path.dirname(path)), 'renderer.log')
+    with open(log_path, 'ab') as log:
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--renderer-daemon',
+                                    '--renderer-socket', path],
+                                   stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                                   start_new_session=True)
+    _RENDERER_PROCESSES[path] = process
+    deadline = time.monotonic() + RENDERER_START_TIMEOUT
+    while True:
+        try:
+            return renderer_status(path)
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise TimeoutError(f"el renderitzador no respon a {path} (registre: {log_path})")
+            time.sleep(0.2)
+
+def restart_renderer(path):
+    """
+    Atura el dimoni i n'arrenca un de nou
+    Només s'atura el procés que ha arrencat aquest procés; a un dimoni d'una altra execució
+    se li demana 'shutdown' (si està penjat, el nou dimoni n'ocupa el socket)
+    """
+    _RENDERER_SEEN.discard(path)
+    process = _RENDERER_PROCESSES.pop(path, None)
+    if process is not None:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    else:
+        try:
+            _renderer_request({'op': 'shutdown'}, path, timeout=2)
+        except OSError:
+            pass
+    return start_renderer(path)
+
+def render_image(fig, width, height, scale, image_format='png'):
+    """
+    Imatge d'un gràfic generada pel dimoni (l'arrenca o el reinicia si cal)
+    OSError si no s'hi pot connectar; RuntimeError si el dimoni no pot generar la imatge
+    """
+    path = RENDERER_OPTIONS['socket'] or default_renderer_socket()
+    options = json.dumps({'op': 'render', 'format': image_format, 'width': width, 'height': height, 'scale': scale})
+    request = (options[:-1] + ', "figure": ' + pio.json.to_json_plotly(fig) + '}\n').encode('utf-8')
+    if path not in _RENDERER_SEEN:
+        try:
+            renderer_status(path)
+        except PermissionError:
+            raise
+        except OSError:
+            start_renderer(path)
+    try:
+        header, body = _renderer_request(request, path, RENDERER_TIMEOUT)
+    except PermissionError:
+        raise
+    except OSError:
+        # Dimoni caigut o penjat: un reinici i un segon intent
+        restart_renderer(path)
+        header, body = _renderer_request(request, path, RENDERER_TIMEOUT)
+    if not header['ok']:
+        raise RuntimeError(f"renderitzador: {header['error']}")
+    return body
+
+async def _serve_renderer(path, idle_seconds):
+    import kaleido
+
+    private_dir(os.path.dirname(path))
+    if os.path.exists(path):
+        try:
+            _renderer_request({'op': 'ping'}, path, timeout=2)
+        except OSError:
+            os.unlink(path)  # Socket d'un dimoni que ja no respon
+        else:
+            print(f"Ja hi ha un renderitzador a {path}", flush=True)
+            return
+
+    state = {'browser': None, 'renders': 0, 'restarts': 0, 'started': time.monotonic(),
+             'last_request': time.monotonic()}
+    queue = asyncio.Lock()  # Una imatge cada vegada, en ordre d'arribada
+    stop = asyncio.Event()
+
+    async def open_browser():
+        if state['browser'] is None:
+            browser = kaleido.Kaleido(n=1)
+            await browser.open()
+            # Escalfament: el primer gràfic carrega plotly.js a la pestanya
+            await browser.calc_fig({'data': [{'y': [0, 1]}]}, opts={'format': 'png', 'width': 100, 'height': 100})
+            state['browser'] = browser
+        return state['browser']
+
+    async def close_browser():
+        browser, state['browser'] = state['browser'], None
+        if browser is not None:
+            try:
+                await browser.close()
+            except Exception:
+                pass
+
+    async def render(request):
+        opts = {key: request[key] for key in ('format', 'width', 'height', 'scale')}
+        for attempt in (1, 2):
+            try:
+                browser = await open_browser()
+                return await asyncio.wait_for(browser.calc_fig(request['figure'], opts=opts), RENDERER_TIMEOUT)
+            except Exception:
+                # Navegador caigut o penjat: es reobre i es torna a provar una vegada
+                await close_browser()
+                state['restarts'] += 1
+                if attempt == 2:
+                    raise
+
+    async def handle(reader, writer):
+        body = b''
+        try:
+            request = json.loads(await reader.readline())
+            state['last_request'] = time.monotonic()
+            if request['op'] == 'ping':
+                header = {'ok': True, 'pid': os.getpid(), 'renders': state['renders'], 'restarts': state['restarts'],
+                          'browser': state['browser'] is not None,
+                          'uptime': round(time.monotonic() - state['started'], 1)}
+            elif request['op'] == 'render':
+                async with queue:
+                    start = time.perf_counter()
+                    body = await render(request)
+                    state['renders'] += 1
+                header = {'ok': True, 'bytes': len(body), 'ms': round((time.perf_counter() - start) * 1000, 1)}
+            elif request['op'] == 'shutdown':
+                header = {'ok': True}
+                stop.set()
+            else:
+                header = {'ok': False, 'error': f"operació desconeguda: {request['op']}"}
+        except Exception as e:
+            header = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+            body = b''
+        writer.write(json.dumps(header).encode('utf-8') + b'\n' + body)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_unix_server(handle, path, limit=RENDERER_MAX_REQUEST)
+    os.chmod(path, 0o600)
+    inode = os.stat(path).st_ino
+    print(f"Renderitzador a {path} (pid {os.getpid()}; "
+          f"es tanca després de {idle_seconds} s sense peticions)", flush=True)
+    try:
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=min(30, idle_seconds))
+            except asyncio.TimeoutError:
+                if time.monotonic() - state['last_request'] > idle_seconds:
+                    stop.set()
+    finally:
+        server.close()
+        await close_browser()
+        # El socket es treu si encara és el d'aquest dimoni (no el d'un que l'ha substituït)
+        try:
+            if os.stat(path).st_ino == inode:
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+    print(f"Renderitzador aturat ({state['renders']} imatges, {state['restarts']} reinicis del navegador)", flush=True)
+
+def run_renderer_daemon(path, idle_seconds=RENDERER_IDLE_SECONDS):
+    """Executa el dimoni de renderització en primer pla (fins a 'shutdown', inactivitat o Ctrl+C)"""
+    try:
+        asyncio.run(_serve_renderer(path, idle_seconds))
+    except KeyboardInterrupt:
+        pass
+
+# ============================================================================
+# PAQUET ESTÀTIC: FITXERS AMB HASH DE CONTINGUT I PRECOMPRIMITS
+# ============================================================================
+
+# Mode --bundle DIR: el CSS, el JS i el JSON de cada gràfic s'escriuen com a fitxers separats
+# amb el hash del contingut al nom (app.<hash>.css, graph1.<hash>.json...), de manera que el
+# servidor web els pot servir amb capçaleres de cache immutables. Cada fitxer porta germans
+# .gz i .br precomprimits (gzip_static / brotli_static a nginx), calculats en paral·lel.
+# L'entrada (index.html) manté el nom fix, s'ha de revalidar i enllaça els actius pel hash:
+# una reconstrucció només escriu els fitxers amb contingut nou, i la resta continuen a la
+# cache dels navegadors. manifest.json: nom lògic → fitxer, mida, hash, immutable i mides
+# comprimides. Els actius amb hash de les últimes BUNDLE_KEEP_BUILDS construccions es
+# conserven (pàgines en cache encara els poden demanar; la llista és a BUNDLE_HISTORY) i la
+# resta s'esborren; els fitxers sense hash al nom no es toquen.
+BUNDLE_ENTRY = 'index.html'
+BUNDLE_MANIFEST = 'manifest.json'
+BUNDLE_HISTORY = 'manifest.history.json'
+BUNDLE_HASH_BYTES = 8
+BUNDLE_ENCODINGS = ('gz', 'br')  # .br requereix el paquet brotli (opcional)
+BUNDLE_KEEP_BUILDS = 3  # 0 = no esborrar mai
+_BUNDLE_HASHED_FILE = re.compile(rf'[\w-]+\.[0-9a-f]{{{2 * BUNDLE_HASH_BYTES}}}\.\w+(\.(gz|br))?')
+
+# Actualitzacions incrementals: la pàgina del paquet consulta manifest.json cada
+# BUNDLE_POLL_SECONDS (0 = mai; no quan la pestanya està amagada). Si un gràfic té un fitxer
+# nou, només es descarrega aquell JSON i s'aplica amb Plotly.react, que canvia el gràfic al
+# lloc; layout.uirevision fix per gràfic conserva el zoom, la selecció i la llegenda.
+BUNDLE_POLL_SECONDS = 60
+
+def content_hash(data, n_bytes=BUNDLE_HASH_BYTES):
+    """Hash curt (hex) del contingut d'un fitxer del paquet"""
+    return hashlib.blake2b(data, digest_size=n_bytes).hexdigest()
+
+def hashed_name(name, data):
+    """Nom amb hash de contingut: app.css → app.<hash>.css"""
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{content_hash(data)}{ext}"
+
+def _bundle_plot_script(template_json=None, poll_seconds=BUNDLE_POLL_SECONDS):
+    """
+    JS que carrega cada gràfic del paquet (URLs amb hash a l'element #dashboard-figures) i,
+    cada poll_seconds, aplica amb Plotly.react els gràfics que el manifest dona per canviats
+    La plantilla comuna, si n'hi ha, va a app.js: només canvia si canvia la plantilla
+    """
+    layout = 'figure.layout' if template_json is None else 'withTemplate(figure.layout)'
+    script = f"""        // Gràfics Plotly (JSON amb hash de contingut, llistats a #dashboard-figures)
+        var figureUrls = JSON.parse(document.getElementById('dashboard-figures').textContent);
+        
+        function plotFigure(graphId, url, update) {{
+            return fetch(url)
+                .then(function(response) {{ return response.json(); }})
+                .then(function(figure) {{
+                    var layout = {layout};
+                    // uirevision fix: Plotly.react conserva el zoom i la selecció de l'usuari
+                    layout.uirevision = graphId;
+                    (update ? Plotly.react : Plotly.newPlot)(graphId, figure.data, layout, {PLOT_CONFIG});
+                    figureUrls[graphId] = url;
+                }});
+        }}
         
-        # Objectiu i Usuari
-        story.append(Paragraph("<b>Objectiu i Usuari</b>", section_title_style))
-        story.append(Paragraph("L'objectiu de la visualització és explicar el risc de cancel·lació des d'un punt de vista operatiu, pensada per a perfils de gestió hotelera o anàlisi de negoci.", text_style))
-        story.append(Paragraph("La història s'ha estructurat com una narrativa en cinc actes, seguint una progressió de context, tensió, clímax i possible explicació, facilitant una comprensió progressiva d'un fenomen complex.", text_style))
+        Object.keys(figureUrls).forEach(function(graphId) {{
+            plotFigure(graphId, figureUrls[graphId], false);
+        }});
         
-        # Generar PDF
-        doc.build(story)
-        print(f"PDF generat: {output_file}")
+        // Actualitzacions: el manifest (revalidat, sense cache) indica quins gràfics tenen un
+        // fitxer nou; només aquests es descarreguen i s'actualitzen al lloc
+        var manifestPollMs = {int(poll_seconds * 1000)};
+        var manifestPending = false;
         
-    except Exception as e:
-        print(f"   ⚠️  Error exportant a PDF: {e}")
-        import traceback
-        traceback.print_exc()
+        function checkManifest() {{
+            if (document.hidden || manifestPending) {{
+                return;
+            }}
+            manifestPending = true;
+            fetch('{BUNDLE_MANIFEST}', {{ cache: 'no-cache' }})
+                .then(function(response) {{ return response.json(); }})
+                .then(function(manifest) {{
+                    return Promise.all(Object.keys(figureUrls).map(function(graphId) {{
+                        var entry = manifest.files[graphId + '.json'];
+                        if (entry && entry.file !== figureUrls[graphId]) {{
+                            return plotFigure(graphId, entry.file, true);
+                        }}
+                    }}));
+                }})
+                .catch(function() {{}})
+                .then(function() {{ manifestPending = false; }});
+        }}
         
+        if (manifestPollMs > 0) {{
+            setInterval(checkManifest, manifestPollMs);
+            document.addEventListener('visibilitychange', checkManifest);
+        }}
+"""
+    return script if template_json is None else _template_script(template_json) + script
+
+def _compress(data, encoding):
+    """Versió precomprimida d'un fitxer (nivell màxim: es comprimeix una vegada per contingut)"""
+    if encoding == 'gz':
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    import brotli
+    return brotli.compress(data, quality=11)
+
+def _write_if_changed(path, data):
+    """Escriu el fitxer (atòmicament) només si el contingut canvia; retorna True si l'ha escrit"""
+    if os.path.exists(path) and os.path.getsize(path) == len(data):
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+def _write_compressed(path, data, encoding, force):
+    """Escriu el germà comprimit si cal (fitxer nou o germà absent); retorna la seva mida"""
+    compressed_path = f"{path}.{encoding}"
+    if force or not os.path.exists(compressed_path):
+        _write_if_changed(compressed_path, _compress(data, encoding))
+    return os.path.getsize(compressed_path)
+
+def _manifest_files(manifest):
+    """Fitxers amb hash (i germans comprimits) que enllaça un manifest"""
+    return sorted(
+        name
+        for entry in manifest['files'].values() if entry['immutable']
+        for name in [entry['file']] + [f"{entry['file']}.{encoding}" for encoding in entry['encodings']]
+    )
+
+def _bundle_history(output_dir):
+    """
+    Fitxers de les construccions anteriors (la més recent primer)
+    Sense historial (paquet anterior a BUNDLE_HISTORY), es parteix del manifest existent
+    """
+    try:
+        with open(os.path.join(output_dir, BUNDLE_HISTORY), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+    try:
+        with open(os.path.join(output_dir, BUNDLE_MANIFEST), encoding='utf-8') as f:
+            return [_manifest_files(json.load(f))]
+    except FileNotFoundError:
+        return []
+
+def prune_bundle(output_dir, history, keep_builds=BUNDLE_KEEP_BUILDS):
+    """
+    Desa l'historial (les keep_builds construccions més recents) i esborra els fitxers amb hash
+    de output_dir que cap d'elles enllaça; retorna el nombre de fitxers esborrats
+    """
+    history = history[:keep_builds]
+    _write_if_changed(os.path.join(output_dir, BUNDLE_HISTORY),
+                      (json.dumps(history, indent=2) + '\n').encode('utf-8'))
+    referenced = {name for build in history for name in build}
+    removed = 0
+    for name in os.listdir(output_dir):
+        if _BUNDLE_HASHED_FILE.fullmatch(name) and name not in referenced:
+            os.remove(os.path.join(output_dir, name))
+            removed += 1
+    return removed
+
+def write_bundle(figures_json, output_dir, template_json=None, encodings=BUNDLE_ENCODINGS, n_workers=None,
+                 poll_seconds=BUNDLE_POLL_SECONDS, keep_builds=BUNDLE_KEEP_BUILDS):
+    """
+    Escriu el dashboard (VERSIÓ 3) com a paquet estàtic a output_dir
+    figures_json: JSON de cada gràfic, en l'ordre de FIGURE_IDS
+    template_json: plantilla comuna treta de les figures (export_figures_json)
+    poll_seconds: interval de consulta del manifest per a les actualitzacions (0 = mai)
+    keep_builds: construccions els actius de les quals es conserven (prune_bundle; 0 = totes)
+    Retorna el manifest (també escrit a output_dir/manifest.json)
+    """
+    encodings = list(encodings)
+    if 'br' in encodings:
+        try:
+            import brotli  # noqa: F401
+        except ImportError:
+            print("   ⚠️  brotli no està instal·lat: només es generen germans .gz (pip install brotli)")
+            encodings.remove('br')
+    os.makedirs(output_dir, exist_ok=True)
+    history = _bundle_history(output_dir)
+
+    # Actius amb hash (gràfics, JS, CSS) i, al final, l'entrada que els enllaça
+    assets = {}
+    figure_urls = {}
+    for graph_id, figure in zip(FIGURE_IDS, figures_json):
+        data = figure.encode('utf-8')
+        figure_urls[graph_id] = hashed_name(f"{graph_id}.json", data)
+        assets[f"{graph_id}.json"] = (figure_urls[graph_id], data)
+    for name, text in [('app.js', build_script_v3(_bundle_plot_script(template_json, poll_seconds))), ('app.css', DASHBOARD_CSS_V3)]:
+        data = text.encode('utf-8')
+        assets[name] = (hashed_name(name, data), data)
+    html = build_html_v3(None, assets={'css': assets['app.css'][0], 'js': assets['app.js'][0],
+                                       'figures': figure_urls})
+    assets[BUNDLE_ENTRY] = (BUNDLE_ENTRY, html.encode('utf-8'))
+
+    files = {}
+    written = {}
+    for name, (file_name, data) in assets.items():
+        written[name] = _write_if_changed(os.path.join(output_dir, file_name), data)
+        files[name] = {
+            'file': file_name,
+            'bytes': len(data),
+            'hash': content_hash(data),
+            'immutable': name != BUNDLE_ENTRY,
+            'encodings': {}
+        }
+
+    # Compressió en paral·lel (zlib i brotli alliberen el GIL)
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        futures = {
+            pool.submit(_write_compressed, os.path.join(output_dir, file_name), data, encoding,
+                        written[name]): (name, encoding)
+            for name, (file_name, data) in assets.items()
+            for encoding in encodings
+        }
+        for future in as_completed(futures):
+            name, encoding = futures[future]
+            files[name]['encodings'][encoding] = future.result()
+
+    manifest = {'entry': BUNDLE_ENTRY, 'files': {name: files[name] for name in sorted(files)}}
+    for entry in manifest['files'].values():
+        entry['encodings'] = {encoding: entry['encodings'][encoding] for encoding in encodings}
+    _write_if_changed(os.path.join(output_dir, BUNDLE_MANIFEST),
+                      (json.dumps(manifest, indent=2) + '\n').encode('utf-8'))
+
+    # Una reconstrucció idèntica no ocupa cap posició de l'historial
+    current = _manifest_files(manifest)
+    if history[:1] != [current]:
+        history.insert(0, current)
+    removed = prune_bundle(output_dir, history, keep_builds) if keep_builds else 0
+
+    n_written = sum(written.values())
+    totals = {encoding: sum(entry['encodings'][encoding] for entry in files.values()) for encoding in encodings}
+    sizes = ', '.join([f"{sum(entry['bytes'] for entry in files.values()) / 1024:.0f} KB"] +
+                      [f".{encoding} {size / 1024:.0f} KB" for encoding, size in totals.items()])
+    print(f"Paquet estàtic generat a {output_dir}: {len(files)} fitxers ({n_written} nous o canviats, "
+          f"{len(files) - n_written} sense canvis); {sizes}"
+          + (f"; {removed} fitxers antics esborrats" if removed else ''))
+    return manifest
+
+# ============================================================================
+# MODE BATCH: MÚLTIPLES DASHBOARDS AMB UNA SOLA CÀRREGA
+# ============================================================================
+
+# Fitxer de filtres (JSON): llista de variants, p. ex.
+#   [{"name": "resort_2016", "hotel": "Resort Hotel", "arrival_date_year": 2016},
+#    {"name": "online", "market_segment": ["Online TA", "Offline TA/TO"]}]
+# Cada clau (excepte name i min_bookings) és una columna; el valor pot ser un escalar o una llista.
+SPEC_OPTIONS = ('name', 'min_bookings')
+
+_BATCH_STORE = None  # Magatzem columnar compartit pels processos del pool (memmap, sense copiar les files)
+
+def load_filter_specs(path):
+    """Llegeix i valida la llista de variants del mode batch"""
+    with open(path, encoding='utf-8') as f:
+        specs = json.load(f)
+    names = [spec.get('name') for spec in specs]
+    if not names or any(not name for name in names) or len(set(names)) != len(names):
+        raise ValueError(f"{path}: cada variant necessita un 'name' únic")
+    # El nom forma part de rutes de sortida (index_<name>.html, temp_images_<name>)
+    invalid = [name for name in names if not re.fullmatch(r'[\w.-]+', str(name))]
+    if invalid:
+        raise ValueError(f"{path}: noms de variant no vàlids (només lletres, dígits, _ . -): {invalid}")
+    return specs
+
+def _spec_filters(spec):
+    """Filtres d'una variant com a {columna: llista de valors}"""
+    return {
+        col: value if isinstance(value, list) else [value]
+        for col, value in spec.items() if col not in SPEC_OPTIONS
+    }
+
+def _init_batch_worker(store_dir, columns, memo, figure_options, renderer_options):
+    global _BATCH_STORE
+    _BATCH_STORE = (load_columnar_store(store_dir), columns)
+    configure_memo(**memo)
+    configure_figures(**figure_options)
+    configure_renderer(**renderer_options)
+
+def _render_batch_variant(name, positions, tables, flow_data, granularity, html_file, pdf_file, img_dir):
+    """Treball d'un procés: gràfics, HTML i PDF d'una variant"""
+    store, columns = _BATCH_STORE
+    df_variant = store_to_frame(store, columns, rows=positions)
+    figures = build_dashboard_figures(df_variant, tables, granularity, flow_data, verbose=False)
+    write_dashboard(figures, html_file, pdf_file, img_dir=img_dir)
+    return name
+
+def run_batch(df_clean, specs, n_workers=None, granularity='year', output_dir='.', pdf=True, min_bookings=1000,
+              store_dir=None):
+    """
+    Genera un dashboard per variant (index_<variant>.html / pac3_<variant>.pdf)
+    - Una sola passada agrupada per (columnes de filtre + PARTIAL_KEYS) dona alhora
+      els recomptes parcials (→ TAULES 1-6 de cada variant) i el grup de cada fila
+    - Cada variant selecciona grups, no torna a recórrer ni a filtrar el DataFrame per taules
+    - Els gràfics i fitxers de sortida es generen en paral·lel (un procés per variant; n_workers
+      None = tots els processadors, 1 = en aquest procés)
+    - Els processos llegeixen les files de la seva variant del magatzem columnar store_dir
+      (memmap; si no se'n dona cap, se n'escriu un de temporal) en lloc de rebre el DataFrame
+    """
+    filter_cols = list(dict.fromkeys(col for spec in specs for col in _spec_filters(spec)))
+    print(f"\n2. Mode batch: {len(specs)} variants (filtres: {', '.join(filter_cols) or 'cap'})...")
+
+    group_keys = [col for col in filter_cols if col not in PARTIAL_KEYS] + PARTIAL_KEYS
+    grouped = df_clean.groupby(group_keys, dropna=False)
+    counts = grouped['is_canceled'].agg(['count', 'sum']).reset_index()
+    counts.columns = group_keys + ['n_bookings', 'n_canceled']
+    group_order, group_starts = group_offsets(grouped.ngroup().to_numpy(), len(counts))
+
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = []
+    for spec in specs:
+        selected = np.ones(len(counts), dtype=bool)
+        for col, values in _spec_filters(spec).items():
+            selected &= counts[col].isin(values).to_numpy()
+        if not selected.any():
+            print(f"   ⚠️  {spec['name']}: cap reserva compleix els filtres, s'omet")
+            continue
+
+        partial = counts.loc[selected, PARTIAL_KEYS + ['n_bookings', 'n_canceled']]
+        partial = partial.groupby(PARTIAL_KEYS, dropna=False)[['n_bookings', 'n_canceled']].sum().reset_index()
+        all_tables = create_tables_from_partial(partial, spec.get('min_bookings', min_bookings))
+        positions = group_rows(group_order, group_starts, np.flatnonzero(selected))
+        print(f"   - {spec['name']}: {len(positions)} reserves")
+
+        jobs.append((
+            spec['name'], positions, all_tables[:4], all_tables[5], granularity,
+            os.path.join(output_dir, f"index_{spec['name']}.html"),
+            os.path.join(output_dir, f"pac3_{spec['name']}.pdf") if pdf else None,
+            os.path.join(output_dir, f"temp_images_{spec['name']}")
+        ))
+
+    failed = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if store_dir is None:
+            store_dir = build_columnar_store(df_clean, tmp_dir)
+        initargs = (store_dir, list(df_clean.columns), memo_config(), dict(FIGURE_OPTIONS), dict(RENDERER_OPTIONS))
+
+        if n_workers == 1:
+            print(f"\n3. Generant {len(jobs)} dashboards...")
+            _init_batch_worker(*initargs)
+            for job in jobs:
+                try:
+                    print(f"   ✓ {_render_batch_variant(*job)}")
+                except Exception as e:
+                    print(f"   ❌ {job[0]}: {e}")
+                    failed.append(job[0])
+        else:
+            print(f"\n3. Generant {len(jobs)} dashboards en paral·lel...")
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_batch_worker,
+                                     initargs=initargs) as pool:
+                futures = {pool.submit(_render_batch_variant, *job): job[0] for job in jobs}
+                for future in as_completed(futures):
+                    try:
+                        print(f"   ✓ {future.result()}")
+                    except Exception as e:
+                        print(f"   ❌ {futures[future]}: {e}")
+                        failed.append(futures[future])
+
+    if failed:
+        print(f"\n❌ {len(failed)} de {len(jobs)} variants han fallat: {', '.join(sorted(failed))}")
+        raise SystemExit(1)
+
+# ============================================================================
+# MODE SERVIDOR: DASHBOARD LOCAL AMB GRÀFICS SOTA DEMANDA
+# ============================================================================
+
+# Rutes del servidor:
+#   /                          → HTML de la VERSIÓ 3 sense dades incrustades
+#   /api/figures/<graph>.json  → JSON d'un gràfic (calculat el primer cop que es demana)
+# Filtres opcionals (a la pàgina o a cada gràfic): ?hotel=Resort Hotel&year=2016&country=PRT,ESP
+#   &origin=...&deposit=...&changes=0,1&min_bookings=100 — es resolen sobre el cub d'agregació
+# Les taules s'agreguen una vegada en arrencar; cada gràfic es calcula sota demanda i es
+# guarda en una cache LRU amb el seu ETag, de manera que les peticions repetides (o amb
+# If-None-Match) no tornen a generar ni a enviar el JSON. La cache guarda un Future per
+# clau (gràfic, filtres, min_bookings): peticions simultànies de la mateixa clau esperen el
+# mateix càlcul, i les de claus diferents es calculen en paral·lel.
+# Amb stream (mode streaming), també /api/stream (Server-Sent Events) i les dades poden canviar:
+# cada lot de reserves noves substitueix el cub i les taules (una nova versió) i buida la cache.
+FIGURE_URL_TEMPLATE = '/api/figures/{id}.json'
+FIGURE_CACHE_SIZE = 32
+
+def _etag(body):
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+def etag_matches(if_none_match, etag):
+    """
+    If-None-Match (RFC 9110 §13.1.2): '*' o una llista d'ETags separats per comes, comparats
+    amb la comparació feble (sense el prefix W/)
+    """
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith('W/') else tag) == opaque:
+            return True
+    return False
+
+def make_dashboard_handler(df_clean, tables, granularity='year', flow_data=None, cube=None, row_index=None,
+                           min_bookings=1000, stream=None):
+    """
+    Crea la classe de handler HTTP amb les dades (ja agregades) del dashboard
+    min_bookings: el de les taules rebudes (i el valor per defecte del paràmetre de consulta)
+    stream: hub del mode streaming (make_stream_hub); els gràfics surten del cub (granularitat
+    anual) i la classe rep apply_stream_batch(df) per sumar-hi lots de reserves noves
+    """
+    from http.server import BaseHTTPRequestHandler
+
+    default_min_bookings = min_bookings
+    tables = apply_granularity(df_clean, tables, granularity)
+    plot_script = _fetch_plot_script(FIGURE_URL_TEMPLATE)
+    if stream is not None:
+        plot_script += _stream_plot_script(STREAM_URL)
+    shell = build_html_v3(plot_script).encode('utf-8')
+    shell_etag = _etag(shell)
+    if cube is None:
+        cube = build_booking_cube(df_clean)
+    lock = threading.Lock()  # Protegeix responses i el canvi de versió (no el càlcul dels gràfics)
+    responses = OrderedDict()  # Clau → Future amb (JSON, ETag), en ordre LRU
+
+    # Dades actuals: una versió immutable que el mode streaming substitueix a cada lot; en
+    # streaming els gràfics es calculen només del cub, com amb --cube, perquè les files de
+    # df_clean no s'actualitzen
+    state = {'data': {
+        'df_clean': None if stream is not None else df_clean,
+        'tables': tables,
+        'flow_data': flow_data,
+        'cube': cube,
+        'row_index': None if stream is not None else row_index
+    }}
+
+    def render_response(data, graph_id, filter_key, min_bookings):
+        if filter_key or min_bookings != default_min_bookings:
+            fig = build_filtered_figure(graph_id, data['cube'], dict(filter_key), min_bookings)
+        else:
+            fig = build_dashboard_figure(graph_id, data['df_clean'], data['tables'], granularity,
+                                         data['flow_data'], data['cube'], data['row_index'])
+        body = fig.to_json().encode('utf-8')
+        return body, _etag(body)
+
+    def figure_response(graph_id, filter_key=(), min_bookings=default_min_bookings):
+        """(JSON, ETag) d'un gràfic; només el primer fil que demana una clau la calcula"""
+        key = (graph_id, filter_key, min_bookings)
+        with lock:
+            data = state['data']
+            future = responses.get(key)
+            owner = future is None
+            if owner:
+                future = responses[key] = Future()
+                while len(responses) > FIGURE_CACHE_SIZE:
+                    responses.popitem(last=False)
+            else:
+                responses.move_to_end(key)
+        if owner:
+            try:
+                future.set_result(render_response(data, graph_id, filter_key, min_bookings))
+            except Exception as e:
+                future.set_exception(e)
+                with lock:
+                    if responses.get(key) is future:
+                        del responses[key]
+        return future.result()
+
+    published = {}
+
+    def apply_stream_batch(df_new):
+        """Suma un lot de reserves noves al cub, recalcula les taules i publica els gràfics que canvien"""
+        start = time.perf_counter()
+        delta = build_booking_cube.__wrapped__(df_new)  # Sense memoitzar: cada lot és únic
+        # Els lots arriben d'un sol fil (follow_booking_feed): la nova versió es calcula fora del lock
+        cube = merge_booking_cubes(state['data']['cube'], delta)
+        all_tables = create_tables_from_cube(cube, min_bookings=default_min_bookings)
+        data = {**state['data'], 'cube': cube, 'tables': all_tables[:4], 'flow_data': all_tables[5]}
+        with lock:
+            state['data'] = data
+            responses.clear()
+        changed = {}
+        for graph_id in FIGURE_IDS:
+            body, etag = figure_response(graph_id)
+            if published.get(graph_id) != etag:
+                published[graph_id] = etag
+                changed[graph_id] = body
+        dropped = stream_publish(stream, changed)
+        n_bookings = int(cube['n_bookings'].sum())
+        print(f"   [streaming] +{len(df_new)} reserves ({n_bookings} en total): "
+              f"{', '.join(changed) or 'cap gràfic canviat'} ({(time.perf_counter() - start) * 1000:.0f} ms)"
+              + (f"; {dropped} missatges pendents substituïts (clients lents)" if dropped else ''))
+
+    if stream is not None:
+        for graph_id in FIGURE_IDS:
+            published[graph_id] = figure_response(graph_id)[1]
+
+    class DashboardRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path, _, query_string = self.path.partition('?')
+            query = parse_qs(query_string)
+            if path in ('/', '/index.html'):
+                self._send(shell, shell_etag, 'text/html; charset=utf-8')
+                return
+            if path == STREAM_URL and stream is not None:
+                self._send_stream()
+                return
+
+            prefix, suffix = FIGURE_URL_TEMPLATE.split('{id}')
+            graph_id = path[len(prefix):-len(suffix)] if path.startswith(prefix) and path.endswith(suffix) else None
+            if graph_id not in FIGURE_IDS:
+                self.send_error(404, 'Recurs no trobat')
+                return
+
+            try:
+                filters = parse_cube_filters(query)
+                min_bookings = int(query.get('min_bookings', [default_min_bookings])[0])
+            except ValueError:
+                self.send_error(400, 'Filtre no vàlid')
+                return
+            filter_key = tuple(sorted((dim, tuple(values)) for dim, values in filters.items()))
+
+            body, etag = figure_response(graph_id, filter_key, min_bookings)
+            self._send(body, etag, 'application/json')
+
+        def _send(self, body, etag, content_type):
+            if etag_matches(self.headers.get('If-None-Match'), etag):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')  # Revalidar sempre amb l'ETag
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_stream(self):
+            """Server-Sent Events: un esdeveniment 'figure' per gràfic canviat (fins que el client tanca)"""
+            client = stream_subscribe(stream, self.headers.get('Last-Event-ID'))
+            try:
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('X-Accel-Buffering', 'no')  # Sense buffer a nginx
+                self.end_headers()
+                while True:
+                    messages = stream_next(client, STREAM_KEEPALIVE_SECONDS)
+                    if not messages:
+                        self.wfile.write(b': keepalive\n\n')
+                    for graph_id, (version, body) in messages:
+                        self.wfile.write(b'id: %d\nevent: figure\ndata: {"id": "%s", "figure": ' % (version, graph_id.encode())
+                                         + body + b'}\n\n')
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                stream_unsubscribe(stream, client)
+
+        def log_message(self, format, *args):
+            print(f"   [{self.address_string()}] {format % args}")
+
+    DashboardRequestHandler.apply_stream_batch = staticmethod(apply_stream_batch)
+    return DashboardRequestHandler
+
+def serve_dashboard(df_clean, tables, granularity='year', flow_data=None, host='127.0.0.1', port=8050, cube=None,
+                    row_index=None, min_bookings=1000, stream_feed=None):
+    """
+    Arrenca el servidor local del dashboard (fins a Ctrl+C)
+    stream_feed: fitxer de reserves noves (JSONL o CSV) a seguir en mode streaming
+    """
+    from http.server import ThreadingHTTPServer
+
+    stream = make_stream_hub() if stream_feed else None
+    handler = make_dashboard_handler(df_clean, tables, granularity, flow_data, cube, row_index, min_bookings,
+                                     stream=stream)
+    server = ThreadingHTTPServer((host, port), handler)
+    stop = threading.Event()
+    if stream_feed:
+        threading.Thread(target=follow_booking_feed, args=(stream_feed, handler.apply_stream_batch, stop),
+                         name='booking-feed', daemon=True).start()
+        print(f"\n   Mode streaming: seguint {stream_feed} (actualitzacions a {STREAM_URL})")
+    print(f"\n3. Servidor del dashboard a http://{host}:{port}/ (Ctrl+C per aturar)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n   Servidor aturat")
     finally:
-        # Netejar imatges temporals
-        import shutil
-        if os.path.exists(img_dir):
-            shutil.rmtree(img_dir)
-            print("   Imatges temporals eliminades")
+        stop.set()
+        server.server_close()
+
+# ============================================================================
+# MODE STREAMING: FEED DE RESERVES EN DIRECTE
+# ============================================================================
+
+# --serve --stream FEED: el servidor segueix un fitxer append-only de reserves noves (JSONL, o
+# CSV amb capçalera; columnes del CSV net) i les suma al cub d'agregació de manera incremental:
+# cada lot construeix un cub petit amb les files noves i el suma cel·la a cel·la
+# (merge_booking_cubes), sense tornar a recórrer les reserves anteriors. Els gràfics que
+# canvien s'envien als dashboards oberts per Server-Sent Events (STREAM_URL), que els apliquen
+# amb Plotly.react.
+# - Latència acotada: el fitxer es llegeix cada STREAM_POLL_SECONDS i un lot es publica com a
+#   molt STREAM_MAX_LATENCY segons després de la primera fila pendent (o en arribar a
+#   STREAM_BATCH_ROWS files)
+# - Backpressure: la cua de cada client té com a molt un missatge per gràfic; l'estat nou
+#   substitueix el pendent, de manera que un client lent rep menys actualitzacions però no
+#   acumula memòria ni frena la resta
+# Per provar-ho en local: --stream-producer FEED afegeix reserves de les dades carregades.
+STREAM_URL = '/api/stream'
+STREAM_POLL_SECONDS = 0.25
+STREAM_MAX_LATENCY = 1.0
+STREAM_BATCH_ROWS = 5000
+STREAM_KEEPALIVE_SECONDS = 15
+STREAM_PRODUCER_RATE = 50
+
+def _stream_plot_script(stream_url):
+    """JS que rep els gràfics actualitzats (SSE) i els aplica al lloc amb Plotly.react"""
+    return f"""        // Actualitzacions en directe (Server-Sent Events): cada missatge és un gràfic sencer que
+        // Plotly.react aplica al lloc; uirevision conserva el zoom. Només per a la vista sense filtres
+        if (!window.location.search && window.EventSource) {{
+            new EventSource('{stream_url}').addEventListener('figure', function(event) {{
+                var update = JSON.parse(event.data);
+                update.figure.layout.uirevision = update.id;
+                Plotly.react(update.id, update.figure.data, update.figure.layout, {PLOT_CONFIG});
+            }});
+        }}
+"""
+
+def make_stream_hub():
+    """Estat compartit del mode streaming: clients connectats i últim estat publicat de cada gràfic"""
+    return {'lock': threading.Lock(), 'clients': [], 'version': 0, 'figures': {}}
+
+def stream_publish(hub, figures):
+    """
+    Publica {graph_id: JSON} a tots els clients (substitueix el missatge pendent del mateix gràfic)
+    Retorna quants missatges pendents s'han substituït (clients que no llegeixen prou ràpid)
+    """
+    if not figures:
+        return 0
+    with hub['lock']:
+        hub['version'] += 1
+        version = hub['version']
+        for graph_id, body in figures.items():
+            hub['figures'][graph_id] = (version, body)
+        clients = list(hub['clients'])
+    dropped = 0
+    for client in clients:
+        with client['ready']:
+            for graph_id, body in figures.items():
+                if graph_id in client['pending']:
+                    dropped += 1
+                client['pending'][graph_id] = (version, body)
+                client['pending'].move_to_end(graph_id)
+            client['ready'].notify()
+    return dropped
+
+def stream_subscribe(hub, last_event_id=None):
+    """
+    Registra un client; si es reconnecta (Last-Event-ID), rep els gràfics publicats després
+    de l'últim missatge que va rebre
+    """
+    client = {'ready': threading.Condition(), 'pending': OrderedDict()}
+    with hub['lock']:
+        if last_event_id is not None and last_event_id.isdigit():
+            for graph_id, (version, body) in hub['figures'].items():
+                if version > int(last_event_id):
+                    client['pending'][graph_id] = (version, body)
+        hub['clients'].append(client)
+    return client
+
+def stream_unsubscribe(hub, client):
+    with hub['lock']:
+        if client in hub['clients']:
+            hub['clients'].remove(client)
+
+def stream_next(client, timeout):
+    """Missatges pendents del client (espera fins a timeout segons; llista buida si no n'hi ha)"""
+    with client['ready']:
+        if not client['pending']:
+            client['ready'].wait(timeout)
+        messages = list(client['pending'].items())
+        client['pending'].clear()
+    return messages
+
+def read_feed_lines(path, offset):
+    """
+    Línies completes afegides al fitxer des d'offset (una línia a mig escriure es deixa per
+    a la lectura següent). Retorna (línies, offset d'inici, offset nou); si el fitxer s'ha
+    truncat o rotat, es torna a llegir des del principi
+    """
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return [], 0, 0
+    if size < offset:
+        offset = 0
+    if size == offset:
+        return [], offset, offset
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(size - offset)
+    end = data.rfind(b'\n') + 1
+    return data[:end].decode('utf-8').splitlines(), offset, offset + end
+
+def parse_feed_rows(lines, header=None):
+    """
+    Files del feed → DataFrame net (amb origin_group): JSONL si header és None, si no CSV
+    amb aquesta capçalera. Les línies que no es poden llegir es descarten amb un avís
+    """
+    lines = [line for line in lines if line.strip()]
+    if header is not None:
+        df = pd.read_csv(io.StringIO('\n'.join([header] + lines)), on_bad_lines='warn')
+    else:
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"   ⚠️  [streaming] línia JSON no vàlida descartada: {line[:80]}")
+        df = pd.DataFrame.from_records(records).replace({None: np.nan})
+    return add_origin_group(df) if len(df) else df
+
+def follow_booking_feed(path, on_batch, stop_event, poll_seconds=STREAM_POLL_SECONDS,
+                        max_latency=STREAM_MAX_LATENCY, batch_rows=STREAM_BATCH_ROWS):
+    """
+    Segueix un fitxer append-only de reserves (JSONL, o CSV si l'extensió és .csv) fins a
+    stop_event i crida on_batch(df) amb les files noves agrupades en lots
+    """
+    is_csv = path.lower().endswith('.csv')
+    offset = 0
+    header = None
+    pending = []
+    first_pending = None
+    while not stop_event.is_set():
+        lines, start, offset = read_feed_lines(path, offset)
+        if is_csv and start == 0 and lines:
+            header = lines.pop(0)
+        if lines:
+            pending += lines
+            first_pending = first_pending or time.monotonic()
+
+        if pending and (len(pending) >= batch_rows or time.monotonic() - first_pending >= max_latency):
+            batch, pending, first_pending = pending, [], None
+            try:
+                df_new = parse_feed_rows(batch, header if is_csv else None)
+                if len(df_new):
+                    on_batch(df_new)
+            except Exception as e:
+                print(f"   ⚠️  [streaming] lot de {len(batch)} línies descartat: {e}")
+        stop_event.wait(poll_seconds)
+
+def run_stream_producer(df, path, rate=STREAM_PRODUCER_RATE, limit=None, seed=0):
+    """
+    Productor local per provar el mode streaming: afegeix a path (JSONL, o CSV si l'extensió
+    és .csv) reserves preses a l'atzar de df, unes rate per segon, fins a limit o Ctrl+C
+    """
+    rng = np.random.default_rng(seed)
+    columns = [col for col in df.columns if col != 'origin_group']
+    is_csv = path.lower().endswith('.csv')
+    tick = 0.1
+    written = 0
+    carry = 0.0
+    print(f"\n   Productor de streaming: {rate} reserves/s a {path} (Ctrl+C per aturar)")
+    try:
+        while limit is None or written < limit:
+            carry += rate * tick
+            n_rows = int(carry) if limit is None else min(int(carry), limit - written)
+            carry -= int(carry)
+            if n_rows:
+                rows = df.iloc[rng.integers(0, len(df), n_rows)][columns]
+                write_header = is_csv and (not os.path.exists(path) or os.path.getsize(path) == 0)
+                text = (rows.to_csv(index=False, header=write_header) if is_csv
+                        else rows.to_json(orient='records', lines=True, force_ascii=False))
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write(text if text.endswith('\n') else text + '\n')
+                written += n_rows
+            time.sleep(tick)
+    except KeyboardInterrupt:
+        pass
+    print(f"   ✓ {written} reserves afegides a {path}")
+
+# ============================================================================
+# PIPELINE ASÍNCRON: GRÀFICS, HTML I PDF SOLAPATS
+# ============================================================================
+
+# En seqüència, l'exportació a PNG (kaleido, un procés de Chromium per gràfic) no comença
+# fins que hi ha tots els gràfics i l'HTML. El pipeline l'encadena per gràfic: cada figura
+# passa a la cua de rasterització tan bon punt es genera, mentre el fil de càlcul continua
+# amb la següent, el JSON i l'HTML. El PDF només espera les imatges. Cada etapa s'executa
+# en un executor d'un sol fil (càlcul i kaleido), orquestrats amb asyncio; al final s'informa
+# del temps total, la suma de les etapes i el camí crític.
+# La càrrega i l'agregació queden fora: tots els gràfics depenen de les taules.
+
+def _timed_call(timeline, name, lane, deps, func, *args):
+    """Executa func(*args) i en desa l'inici, el final i les dependències a timeline[name]"""
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        timeline[name] = {'lane': lane, 'start': start, 'end': time.perf_counter(), 'deps': deps}
+
+def critical_path(timeline):
+    """Cadena de tasques que determina el final: des de l'última, la dependència que acaba més tard"""
+    if not timeline:
+        return []
+    name = max(timeline, key=lambda n: timeline[n]['end'])
+    path = [name]
+    while True:
+        deps = [dep for dep in timeline[name]['deps'] if dep in timeline]
+        if not deps:
+            return path[::-1]
+        name = max(deps, key=lambda dep: timeline[dep]['end'])
+        path.append(name)
+
+def report_pipeline(timeline, elapsed):
+    """Temps per etapa, temps total vs. suma de les etapes i camí crític"""
+    lanes = {}
+    for task in timeline.values():
+        lanes[task['lane']] = lanes.get(task['lane'], 0.0) + task['end'] - task['start']
+    print(f"\n   Pipeline: {elapsed:.2f} s (etapes en sèrie: {sum(lanes.values()):.2f} s; "
+          + ', '.join(f"{lane} {seconds:.2f} s" for lane, seconds in lanes.items()) + ")")
+    path = critical_path(timeline)
+    busy = sum(timeline[name]['end'] - timeline[name]['start'] for name in path)
+    print(f"   Camí crític ({busy:.2f} s): {' → '.join(path)}")
+
+async def _timed_async(timeline, name, lane, deps, coro):
+    """Com _timed_call, per a una corrutina"""
+    start = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        timeline[name] = {'lane': lane, 'start': start, 'end': time.perf_counter(), 'deps': deps}
+
+async def _print_pipeline_pdf(figures_json, template_json, pdf_file, timeline):
+    """PDF amb Chromium dins del pipeline: s'imprimeix mentre el fil de càlcul escriu l'HTML"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        html_file = write_print_html(figures_json, os.path.join(tmp_dir, 'print.html'), template_json)
+        print(f"\nExportant a PDF amb Chromium: {pdf_file}...")
+        try:
+            await _timed_async(timeline, 'pdf', 'chromium', ['json'], print_html_to_pdf(html_file, pdf_file))
+        except Exception as e:
+            print(f"   ⚠️  No s'ha pogut exportar a PDF: {e}")
+            print("   Per instal·lar el Chromium de kaleido: kaleido_get_chrome")
+        else:
+            print(f"PDF generat: {pdf_file} ({os.path.getsize(pdf_file) / 1024:.0f} KB)")
+
+async def _run_pipeline(build_figure, html_file, pdf_file, img_dir, bundle_dir, bundle_poll, timeline):
+    loop = asyncio.get_running_loop()
+    print_pdf = pdf_file and RENDERER_OPTIONS['pdf_backend'] == 'chromium'
+    rasterize = pdf_file and not print_pdf
+    with ThreadPoolExecutor(1, thread_name_prefix='dashboard') as compute, \
+            ThreadPoolExecutor(1, thread_name_prefix='kaleido') as raster:
+        def submit(executor, name, lane, deps, func, *args):
+            return loop.run_in_executor(executor, _timed_call, timeline, name, lane, deps, func, *args)
+
+        if rasterize:
+            os.makedirs(img_dir, exist_ok=True)
+        figures = []
+        images = []
+        for i, graph_id in enumerate(FIGURE_IDS, 1):
+            print(f"   - {FIGURE_LABELS[graph_id]}")
+            deps = FIGURE_IDS[i - 2:i - 1]
+            figures.append(await submit(compute, graph_id, 'gràfics', deps, build_figure, graph_id))
+            if rasterize:
+                # La cua de kaleido és en sèrie: cada imatge depèn també de l'anterior
+                deps = [graph_id] + [f'png {previous}' for previous in FIGURE_IDS[i - 2:i - 1]]
+                images.append(submit(raster, f'png {graph_id}', 'kaleido', deps, rasterize_figure, figures[-1],
+                                     os.path.join(img_dir, f'graph_{i}.png')))
+
+        export_stats = None
+        if html_file or bundle_dir or print_pdf:
+            figures_json, template_json, export_stats = await submit(compute, 'json', 'html', [FIGURE_IDS[-1]],
+                                                                     export_figures_json, figures)
+        tasks = []
+        if bundle_dir:
+            tasks.append(submit(compute, 'html', 'html', ['json'], write_bundle, figures_json, bundle_dir,
+                                template_json, BUNDLE_ENCODINGS, None, bundle_poll))
+        elif html_file:
+            tasks.append(submit(compute, 'html', 'html', ['json'], generate_html_v3, figures_json, html_file,
+                                template_json))
+        if print_pdf:
+            tasks.append(_print_pipeline_pdf(figures_json, template_json, pdf_file, timeline))
+        await asyncio.gather(*tasks)
+
+        if rasterize:
+            results = await asyncio.gather(*images, return_exceptions=True)
+            errors = [result for result in results if isinstance(result, Exception)]
+            if errors:
+                print(f"   ⚠️  No s'ha pogut exportar a PDF: {errors[0]}")
+                print("   Assegura't d'instal·lar: pip install kaleido reportlab")
+                shutil.rmtree(img_dir, ignore_errors=True)
+            else:
+                deps = ['html', FIGURE_IDS[-1]] + [f'png {graph_id}' for graph_id in FIGURE_IDS]
+                await submit(compute, 'pdf', 'pdf', deps, export_to_pdf, figures, pdf_file, img_dir, results)
+    return export_stats
+
+def write_dashboard_pipeline(build_figure, html_file='index.html', pdf_file='pac3.pdf', img_dir='temp_images',
+                             bundle_dir=None, bundle_poll=BUNDLE_POLL_SECONDS):
+    """
+    Genera els gràfics (build_figure(graph_id)), l'HTML (o el paquet estàtic) i el PDF amb
+    el pipeline asíncron: mateixa sortida que build_dashboard_figures + write_dashboard
+    Retorna les estadístiques de export_figures_json (None si no s'ha exportat JSON)
+    """
+    outputs = ['HTML'] * bool(html_file or bundle_dir) + ['PDF'] * bool(pdf_file)
+    overlap = {'reportlab': ': kaleido en paral·lel', 'chromium': ": Chromium imprimeix mentre s'escriu l'HTML"}
+    print(f"\n3-5. Generant gràfics i {' i '.join(outputs)} "
+          f"(pipeline asíncron{overlap[RENDERER_OPTIONS['pdf_backend']] * bool(pdf_file)})...")
+    timeline = {}
+    start = time.perf_counter()
+    export_stats = asyncio.run(_run_pipeline(build_figure, html_file, pdf_file, img_dir, bundle_dir, bundle_poll,
+                                             timeline))
+    report_pipeline(timeline, time.perf_counter() - start)
+    return export_stats
+
+# ============================================================================
+# TEMPS D'ARRENCADA
+# ============================================================================
+
+# Importar l'script no ha de carregar cap dependència pesada (lazy_import): els contenidors
+# del cron arrenquen en fred a cada execució. --import-benchmark importa l'script en un
+# procés nou amb -X importtime, en resumeix el cost per paquet (sense els mòduls que ja
+# carrega l'intèrpret en arrencar) i falla si se supera el pressupost o si s'ha carregat
+# algun dels HEAVY_IMPORTS.
+IMPORT_BUDGET_MS = 150
+HEAVY_IMPORTS = ('pandas', 'numpy', 'plotly', 'reportlab', 'kaleido', 'brotli')
+
+def _import_times(code):
+    """Importacions de nivell superior d'un procés -X importtime: {paquet: ms acumulats}"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    times = {}
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if not line.startswith('import time:') or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2][1:]
+        if not name.startswith(' '):
+            times[name] = int(parts[1]) / 1000
+    return times
+
+def import_time_report(budget_ms=IMPORT_BUDGET_MS, top=8):
+    """Temps d'importació de l'script (paquets més cars); retorna False si no compleix el pressupost"""
+    code = ("import importlib.util\n"
+            f"spec = importlib.util.spec_from_file_location('dashboard', {os.path.abspath(__file__)!r})\n"
+            "spec.loader.exec_module(importlib.util.module_from_spec(spec))\n")
+    startup = _import_times('pass')
+    times = {name: ms for name, ms in _import_times(code).items() if name not in startup}
+    total = sum(times.values())
+    heavy = sorted({name.split('.')[0] for name in times} & set(HEAVY_IMPORTS))
+
+    print(f"Temps d'importació de l'script: {total:.1f} ms (pressupost: {budget_ms:g} ms)")
+    for name, ms in sorted(times.items(), key=lambda item: -item[1])[:top]:
+        print(f"   {ms:7.1f} ms  {name}")
+    if heavy:
+        print(f"   ❌ Dependències pesades carregades en importar: {', '.join(heavy)}")
+    if total > budget_ms:
+        print("   ❌ Pressupost superat")
+    return total <= budget_ms and not heavy
 
 # ============================================================================
 # MAIN
 # ============================================================================
 
-def main():
-    print("=" * 60)
-    print("DASHBOARD NARRATIU - PAC 3 (VERSIÓ 2: AVANÇADA)")
-    print("=" * 60)
-    
-    # Carregar dades netes (generades pel notebook R - Component 1)
+# Missatge de progrés de cada gràfic
+FIGURE_LABELS = {
+    'graph1': 'Acte 1: Barres apilades (mantingut)',
+    'graph2': 'Acte 2: Dumbbell Plot (mantingut)',
+    'graph3': 'Acte 3: Treemap (clímax)',
+    'graph4': 'Acte 4: Sankey diagram (NOVETAT)',
+    'graph5a': 'Acte 5A: Lead Time',
+    'graph5b': 'Acte 5B: Booking Changes',
+    'graph5c': 'Acte 5C: Deposit Type'
+}
+
+def apply_granularity(df_clean, tables, granularity='year', verbose=True):
+    """
+    Substitueix les TAULES 1 i 2 per la taula hotel × període de la granularitat indicada
+    (l'anual reutilitza les TAULES 1 i 2)
+    """
+    if granularity == 'year':
+        return tables
+    tbl_period = create_tbl_time_granularities(df_clean, (granularity,))[granularity]
+    if verbose:
+        print(f"   - Hotel × període ({granularity}): {len(tbl_period)} registres")
+    return (tbl_period, tbl_period) + tuple(tables[2:])
+
+def build_dashboard_figure(graph_id, df_clean, tables, granularity='year', flow_data=None, cube=None,
+                           row_index=None):
+    """
+    Genera un sol gràfic del dashboard a partir de les taules (ja amb la granularitat aplicada)
+    tables = (volum, cancel·lació hotel/any, país, país×hotel)
+    Amb cube, els actes 5B i 5C són marginals del cub i, sense df_clean o amb un cub ponderat, també el 5A
+    row_index: índex de files per grup de df_clean (build_row_index)
+    """
+    tbl_volume, tbl_cancel_hotel, tbl_cancel_country, _ = tables
+    if graph_id == 'graph1':
+        return create_graph1_volume_hotel_year(tbl_volume)
+    if graph_id == 'graph2':
+        return create_graph2_cancel_rate_hotel_year(tbl_cancel_hotel, FIGURE_OPTIONS['webgl_threshold'])
+    if graph_id == 'graph3':
+        tbl_nodes = create_tbl_treemap_nodes(tbl_cancel_country, FIGURE_OPTIONS['treemap_max_nodes'],
+                                             FIGURE_OPTIONS['treemap_hierarchy'])
+        # Inferència contra la mitjana global (en mode aproximat el tooltip ja porta l'interval de la mostra)
+        if 'ci_low_pct' not in tbl_nodes:
+            tbl_nodes = add_significance(tbl_nodes, *global_counts(tables[1]))
+        return create_graph3b_treemap_country(tbl_nodes)
+    if graph_id == 'graph4':
+        return create_graph4_sankey_flow(df_clean, flow_data)
+    if graph_id == 'graph5a':
+        max_points = FIGURE_OPTIONS['violin_max_points']
+        # Sense files o amb un cub ponderat (--approx): distribució reconstruïda del cub, on cada
+        # lead_time pesa el recompte estimat i no el nombre de files de la mostra
+        if df_clean is None or (cube is not None and 'w_var' in cube):
+            return create_graph5a_lead_time(cube_lead_time_frame(cube), max_points=max_points)
+        return create_graph5a_lead_time(df_clean, row_index, max_points)
+    if graph_id == 'graph5b':
+        changes_counts = None if cube is None else cube_count_table(cube, ['origin_group', 'changes_cat'])
+        return create_graph5b_booking_changes(df_clean, changes_counts)
+    if graph_id == 'graph5c':
+        deposit_counts = None if cube is None else cube_count_table(cube, ['origin_group', 'deposit_type'])
+        return create_graph5c_deposit_type(df_clean, deposit_counts)
+    raise KeyError(f"Gràfic desconegut: {graph_id}")
+
+def build_dashboard_figures(df_clean, tables, granularity='year', flow_data=None, verbose=True, cube=None,
+                            row_index=None):
+    """Genera els set gràfics del dashboard, en l'ordre de FIGURE_IDS"""
+    tables = apply_granularity(df_clean, tables, granularity, verbose)
+    figures = []
+    for graph_id in FIGURE_IDS:
+        if verbose:
+            print(f"   - {FIGURE_LABELS[graph_id]}")
+        figures.append(build_dashboard_figure(graph_id, df_clean, tables, granularity, flow_data, cube, row_index))
+    return figures
+
+def write_dashboard(figures, html_file='index.html', pdf_file='pac3.pdf', img_dir='temp_images', bundle_dir=None,
+                    bundle_poll=BUNDLE_POLL_SECONDS):
+    """
+    Escriu l'HTML (VERSIÓ 3) i, si és possible, el PDF del dashboard
+    Amb bundle_dir, l'HTML s'escriu com a paquet estàtic (write_bundle) en lloc d'un sol fitxer;
+    bundle_poll és l'interval (s) amb què la pàgina busca gràfics actualitzats
+    Sense html_file ni bundle_dir només s'escriu el PDF; sense pdf_file, només l'HTML
+    El PDF es genera amb el backend de RENDERER_OPTIONS['pdf_backend']
+    Retorna les estadístiques de export_figures_json (None si no s'ha exportat JSON)
+    """
+    print_pdf = pdf_file and RENDERER_OPTIONS['pdf_backend'] == 'chromium'
+    export_stats = None
+    if bundle_dir:
+        print("\n4. Generant paquet estàtic (actius amb hash, .gz/.br i manifest)...")
+    elif html_file:
+        print("\n4. Generant HTML...")
+
+    if html_file or bundle_dir or print_pdf:
+        # Convertir gràfics a JSON per HTML (la plantilla comuna s'emet una sola vegada)
+        figures_json, template_json, export_stats = export_figures_json(figures)
+
+    if html_file or bundle_dir:
+        # Generar HTML
+        if bundle_dir:
+            write_bundle(figures_json, bundle_dir, template_json, poll_seconds=bundle_poll)
+        else:
+            generate_html_v3(figures_json, html_file, template_json)
+
+    # Exportar a PDF (opcional)
+    if pdf_file:
+        print("\n5. Exportant a PDF (opcional)...")
+        try:
+            if print_pdf:
+                export_to_pdf_chromium(figures_json, pdf_file, template_json)
+            else:
+                export_to_pdf(figures, pdf_file, img_dir=img_dir)
+        except Exception as e:
+            print(f"   ⚠️  No s'ha pogut exportar a PDF: {e}")
+            print("   Assegura't d'instal·lar: pip install kaleido reportlab")
+    return export_stats
+
+def load_bookings(args):
+    """Carrega les dades netes segons les opcions (CSV del notebook R o neteja Python)"""
+    if args.raw:
+        print(f"\n1. Netejant dades originals en Python ({args.raw})...")
+        df_clean = load_raw_bookings(args.raw, chunksize=args.chunksize,
+                                     usecols=None if args.check_parity else RAW_COLUMNS)
+        print(f"   ✓ Dades netejades sense passar pel notebook R")
+        print(f"   Dades netes: {len(df_clean)} registres")
+        return df_clean
+
     print("\n1. Carregant dades netes...")
     try:
-        df_clean = pd.read_csv('hotel_bookings_clean.csv')
-        print(f"   ✓ Dades netes carregades des de hotel_bookings_clean.csv")
+        df_clean = pd.read_csv(args.clean)
+        print(f"   ✓ Dades netes carregades des de {args.clean}")
         print(f"   Dades netes: {len(df_clean)} registres")
     except FileNotFoundError:
-        print("   ❌ ERROR: hotel_bookings_clean.csv no trobat!")
+        print(f"   ❌ ERROR: {args.clean} no trobat!")
         print("   ⚠️  Has d'executar primer el notebook R (hotel_bookings.Rmd) per generar les dades netes.")
         print("   El notebook neteja les dades segons els criteris de l'EDA i les guarda a hotel_bookings_clean.csv")
-        raise FileNotFoundError("hotel_bookings_clean.csv no trobat. Executa primer el notebook R.")
-    
+        print("   Alternativa: --raw hotel_bookings.csv per netejar les dades directament en Python")
+        raise FileNotFoundError(f"{args.clean} no trobat. Executa primer el notebook R.")
+
     # Crear variable origin_group (no està al CSV net, s'afegeix aquí)
-    if 'origin_group' not in df_clean.columns:
-        df_clean['origin_group'] = df_clean['country'].apply(
-            lambda x: 'Local (PRT)' if x == 'PRT' else 'International'
-        )
+    return add_origin_group(df_clean)
+
+def run_clean_parity_check(df_py, clean_path):
+    """Compara la neteja Python amb la sortida del notebook R i falla si no coincideixen"""
+    print(f"\n2. Comparant amb la neteja del notebook R ({clean_path})...")
+    df_r = pd.read_csv(clean_path)
+    differences = check_clean_parity(df_py.drop(columns=['origin_group']), df_r)
+    if differences:
+        for diff in differences:
+            print(f"   ❌ {diff}")
+        raise SystemExit(1)
+    print(f"   ✓ Paritat correcta: {len(df_py)} registres idèntics")
+
+def parse_args(argv=None):
+    """Opcions de línia de comandes del script"""
+    parser = argparse.ArgumentParser(description='Dashboard narratiu PAC 3 - Visualització de Dades')
+    parser.add_argument('--granularity', choices=list(GRANULARITIES), default='year',
+                        help="Granularitat temporal dels actes 1 i 2 (per defecte: year)")
+    parser.add_argument('--clean', default='hotel_bookings_clean.csv',
+                        help="CSV net generat pel notebook R")
+    parser.add_argument('--raw', nargs='?', const='hotel_bookings.csv', default=None,
+                        help="Netejar el CSV original en Python en lloc de llegir la sortida del notebook R")
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help="Llegir i netejar el CSV original per blocs d'aquest nombre de files")
+    parser.add_argument('--store', default=None,
+                        help="Llegir les dades d'un magatzem columnar (np.memmap) en lloc del CSV")
+    parser.add_argument('--build-store', default=None,
+                        help="Escriure les dades netes carregades com a magatzem columnar en aquest directori")
+    parser.add_argument('--cube', default=None,
+                        help="Generar el dashboard des d'un cub d'agregació desat (.npz), sense llegir les reserves")
+    parser.add_argument('--build-cube', default=None,
+                        help="Desar el cub d'agregació de les dades carregades en aquest fitxer (.npz)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Nombre de processos per a l'agregació fragmentada (per defecte: sense fragmentar) "
+                             "o per als dashboards del mode batch (per defecte: un per processador; 1 = en sèrie)")
+    parser.add_argument('--batch', default=None,
+                        help="Fitxer JSON amb una llista de filtres; genera un dashboard per variant amb una sola càrrega")
+    parser.add_argument('--output-dir', default='.',
+                        help="Directori de sortida del mode batch (index_<variant>.html, pac3_<variant>.pdf)")
+    parser.add_argument('--bundle', default=None, metavar='DIR',
+                        help="Escriure el dashboard com a paquet estàtic en aquest directori: actius amb hash "
+                             "de contingut, germans .gz/.br i manifest.json (en lloc d'index.html)")
+    parser.add_argument('--bundle-poll', type=float, default=BUNDLE_POLL_SECONDS, metavar='SEGONS',
+                        help="Cada quants segons la pàgina del paquet consulta el manifest per actualitzar "
+                             f"els gràfics canviats amb Plotly.react (0 = mai; per defecte: {BUNDLE_POLL_SECONDS})")
+    parser.add_argument('--renderer', choices=['inprocess', 'daemon'], default='inprocess',
+                        help="Exportació d'imatges del PDF: en aquest procés (per defecte) o amb un dimoni kaleido "
+                             "persistent en segon pla")
+    parser.add_argument('--pdf-backend', choices=PDF_BACKENDS, default='reportlab',
+                        help="PDF a partir d'imatges PNG + reportlab (per defecte) o imprimint l'HTML amb el "
+                             "Chromium de kaleido (gràfics vectorials, una sola passada)")
+    parser.add_argument('--pdf-benchmark', action='store_true',
+                        help="Generar el PDF amb tots dos backends (pac3.<backend>.pdf) i comparar-ne el temps i la mida")
+    parser.add_argument('--renderer-socket', default=None,
+                        help="Socket Unix del dimoni de renderització, dins d'un directori privat (per defecte: "
+                             f"{RENDERER_SOCKET_NAME} al runtime dir de l'usuari)")
+    parser.add_argument('--renderer-daemon', action='store_true',
+                        help="Executar el dimoni de renderització en primer pla (l'script l'arrenca sol si cal)")
+    parser.add_argument('--renderer-status', action='store_true', help="Estat del dimoni de renderització")
+    parser.add_argument('--renderer-stop', action='store_true', help="Aturar el dimoni de renderització")
+    only = parser.add_mutually_exclusive_group()
+    only.add_argument('--html-only', action='store_true',
+                      help="Generar només l'HTML (sense kaleido ni reportlab)")
+    only.add_argument('--pdf-only', action='store_true', help="Generar només el PDF")
+    parser.add_argument('--import-benchmark', nargs='?', type=float, const=IMPORT_BUDGET_MS, default=None,
+                        metavar='MS', help="Mesurar el temps d'importació de l'script (-X importtime) i fallar si "
+                                           f"supera MS mil·lisegons (per defecte: {IMPORT_BUDGET_MS:g}) o si "
+                                           "carrega alguna dependència pesada")
+    parser.add_argument('--sequential', action='store_true',
+                        help="Generar gràfics, HTML i PDF un darrere l'altre, sense el pipeline asíncron")
+    parser.add_argument('--serve', action='store_true',
+                        help="Servir el dashboard en local amb els gràfics calculats sota demanda")
+    parser.add_argument('--stream', default=None, metavar='FEED',
+                        help="Amb --serve: seguir un fitxer append-only de reserves noves (JSONL o CSV) i enviar "
+                             "els gràfics actualitzats als dashboards oberts (Server-Sent Events)")
+    parser.add_argument('--stream-producer', default=None, metavar='FEED',
+                        help="Productor de prova: afegir a FEED reserves preses de les dades carregades i sortir")
+    parser.add_argument('--stream-rate', type=float, default=STREAM_PRODUCER_RATE,
+                        help=f"Reserves per segon del productor (per defecte: {STREAM_PRODUCER_RATE})")
+    parser.add_argument('--stream-limit', type=int, default=None,
+                        help="Nombre de reserves que afegeix el productor (per defecte: fins a Ctrl+C)")
+    parser.add_argument('--host', default='127.0.0.1', help="Adreça del servidor (per defecte: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8050, help="Port del servidor (per defecte: 8050)")
+    parser.add_argument('--min-bookings', type=int, default=1000,
+                        help="Mínim de reserves perquè un país aparegui a l'acte 3 (per defecte: 1000)")
+    parser.add_argument('--treemap', choices=['country', 'continent'], default='country',
+                        help="Treemap de l'acte 3 pla per país o jeràrquic continent → país (per defecte: country)")
+    parser.add_argument('--treemap-max-nodes', type=int, default=TREEMAP_MAX_NODES,
+                        help=f"Màxim de rectangles de país; la resta s'agrupa a '{TREEMAP_OTHER_LABEL}' "
+                             f"(per defecte: {TREEMAP_MAX_NODES})")
+    parser.add_argument('--webgl-threshold', type=int, default=WEBGL_POINT_THRESHOLD,
+                        help=f"Punts a partir dels quals les traces de dispersió usen WebGL (per defecte: {WEBGL_POINT_THRESHOLD})")
+    parser.add_argument('--violin-max-points', type=int, default=VIOLIN_MAX_POINTS,
+                        help="Màxim de punts per violin enviats al navegador (per defecte: 0, sense límit)")
+    parser.add_argument('--approx', type=float, default=None, metavar='FRACCIÓ',
+                        help="Previsualització aproximada: taules sobre una mostra estratificada (país × hotel) "
+                             "d'aquesta fracció, amb intervals de confiança als tooltips")
+    parser.add_argument('--memo-dir', nargs='?', const=MEMO_CACHE_DIR, default=None,
+                        help="Directori privat de la cache de disc de taules i gràfics (compartida entre "
+                             f"execucions; sense valor: {MEMO_CACHE_DIR})")
+    parser.add_argument('--memo-disk-mb', type=int, default=MEMO_DISK_MAX_BYTES // 1024 ** 2,
+                        help="Mida màxima de la cache de disc, en MB (per defecte: 1024)")
+    parser.add_argument('--memo-mb', type=int, default=MEMO_MAX_BYTES // 1024 ** 2,
+                        help="Mida màxima de la cache en memòria, en MB (per defecte: 256)")
+    parser.add_argument('--no-memo', action='store_true',
+                        help="Desactivar la memoització de taules i gràfics")
+    parser.add_argument('--check-parity', action='store_true',
+                        help="Comparar la neteja Python (--raw) amb la del notebook R (--clean) i sortir")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    renderer_socket = args.renderer_socket or default_renderer_socket()
+    if args.renderer_daemon:
+        run_renderer_daemon(renderer_socket)
+        return
+    if args.import_benchmark is not None:
+        if not import_time_report(args.import_benchmark):
+            raise SystemExit(1)
+        return
+    if args.pdf_only and (args.bundle or args.batch or args.serve):
+        raise SystemExit("--pdf-only no es pot combinar amb --bundle, --batch ni --serve")
+    if args.renderer_status or args.renderer_stop:
+        try:
+            print(json.dumps(renderer_status(renderer_socket)))
+            if args.renderer_stop:
+                _renderer_request({'op': 'shutdown'}, renderer_socket, timeout=5)
+                print("Renderitzador aturat")
+        except OSError:
+            print(f"No hi ha cap renderitzador a {renderer_socket}")
+        return
+    if args.check_parity and not args.raw:
+        raise SystemExit("--check-parity requereix --raw (neteja Python) per comparar-la amb el notebook R")
+    if args.cube and (args.granularity != 'year' or args.batch or args.check_parity or args.build_store
+                      or args.build_cube):
+        raise SystemExit("--cube només admet la granularitat anual i no es pot combinar amb --batch, --check-parity, "
+                         "--build-store ni --build-cube")
+    if args.approx is not None and (not 0 < args.approx < 1 or args.granularity != 'year'
+                                    or args.cube or args.batch or (args.workers or 1) > 1):
+        raise SystemExit("--approx necessita una fracció entre 0 i 1, granularitat anual i no es pot combinar "
+                         "amb --cube, --batch ni --workers")
+    if args.stream and (not args.serve or args.granularity != 'year' or args.approx is not None):
+        raise SystemExit("--stream requereix --serve i granularitat anual, i no es pot combinar amb --approx")
+    if args.stream_producer and args.cube:
+        raise SystemExit("--stream-producer necessita les reserves (no es pot combinar amb --cube)")
+
+    configure_memo(enabled=not args.no_memo, max_bytes=args.memo_mb * 1024 ** 2, cache_dir=args.memo_dir,
+                   disk_max_bytes=args.memo_disk_mb * 1024 ** 2)
+    configure_figures(treemap_hierarchy=args.treemap == 'continent', treemap_max_nodes=args.treemap_max_nodes,
+                      webgl_threshold=args.webgl_threshold, violin_max_points=args.violin_max_points)
+    configure_renderer(mode=args.renderer, socket=renderer_socket, pdf_backend=args.pdf_backend)
+
+    print("=" * 60)
+    print("DASHBOARD NARRATIU - PAC 3 (VERSIÓ 2: AVANÇADA)")
+    print("=" * 60)
+    
+    # Carregar dades netes (magatzem columnar, notebook R o neteja Python)
+    store = None
+    cube = None
+    tables = None
+    flow_data = None
+    specs = load_filter_specs(args.batch) if args.batch else []
+    if args.cube:
+        print(f"\n1. Carregant cub d'agregació ({args.cube})...")
+        cube = load_booking_cube(args.cube)
+        df_clean = None
+        print(f"   ✓ {len(cube['n_bookings'])} cel·les, {int(cube['n_bookings'].sum())} reserves (sense llegir les reserves)")
+    elif (args.workers or 1) > 1 and not args.batch:
+        source = args.raw or args.clean
+        print(f"\n1-2. Agregació fragmentada amb {args.workers} processos ({args.store or source})...")
+        sharded_tables, df_clean = create_tables_sharded(source, args.workers, raw=bool(args.raw),
+                                                         store_dir=args.store, min_bookings=args.min_bookings)
+        tables = sharded_tables[:4]
+        flow_data = sharded_tables[5]
+        print(f"   Dades netes: {len(df_clean)} registres")
+    elif args.store:
+        print(f"\n1. Obrint magatzem columnar ({args.store})...")
+        store = load_columnar_store(args.store)
+        columns = ROW_COLUMNS + [col for spec in specs for col in _spec_filters(spec) if col not in ROW_COLUMNS]
+        df_clean = store_to_frame(store, [col for col in dict.fromkeys(columns) if col in store['meta']])
+        print(f"   ✓ {store['n_rows']} registres projectats en memòria (memmap)")
+    else:
+        df_clean = load_bookings(args)
+    
+    if args.check_parity:
+        run_clean_parity_check(df_clean, args.clean)
+        return
+    
+    if args.stream_producer:
+        run_stream_producer(df_clean, args.stream_producer, rate=args.stream_rate, limit=args.stream_limit)
+        return
+    
+    if args.build_store:
+        build_columnar_store(df_clean, args.build_store)
+        print(f"   ✓ Magatzem columnar escrit a {args.build_store}")
+    
+    if args.build_cube:
+        cube = build_booking_cube(df_clean)
+        save_booking_cube(cube, args.build_cube)
+        print(f"   ✓ Cub d'agregació escrit a {args.build_cube} ({len(cube['n_bookings'])} cel·les)")
+    
+    if specs:
+        run_batch(df_clean, specs, n_workers=args.workers, granularity=args.granularity,
+                  output_dir=args.output_dir, pdf=not args.html_only, min_bookings=args.min_bookings,
+                  store_dir=args.store)
+        return
     
     # Crear taules intermèdies
     print("\n2. Creant taules intermèdies...")
-    tbl_volume = create_tbl_volume_hotel_year(df_clean)
-    tbl_cancel_hotel = create_tbl_cancel_rate_hotel_year(df_clean)
-    tbl_cancel_country = create_tbl_cancel_rate_country(df_clean, min_bookings=1000)
-    tbl_country_hotel = create_tbl_country_hotel_cancel(df_clean, min_bookings=1000)
-    
+    if tables is not None:
+        print("   (calculades pel mode fragmentat)")
+    elif args.approx is not None:
+        # Previsualització: taules i gràfics estimats sobre una mostra (el 5A, amb els pesos del cub)
+        positions, weights = stratified_sample(df_clean, args.approx)
+        df_clean = df_clean.iloc[positions].reset_index(drop=True)
+        all_tables, cube = create_tables_approx(df_clean, weights, min_bookings=args.min_bookings)
+        tables = all_tables[:4]
+        flow_data = all_tables[5]
+        print(f"   ⚠️  MODE APROXIMAT: mostra de {len(df_clean)} reserves ({args.approx:.0%} per estrat país × hotel)")
+        print("   Les taxes porten interval de confiança del 95%; per publicar, executa sense --approx")
+    elif store is not None:
+        # Kernels directament sobre les pàgines projectades
+        tables = create_tables_from_store(store, min_bookings=args.min_bookings)
+    else:
+        # Totes les taules són marginals del cub (calculat ara o llegit amb --cube)
+        if cube is None:
+            cube = build_booking_cube(df_clean)
+        all_tables = create_tables_from_cube(cube, min_bookings=args.min_bookings)
+        tables = all_tables[:4]
+        flow_data = all_tables[5]
+
+    tbl_volume, tbl_cancel_hotel, tbl_cancel_country, tbl_country_hotel = tables
     print(f"   - Volum per hotel/any: {len(tbl_volume)} registres")
     print(f"   - Cancel·lació per hotel/any: {len(tbl_cancel_hotel)} registres")
     print(f"   - Cancel·lació per país: {len(tbl_cancel_country)} països")
     print(f"   - Cancel·lació país×hotel: {len(tbl_country_hotel)} registres")
-    
-    # Crear gràfics
-    print("\n3. Generant gràfics...")
-    print("   - Acte 1: Barres apilades (mantingut)")
-    fig1 = create_graph1_volume_hotel_year(tbl_volume)
-    
-    print("   - Acte 2: Dumbbell Plot (mantingut)")
-    fig2 = create_graph2_cancel_rate_hotel_year(tbl_cancel_hotel)
-    
-    print("   - Acte 3: Treemap (clímax)")
-    fig3 = create_graph3b_treemap_country(tbl_cancel_country)
-    
-    print("   - Acte 4: Sankey diagram (NOVETAT)")
-    fig4 = create_graph4_sankey_flow(df_clean)
-    
-    print("   - Acte 5: Lead Time, Booking Changes, Deposit Type (3 gràfics independents)")
-    fig5a = create_graph5a_lead_time(df_clean)
-    fig5b = create_graph5b_booking_changes(df_clean)
-    fig5c = create_graph5c_deposit_type(df_clean)
-    
-    # Convertir gràfics a JSON per HTML
-    figures_json = [
-        fig1.to_json(),
-        fig2.to_json(),
-        fig3.to_json(),
-        fig4.to_json(),
-        fig5a.to_json(),
-        fig5b.to_json(),
-        fig5c.to_json()
-    ]
-    
-    # Generar HTML
-    print("\n4. Generant HTML...")
-    generate_html_v3(figures_json, 'index.html')
-    
-    # Exportar a PDF (opcional)
-    print("\n5. Exportant a PDF (opcional)...")
-    try:
-        export_to_pdf([fig1, fig2, fig3, fig4, fig5a, fig5b, fig5c], 'pac3.pdf')
-    except Exception as e:
-        print(f"   ⚠️  No s'ha pogut exportar a PDF: {e}")
-        print("   Assegura't d'instal·lar: pip install kaleido reportlab")
-    
+
+    # Índex de files per grup (origen, hotel, país) per als gràfics que treballen amb files
+    row_index = build_row_index(df_clean) if df_clean is not None else None
+
+    if args.serve:
+        serve_dashboard(df_clean, tables, args.granularity, flow_data, host=args.host, port=args.port, cube=cube,
+                        row_index=row_index, min_bookings=args.min_bookings, stream_feed=args.stream)
+        return
+
+    html_file = None if args.pdf_only else 'index.html'
+    pdf_file = None if args.html_only else 'pac3.pdf'
+    if args.pdf_benchmark:
+        print("\n3. Generant gràfics...")
+        figures = build_dashboard_figures(df_clean, tables, args.granularity, flow_data, cube=cube,
+                                          row_index=row_index)
+        figures_json, template_json, _ = export_figures_json(figures)
+        benchmark_pdf_backends(figures, figures_json, template_json)
+        return
+    if args.sequential:
+        # Crear gràfics
+        print("\n3. Generant gràfics...")
+        figures = build_dashboard_figures(df_clean, tables, args.granularity, flow_data, cube=cube,
+                                          row_index=row_index)
+
+        # Generar HTML i PDF
+        export_stats = write_dashboard(figures, html_file, pdf_file, bundle_dir=args.bundle,
+                                       bundle_poll=args.bundle_poll)
+    else:
+        # Gràfics, HTML i PDF solapats (la rasterització de cada gràfic comença quan està llest)
+        build_figure = functools.partial(build_dashboard_figure, df_clean=df_clean,
+                                         tables=apply_granularity(df_clean, tables, args.granularity),
+                                         granularity=args.granularity, flow_data=flow_data, cube=cube,
+                                         row_index=row_index)
+        export_stats = write_dashboard_pipeline(build_figure, html_file, pdf_file, bundle_dir=args.bundle,
+                                                bundle_poll=args.bundle_poll)
+
+    if export_stats:
+        print("\nExportació dels gràfics:")
+        report_export(export_stats)
+
+    stats = memo_stats()
+    print(f"\nCache de taules i gràfics: {stats['hits']} encerts, {stats['misses']} càlculs")
+
     print("\nFitxers generats:")
-    print("  - index.html")
-    print("  - pac3.pdf")
-    print("\nObre 'index.html' al navegador per visualitzar el dashboard.")
+    if args.bundle:
+        print(f"  - {os.path.join(args.bundle, BUNDLE_ENTRY)} (+ actius i {BUNDLE_MANIFEST})")
+    elif html_file:
+        print(f"  - {html_file}")
+    if pdf_file:
+        print(f"  - {pdf_file}")
+    if args.bundle:
+        print(f"\nServeix '{args.bundle}' amb un servidor web (els gràfics es carreguen amb fetch).")
+    elif html_file:
+        print(f"\nObre '{html_file}' al navegador per visualitzar el dashboard.")
 
 if __name__ == '__main__':
     main()
-